@@ -1,12 +1,14 @@
+import functools
 import os
+import time
 from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from .metrics import PASSWORD_HASH_LATENCY
 
 # Load environment variables from a .env file if present
+# （既に設定されている環境変数は上書きしません）
 load_dotenv()
 
 # .envファイルから設定を読み込みます
@@ -24,17 +26,33 @@ except ValueError as exc:
         "ACCESS_TOKEN_EXPIRE_MINUTES must be an integer"
     ) from exc
 
-# パスワードのハッシュ化に関する設定
-# bcryptという強力なアルゴリズムを使用します
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@functools.lru_cache(maxsize=None)
+def _pwd_context():
+    """パスワードのハッシュ化に関する設定（bcrypt）
+
+    passlib/bcrypt の読み込みは起動時間に響くため、初回利用時まで遅らせます。
+    """
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """入力されたパスワードが、ハッシュ化されたパスワードと一致するか検証します"""
-    return pwd_context.verify(plain_password, hashed_password)
+    start = time.perf_counter()
+    try:
+        return _pwd_context().verify(plain_password, hashed_password)
+    finally:
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - start, operation="verify")
 
 def get_password_hash(password: str) -> str:
     """パスワードをハッシュ化して返します"""
-    return pwd_context.hash(password)
+    start = time.perf_counter()
+    try:
+        return _pwd_context().hash(password)
+    finally:
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - start, operation="hash")
 
 def create_access_token(data: dict) -> str:
     """
@@ -49,5 +67,19 @@ def create_access_token(data: dict) -> str:
     )
     to_encode.update({"exp": expire})
     
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def decode_access_token(token: str) -> str | None:
+    """トークンを検証して社員ID（sub）を返します。無効な場合は None を返します"""
+    # python-jose/cryptography の読み込みは初回のトークン検証まで遅らせます
+    from jose import JWTError, jwt
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
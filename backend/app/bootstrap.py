@@ -0,0 +1,135 @@
+"""One-time database setup: schema creation and initial data.
+
+Nothing here runs at import time. The app's lifespan runs both steps on
+startup unless ``APP_SKIP_STARTUP_SEED=1``; ``python -m app.server`` runs them
+once in the master process before the workers start (and sets that variable
+for the workers), and ``python -m app.cli init-db`` / ``seed`` run them by hand.
+"""
+import logging
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import auth, crud, models, schemas
+from .database import Base
+
+logger = logging.getLogger(__name__)
+
+# 設定されている場合、各ワーカーの起動時のテーブル作成・初期データ登録を省略します
+SKIP_STARTUP_SEED_ENV = "APP_SKIP_STARTUP_SEED"
+
+
+def startup_seed_skipped() -> bool:
+    return os.getenv(SKIP_STARTUP_SEED_ENV, "0") == "1"
+
+
+def init_db(engine: Engine) -> None:
+    """Create missing tables."""
+    Base.metadata.create_all(bind=engine)
+
+
+def create_missing_indexes(engine: Engine) -> list[str]:
+    """Create indexes added to existing tables after they were created.
+
+    ``create_all`` skips tables that already exist, so upgraded databases
+    lack their newer indexes (e.g. the counter indexes on ``users``). Returns
+    the names of the indexes created.
+    """
+    existing = inspect(engine)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        if not existing.has_table(table.name):
+            continue
+        names = {index["name"] for index in existing.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in names:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
+def seed(db: Session) -> None:
+    """初期データ（部署・テストユーザー）を登録します"""
+    # --- Departments ---
+    departments = [
+        {"id": 0, "name": "テスト部署"},
+        {"id": 2, "name": "2A病棟"},
+        {"id": 3, "name": "3B病棟"},
+        {"id": 4, "name": "情報システム"},
+    ]
+
+    for dept in departments:
+        existing = (
+            db.query(models.Department)
+            .filter(models.Department.id == dept["id"])
+            .first()
+        )
+        # 部署名は API からの登録と同じく半角カナで保存します
+        name = schemas.DepartmentCreate(name=dept["name"]).name
+        if existing:
+            existing.name = name
+        else:
+            db.add(models.Department(id=dept["id"], name=name))
+    db.commit()
+    # 正規化前に登録された部署名を揃えます（2回目以降は変更なし）
+    crud.normalize_department_names(db)
+
+    # --- Users ---
+    users = [
+        {
+            "employee_id": "000000",
+            "name": "ﾃｽﾄﾕｰｻﾞｰ",
+            "display_name": "テストユーザー",
+            "password": "pass",
+            "department_id": 0,
+        },
+        {
+            "employee_id": "000001",
+            "name": "ﾃｽﾄｲﾁ",
+            "display_name": "テストイチ",
+            "password": "000001",
+            "department_id": 2,
+        },
+        {
+            "employee_id": "000002",
+            "name": "ﾃｽﾄﾆ",
+            "display_name": "テストニ",
+            "password": "000002",
+            "department_id": 3,
+        },
+        {
+            "employee_id": "000003",
+            "name": "ﾃｽﾄｻﾝ",
+            "display_name": "テストサン",
+            "password": "000003",
+            "department_id": 4,
+        },
+        {
+            "employee_id": "999999",
+            "name": "ﾃｽﾄｶﾝﾘｼｬ",
+            "display_name": "テスト管理者",
+            "password": "admin",
+            "department_id": 0,
+            "is_admin": True,
+        },
+    ]
+
+    for user_data in users:
+        user = crud.get_user_by_employee_id(db, employee_id=user_data["employee_id"])
+        if user:
+            user.department_id = user_data["department_id"]
+            normalized = schemas.UserUpdate(
+                name=user_data["name"], display_name=user_data["display_name"]
+            )
+            user.name = normalized.name
+            user.display_name = normalized.display_name or user_data["display_name"]
+            user.hashed_password = auth.get_password_hash(user_data["password"])
+            user.is_admin = user_data.get("is_admin", False)
+            db.commit()
+        else:
+            user_in = schemas.UserCreate(**user_data)
+            crud.create_user(db=db, user=user_in)
+            if user_data["employee_id"] == "000000":
+                logger.info("初期テストユーザー(ID:000000)を作成しました。")
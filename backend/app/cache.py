@@ -0,0 +1,626 @@
+"""Shared cache for hot read paths.
+
+Read paths that can tolerate a short delay (timeline pages, user search)
+cache their results through one interface instead of keeping ad-hoc dicts::
+
+    body = cache.get_or_set("user_search", query, build, ttl=60)
+    ...
+    cache.invalidate("user_search")      # after committing a change
+
+Entries live in a namespace and have an optional TTL in seconds. Each
+backend keeps at most ``CACHE_MAX_ENTRIES`` entries (least recently used
+entries are evicted first) and counts hits, misses, sets, evictions,
+invalidations and stale responses per namespace (``stats()``, ``/admin/diagnostics/cache`` and
+the ``cache_*`` series at ``/metrics``).
+
+The backend is chosen with ``CACHE_URL``:
+
+* ``memory://`` (default) - a per-process LRU dict. ``invalidate()`` is
+  published on ``app.cachebus`` so other workers drop the namespace at their
+  next poll.
+* ``sqlite:///path/to/cache.db`` - a local file shared by all worker
+  processes on the host (WAL mode), no extra service needed.
+* ``redis://host:6379/0`` - requires the ``redis`` package. Size limits are
+  left to the server's ``maxmemory-policy`` (e.g. ``allkeys-lru``).
+
+Shared backends (file, Redis) are cleared directly by ``invalidate()``,
+which also increments the namespace's version kept in the store itself.
+Values are pickled there, so cache plain data. The memory backend returns
+the cached object itself, which callers must not modify.
+
+Concurrent misses of the same key in one process are computed once
+(``app.singleflight``); a value computed across an invalidation, including
+one done by another worker, is returned to its callers but not stored. ``lookup()`` can also serve an expired entry
+for a while (stale-while-revalidate / stale-if-error, e.g. while an import
+keeps SQLite locked) and reports its age for the ``Age``/``Warning``
+headers. ``invalidate()`` always removes entries, so changes are never
+hidden behind a stale copy.
+
+Backend errors (a locked file, an unreachable Redis) are logged and treated
+as misses, so a broken cache slows requests down but does not fail them.
+"""
+import abc
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from . import cachebus, metrics, singleflight
+
+logger = logging.getLogger(__name__)
+
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+# 古い値を返す前に、再計算（DB クエリ）を待つ秒数
+REFRESH_TIMEOUT = float(os.getenv("CACHE_REFRESH_TIMEOUT", "2"))
+REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "2"))
+
+# HTTP の Warning ヘッダー（RFC 7234）
+STALE_WARNING = '110 - "Response is Stale"'
+REVALIDATION_FAILED_WARNING = '111 - "Revalidation Failed"'
+
+# 見つからなかったことを表す値（None もキャッシュできるようにするため）
+MISSING = object()
+
+STAT_FIELDS = ("hits", "misses", "sets", "evictions", "invalidations", "stale")
+
+
+class CacheBackend(abc.ABC):
+    """Namespaced key/value store with TTL and per-namespace statistics.
+
+    Subclasses implement ``_get``/``_set``/``_delete``/``_clear``/``__len__``
+    and the namespace version (``_version``/``_bump``), and report LRU
+    evictions with ``_evicted()``.
+    """
+
+    name = ""
+    # 全ワーカーで共有されるストアか（False ならプロセスごと）
+    shared = False
+    # 呼び出し元でミスとして扱う例外
+    errors: tuple[type[BaseException], ...] = ()
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(STAT_FIELDS, 0)
+        )
+
+    def _count(self, namespace: str, field: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[namespace][field] += amount
+
+    def _evicted(self, namespace: str, amount: int = 1) -> None:
+        self._count(namespace, "evictions", amount)
+        metrics.CACHE_EVICTIONS.inc(amount, namespace=namespace)
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Cached value, or ``MISSING``."""
+        value = self._get(namespace, key)
+        if value is MISSING:
+            self._count(namespace, "misses")
+            metrics.CACHE_REQUESTS.inc(namespace=namespace, result="miss")
+        else:
+            self._count(namespace, "hits")
+            metrics.CACHE_REQUESTS.inc(namespace=namespace, result="hit")
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float | None = None) -> None:
+        """Store ``value``; it expires after ``ttl`` seconds (never if ``None``)."""
+        self._set(namespace, key, value, ttl)
+        self._count(namespace, "sets")
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._delete(namespace, key)
+
+    def clear(self, namespace: str | None = None) -> None:
+        """Drop every entry of ``namespace`` (or of all namespaces)."""
+        if namespace is not None:
+            # 先に版を進め、計算中の値が消去後に書き戻されないようにします（set_if_current）
+            self._bump(namespace)
+        self._clear(namespace)
+        if namespace is not None:
+            self._count(namespace, "invalidations")
+
+    def version(self, namespace: str) -> int:
+        """How many times ``namespace`` has been cleared."""
+        return self._version(namespace)
+
+    def set_if_current(
+        self, namespace: str, key: str, value: Any, ttl: float | None, version: int
+    ) -> bool:
+        """``set()`` unless ``namespace`` was cleared since ``version`` was read."""
+        if self._version(namespace) != version:
+            return False
+        self.set(namespace, key, value, ttl)
+        if self._version(namespace) != version:
+            # 書き込みと同時に無効化された場合は、古いかもしれない値を残しません
+            self._delete(namespace, key)
+            return False
+        return True
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        with self._stats_lock:
+            return {namespace: dict(values) for namespace, values in self._stats.items()}
+
+    @abc.abstractmethod
+    def _get(self, namespace: str, key: str) -> Any:
+        """Stored value, or ``MISSING`` (also for expired entries)."""
+
+    @abc.abstractmethod
+    def _set(self, namespace: str, key: str, value: Any, ttl: float | None) -> None:
+        """Store ``value``, evicting least recently used entries when full."""
+
+    @abc.abstractmethod
+    def _delete(self, namespace: str, key: str) -> None:
+        """Remove one entry if it exists."""
+
+    @abc.abstractmethod
+    def _clear(self, namespace: str | None) -> None:
+        """Remove the entries of ``namespace`` (all entries if ``None``)."""
+
+    @abc.abstractmethod
+    def _version(self, namespace: str) -> int:
+        """Current version of ``namespace`` (0 if it was never cleared)."""
+
+    @abc.abstractmethod
+    def _bump(self, namespace: str) -> None:
+        """Increment the version of ``namespace``."""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """Number of stored entries."""
+
+
+class MemoryCache(CacheBackend):
+    """LRU dict in this process."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], tuple[Any, float | None]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+
+    def _get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[(namespace, key)]
+                return MISSING
+            self._entries.move_to_end((namespace, key))
+            return value
+
+    def _set(self, namespace, key, value, ttl):
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        evicted = []
+        with self._lock:
+            self._entries[(namespace, key)] = (value, expires_at)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                (evicted_namespace, _), _ = self._entries.popitem(last=False)
+                evicted.append(evicted_namespace)
+        for evicted_namespace in evicted:
+            self._evicted(evicted_namespace)
+
+    def _delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def _clear(self, namespace):
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for entry_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[entry_key]
+
+    def _version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def _bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at);
+CREATE TABLE IF NOT EXISTS cache_namespaces (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteCache(CacheBackend):
+    """LRU store in a local SQLite file, shared by the worker processes of a host.
+
+    Each thread uses its own connection. Reads refresh ``accessed_at`` at
+    most once per ``touch_interval`` seconds so that hits rarely write.
+    """
+
+    name = "sqlite"
+    shared = True
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES, touch_interval: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # fork 後の子プロセスでは親の接続を使わず、新しく接続します
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SQLITE_SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _get(self, namespace, key):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries"
+            " WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None:
+            return MISSING
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                (namespace, key, now),
+            )
+            return MISSING
+        if now - accessed_at >= self.touch_interval:
+            conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        return pickle.loads(value)
+
+    def _set(self, namespace, key, value, ttl):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?)",
+            (
+                namespace,
+                key,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                None if ttl is None else now + ttl,
+                now,
+            ),
+        )
+        self._trim(conn, now)
+
+    def _trim(self, conn: sqlite3.Connection, now: float) -> None:
+        count = "SELECT count(*) FROM cache_entries"
+        if conn.execute(count).fetchone()[0] <= self.max_entries:
+            return
+        # 期限切れを先に削除し、それでも超える分を最終アクセスの古い順に追い出します
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        excess = conn.execute(count).fetchone()[0] - self.max_entries
+        if excess <= 0:
+            return
+        victims = conn.execute(
+            "SELECT namespace, key FROM cache_entries ORDER BY accessed_at LIMIT ?", (excess,)
+        ).fetchall()
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        for namespace, _ in victims:
+            self._evicted(namespace)
+
+    def _delete(self, namespace, key):
+        self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    def _clear(self, namespace):
+        if namespace is None:
+            self._conn().execute("DELETE FROM cache_entries")
+        else:
+            self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+
+    def _version(self, namespace):
+        row = self._conn().execute(
+            "SELECT version FROM cache_namespaces WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def _bump(self, namespace):
+        self._conn().execute(
+            "INSERT INTO cache_namespaces VALUES (?, 1)"
+            " ON CONFLICT (namespace) DO UPDATE SET version = version + 1",
+            (namespace,),
+        )
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM cache_entries").fetchone()[0]
+
+
+class RedisCache(CacheBackend):
+    """Store in Redis (any client with ``get``/``set``/``delete``/``incr``/``scan_iter``).
+
+    Namespace versions live under ``<prefix>version:<namespace>`` outside the
+    entry key space, so ``invalidate()`` and ``__len__`` do not touch them.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, client, prefix: str = "musatoku:cache:", errors: tuple | None = None):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        if errors is None:
+            try:
+                import redis
+            except ImportError:
+                errors = (ConnectionError, TimeoutError)
+            else:
+                errors = (redis.RedisError,)
+        self.errors = errors
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCache":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(f"CACHE_URL={url} requires the 'redis' package") from None
+        return cls(redis.Redis.from_url(url))
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{self.prefix.rstrip(':')}-version:{namespace}"
+
+    def _get(self, namespace, key):
+        raw = self.client.get(self._key(namespace, key))
+        return MISSING if raw is None else pickle.loads(raw)
+
+    def _set(self, namespace, key, value, ttl):
+        self.client.set(
+            self._key(namespace, key),
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            px=None if ttl is None else max(1, int(ttl * 1000)),
+        )
+
+    def _delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def _clear(self, namespace):
+        pattern = self.prefix + ("*" if namespace is None else f"{namespace}:*")
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+    def _version(self, namespace):
+        return int(self.client.get(self._version_key(namespace)) or 0)
+
+    def _bump(self, namespace):
+        self.client.incr(self._version_key(namespace))
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def from_url(url: str) -> CacheBackend:
+    scheme, _, rest = url.partition("://")
+    if scheme == "memory":
+        return MemoryCache()
+    if scheme == "sqlite":
+        # SQLAlchemy と同じく sqlite:///relative.db, sqlite:////absolute/path.db
+        return SQLiteCache(rest[1:] if rest.startswith("/") else rest)
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisCache.from_url(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+_backend: CacheBackend | None = None
+_backend_lock = threading.Lock()
+_subscribed: set[str] = set()
+_executor: ThreadPoolExecutor | None = None
+
+
+def backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = from_url(CACHE_URL)
+    return _backend
+
+
+def configure(new_backend: CacheBackend | None) -> CacheBackend | None:
+    """Replace the backend (``None``: build it from ``CACHE_URL`` again); returns the old one."""
+    global _backend
+    with _backend_lock:
+        old, _backend = _backend, new_backend
+    return old
+
+
+def _drop_local(namespace: str) -> None:
+    current = backend()
+    if not current.shared:
+        current.clear(namespace)
+
+
+def _bus_namespace(namespace: str) -> str:
+    return f"cache:{namespace}"
+
+
+class Lookup:
+    """Result of ``lookup()``: the value, its age in seconds and an HTTP ``Warning``."""
+
+    __slots__ = ("value", "age", "warning")
+
+    def __init__(self, value: Any, age: float = 0.0, warning: str | None = None):
+        self.value = value
+        self.age = age
+        self.warning = warning
+
+    @property
+    def stale(self) -> bool:
+        return self.warning is not None
+
+
+def refresh_executor() -> ThreadPoolExecutor:
+    """Threads that run background refreshes (``CACHE_REFRESH_WORKERS``)."""
+    global _executor
+    if _executor is None:
+        with _backend_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+    return _executor
+
+
+def lookup(
+    namespace: str,
+    key: str,
+    compute: Callable[[], Any],
+    *,
+    ttl: float | None = None,
+    stale_while_revalidate: float = 0.0,
+    stale_if_error: float = 0.0,
+    timeout: float | None = None,
+) -> Lookup:
+    """Cached value of ``key`` with ``Cache-Control``-like staleness rules.
+
+    An entry is fresh for ``ttl`` seconds. For ``stale_while_revalidate``
+    more seconds it is returned at once (warning 110) while one background
+    refresh runs. Up to ``stale_if_error`` seconds after expiry, the caller
+    waits for the refresh at most ``timeout`` seconds and gets the stale
+    entry (warning 111) if it fails or takes longer. ``compute`` must not use
+    the caller's session, since it may run on a ``refresh_executor()`` thread.
+    Without a usable entry the caller computes the value itself.
+    """
+    current = backend()
+    if not current.shared:
+        if namespace not in _subscribed:
+            _subscribed.add(namespace)
+            cachebus.subscribe(_bus_namespace(namespace), functools.partial(_drop_local, namespace))
+        cachebus.poll()
+    try:
+        entry = current.get(namespace, key)
+    except current.errors:
+        logger.warning("Cache read failed (%s/%s)", namespace, key, exc_info=True)
+        entry = MISSING
+    if entry is not MISSING:
+        value, stored_at = entry
+        age = max(0.0, time.time() - stored_at)
+        if ttl is None or age <= ttl:
+            return Lookup(value, age)
+    # 計算を始める前に版を読みます（共有ストアでは他のワーカーの無効化も反映されます）
+    generation = _version(current, namespace)
+    # 古い値を返せる期間を含めて保存します
+    keep = None if ttl is None else ttl + max(stale_while_revalidate, stale_if_error)
+    flights = singleflight.group(f"cache:{namespace}")
+    flight_key = (key, generation)
+
+    def fill():
+        return _fill(current, namespace, key, compute, keep, generation)
+
+    if entry is not MISSING:
+        if age <= ttl + stale_while_revalidate:
+            flights.submit(flight_key, fill, refresh_executor())
+            current._count(namespace, "stale")
+            return Lookup(value, age, STALE_WARNING)
+        if age <= ttl + stale_if_error:
+            future = flights.submit(flight_key, fill, refresh_executor())
+            try:
+                return Lookup(future.result(timeout=timeout))
+            except Exception:
+                # 待ち時間切れ・DB エラー（ロック中など）の間は、最後に成功した値を返します
+                logger.warning("Serving stale %s/%s", namespace, key, exc_info=True)
+                current._count(namespace, "stale")
+                return Lookup(value, age, REVALIDATION_FAILED_WARNING)
+    # 同じキー・同じ世代の同時ミスは1回だけ計算し、結果を共有します
+    return Lookup(flights.do(flight_key, fill))
+
+
+def get_or_set(
+    namespace: str, key: str, compute: Callable[[], Any], ttl: float | None = None
+) -> Any:
+    """Cached value of ``key``, computing and storing it on a miss."""
+    return lookup(namespace, key, compute, ttl=ttl).value
+
+
+def _version(current: CacheBackend, namespace: str) -> int | None:
+    try:
+        return current.version(namespace)
+    except current.errors:
+        logger.warning("Cache version read failed (%s)", namespace, exc_info=True)
+        return None
+
+
+def _fill(
+    current: CacheBackend,
+    namespace: str,
+    key: str,
+    compute: Callable[[], Any],
+    ttl: float | None,
+    generation: int | None,
+) -> Any:
+    value = compute()
+    # 計算中に無効化された場合（版が読めなかった場合も）は、古いかもしれない値を保存しません
+    if generation is not None:
+        try:
+            current.set_if_current(namespace, key, (value, time.time()), ttl, generation)
+        except current.errors:
+            logger.warning("Cache write failed (%s/%s)", namespace, key, exc_info=True)
+    return value
+
+
+def invalidate(namespace: str) -> None:
+    """Drop ``namespace`` in the shared store, or in every worker's memory cache."""
+    current = backend()
+    if current.shared:
+        try:
+            current.clear(namespace)
+        except current.errors:
+            logger.warning("Cache invalidation failed (%s)", namespace, exc_info=True)
+    else:
+        cachebus.publish(_bus_namespace(namespace))
+
+
+def stats() -> dict:
+    current = backend()
+    try:
+        entries = len(current)
+    except current.errors:
+        entries = None
+    return {
+        "backend": current.name,
+        "entries": entries,
+        "namespaces": current.stats(),
+        "flights": singleflight.stats(),
+    }
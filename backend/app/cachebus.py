@@ -0,0 +1,187 @@
+"""Cross-worker cache invalidation through the database.
+
+Every worker process keeps its own in-process caches (see ``app.registry``).
+To invalidate them everywhere without a message broker, writers bump a
+per-namespace counter in the ``cache_versions`` table::
+
+    cachebus.publish("departments")      # after committing the change
+
+and every worker polls the table, at most once per ``CACHE_BUS_POLL_MS``
+(default 500 ms), from the code paths that read its caches::
+
+    cachebus.poll()
+
+When the version of a namespace differs from the one last seen, the
+callbacks registered with ``subscribe(namespace, callback)`` run and drop
+the local cache. The poll is a single primary-key scan of a tiny table, run
+on its own pooled connection and not charged to the request's query budget.
+It waits at most ``CACHE_BUS_POLL_TIMEOUT_MS`` (default 100 ms) for a locked
+database and otherwise tries again one interval later.
+
+The publishing process also runs its callbacks immediately, so its own
+readers never see stale data. Other workers may serve stale entries for up
+to one poll interval. If the counter cannot be bumped (e.g. SQLite is
+locked by an import), the namespace is kept and published again at the
+next ``poll()`` or ``publish()`` of this process, so the other workers still
+see it, only later. On its first poll after startup, a worker treats every
+namespace as changed.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from . import database, models, querybudget
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_MS = int(os.getenv("CACHE_BUS_POLL_MS", "500"))
+# poll がロック解除を待つ上限（超えたら次の poll で再確認します）
+POLL_TIMEOUT_MS = int(os.getenv("CACHE_BUS_POLL_TIMEOUT_MS", "100"))
+
+_table = models.CacheVersion.__table__
+_lock = threading.Lock()
+_poll_lock = threading.Lock()
+_subscribers: dict[str, list[Callable[[], None]]] = defaultdict(list)
+_known: dict[str, int] | None = None
+# 発行に失敗し、再送を待っている名前空間
+_pending: set[str] = set()
+_next_poll = 0.0
+
+
+def subscribe(namespace: str, callback: Callable[[], None]) -> None:
+    """Run ``callback`` whenever ``namespace`` is invalidated (locally or elsewhere)."""
+    with _lock:
+        if callback not in _subscribers[namespace]:
+            _subscribers[namespace].append(callback)
+
+
+def _notify(namespace: str) -> None:
+    for callback in list(_subscribers.get(namespace, ())):
+        try:
+            callback()
+        except Exception:
+            logger.exception("Cache invalidation callback for %s failed", namespace)
+
+
+def _bump(conn, namespace: str) -> int:
+    result = conn.execute(
+        update(_table)
+        .where(_table.c.namespace == namespace)
+        .values(version=_table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(_table).values(namespace=namespace, version=1))
+    return conn.execute(
+        select(_table.c.version).where(_table.c.namespace == namespace)
+    ).scalar_one()
+
+
+def _send(namespace: str, timeout: float | None = None) -> None:
+    """Bump the version of ``namespace``; raises if the database is unavailable.
+
+    ``timeout`` limits the wait for a locked database (default: the driver's).
+    """
+
+    def bump() -> int:
+        with database.engine.begin() as conn:
+            if timeout is None:
+                return _bump(conn, namespace)
+            with database.lock_timeout(conn, timeout):
+                return _bump(conn, namespace)
+
+    with querybudget.unmetered():
+        try:
+            version = bump()
+        except IntegrityError:
+            # 別プロセスが同時に行を作成した場合は UPDATE でやり直します
+            version = bump()
+    with _lock:
+        _pending.discard(namespace)
+        if _known is not None:
+            # 自分の更新で再度コールバックが走らないよう、既知のバージョンを進めます
+            _known[namespace] = max(version, _known.get(namespace, 0))
+
+
+def _send_pending(timeout: float | None = None) -> None:
+    with _lock:
+        pending = sorted(_pending)
+    for namespace in pending:
+        try:
+            _send(namespace, timeout)
+        except (OperationalError, ProgrammingError):
+            logger.debug("Cache invalidation for %s is still pending", namespace, exc_info=True)
+            return
+        logger.info("Published pending cache invalidation for %s", namespace)
+
+
+def publish(namespace: str) -> None:
+    """Invalidate ``namespace`` in this process now and in the others at their next poll."""
+    _notify(namespace)
+    try:
+        _send(namespace)
+    except (OperationalError, ProgrammingError):
+        # DB がロック中・テーブル作成前などは覚えておき、次の poll / publish で再送します
+        with _lock:
+            _pending.add(namespace)
+        logger.warning(
+            "Could not publish cache invalidation for %s, will retry", namespace, exc_info=True
+        )
+        return
+    _send_pending()
+
+
+def poll(force: bool = False) -> list[str]:
+    """Check ``cache_versions`` (rate limited) and return the invalidated namespaces."""
+    global _known, _next_poll
+    now = time.monotonic()
+    if not force and now < _next_poll:
+        return []
+    # 他のスレッドが確認中であれば待たずに戻ります
+    if not _poll_lock.acquire(blocking=force):
+        return []
+    try:
+        _next_poll = now + POLL_INTERVAL_MS / 1000
+        timeout = POLL_TIMEOUT_MS / 1000
+        if _pending:
+            _send_pending(timeout)
+        try:
+            with querybudget.unmetered(), database.engine.connect() as conn:
+                with database.lock_timeout(conn, timeout):
+                    versions = dict(
+                        conn.execute(select(_table.c.namespace, _table.c.version)).all()
+                    )
+        except (OperationalError, ProgrammingError):
+            # ロック中・テーブル作成前は、次の確認まで待ちます
+            logger.debug("cache_versions is not available", exc_info=True)
+            _next_poll = time.monotonic() + POLL_INTERVAL_MS / 1000
+            return []
+        with _lock:
+            if _known is None:
+                # 起動後の初回は、購読中の名前空間をすべて無効化します
+                changed = sorted(set(_subscribers) | set(versions))
+            else:
+                changed = sorted(
+                    ns for ns, version in versions.items() if _known.get(ns) != version
+                )
+            _known = versions
+        for namespace in changed:
+            _notify(namespace)
+        if changed:
+            logger.debug("Cache namespaces invalidated: %s", ", ".join(changed))
+        return changed
+    finally:
+        _poll_lock.release()
+
+
+def reset() -> None:
+    """Forget the versions seen so far (the next poll invalidates everything)."""
+    global _known, _next_poll
+    with _lock:
+        _known = None
+        _next_poll = 0.0
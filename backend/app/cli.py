@@ -0,0 +1,101 @@
+"""Maintenance commands.
+
+Run from the ``backend`` directory, e.g. ``python -m app.cli reconcile-counters``.
+``init-db`` / ``seed`` perform the schema creation and initial data steps
+explicitly, so that app processes can start with ``APP_SKIP_STARTUP_SEED=1``.
+"""
+import argparse
+import logging
+
+from . import bootstrap, crud
+from .database import SessionLocal, engine
+
+
+def _init_db(args: argparse.Namespace) -> int:
+    bootstrap.init_db(engine)
+    print("Created missing tables")
+    return 0
+
+
+def _seed(args: argparse.Namespace) -> int:
+    bootstrap.init_db(engine)
+    db = SessionLocal()
+    try:
+        bootstrap.seed(db)
+    finally:
+        db.close()
+    print("Seeded initial departments and users")
+    return 0
+
+
+def _normalize_departments(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        renamed = crud.normalize_department_names(db)
+    finally:
+        db.close()
+    print(f"Normalized department names: {renamed} renamed")
+    return 0
+
+
+def _backfill_activity(args: argparse.Namespace) -> int:
+    bootstrap.init_db(engine)
+    indexes = bootstrap.create_missing_indexes(engine)
+    print(f"Created missing indexes: {', '.join(indexes) or 'none'}")
+    db = SessionLocal()
+    try:
+        rows = crud.backfill_activity(db)
+    finally:
+        db.close()
+    print(f"Backfilled activity rollups: {rows} rows")
+    return 0
+
+
+def _reconcile_counters(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        fixed = crud.reconcile_counters(db)
+    finally:
+        db.close()
+    print(f"Reconciled counters: {fixed} users corrected")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init_db = commands.add_parser("init-db", help="create missing tables")
+    init_db.set_defaults(func=_init_db)
+
+    seed = commands.add_parser(
+        "seed", help="create missing tables and register the initial departments/users"
+    )
+    seed.set_defaults(func=_seed)
+
+    normalize = commands.add_parser(
+        "normalize-departments",
+        help="rewrite stored department names to half-width kana (one-time migration)",
+    )
+    normalize.set_defaults(func=_normalize_departments)
+
+    backfill = commands.add_parser(
+        "backfill-activity",
+        help="create missing indexes and fill daily activity rollups for days before "
+        "they were recorded (one-time migration)",
+    )
+    backfill.set_defaults(func=_backfill_activity)
+
+    reconcile = commands.add_parser(
+        "reconcile-counters",
+        help="recompute appreciated/expressed/likes counters from posts, mentions and likes",
+    )
+    reconcile.set_defaults(func=_reconcile_counters)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,224 @@
 import logging
-from sqlalchemy import or_
+import os
+from typing import Iterable
+from sqlalchemy import (
+    Date,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    literal,
+    or_,
+    select,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session, joinedload
-from datetime import timezone
-from . import models, schemas, auth
-from .utils import normalize_to_utc
+from datetime import datetime, timedelta, timezone
+from . import cache, models, readmodels, registry, schemas, auth
+from .utils import to_halfwidth_kana
 
 logger = logging.getLogger(__name__)
 
+# ユーザー検索結果のキャッシュ（app.cache）。氏名・所属・在籍が変わったら無効化します
+USER_SEARCH_NAMESPACE = "user_search"
+USER_SEARCH_CACHE_TTL = float(os.getenv("USER_SEARCH_CACHE_TTL", "60"))
+
+
+def _dialect_insert(db: Session):
+    """Return the dialect-specific ``insert`` supporting ``ON CONFLICT``."""
+    name = db.get_bind().dialect.name
+    if name == "sqlite":
+        return sqlite.insert
+    if name == "postgresql":
+        return postgresql.insert
+    return None
+
+
+# --- Counters ---
+
+
+def adjust_counters(db: Session, field: str, deltas: dict[int, int]):
+    """Atomically add per-user deltas to a ``User`` counter and today's rollup.
+
+    Issued as ``UPDATE users SET <field> = <field> + :delta`` in one
+    executemany statement per counter type, so concurrent requests never lose
+    increments and the user rows never have to be loaded. Counters are
+    clamped at zero.
+    """
+    deltas = {uid: delta for uid, delta in deltas.items() if uid is not None and delta}
+    if not deltas:
+        return
+    table = models.User.__table__
+    new_value = table.c[field] + bindparam("delta")
+    db.execute(
+        update(table)
+        .where(table.c.id == bindparam("uid"))
+        .values({field: case((new_value < 0, 0), else_=new_value)}),
+        [{"uid": uid, "delta": delta} for uid, delta in deltas.items()],
+    )
+    for delta in set(deltas.values()):
+        record_activity(
+            db, field, [uid for uid, d in deltas.items() if d == delta], delta=delta
+        )
+
+
+def reconcile_counters(db: Session) -> int:
+    """Recompute every user's counters from the source tables in one pass.
+
+    Returns the number of users whose counters were corrected.
+    """
+    users = models.User.__table__
+    appreciated = (
+        select(func.count())
+        .select_from(models.post_mentions)
+        .where(models.post_mentions.c.user_id == users.c.id)
+        .scalar_subquery()
+    )
+    expressed = (
+        select(func.count())
+        .select_from(models.Post)
+        .where(models.Post.author_id == users.c.id)
+        .scalar_subquery()
+    )
+    likes = (
+        select(func.count())
+        .select_from(models.post_likes)
+        .join(models.Post, models.Post.id == models.post_likes.c.post_id)
+        .where(models.Post.author_id == users.c.id)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(users)
+        .where(
+            or_(
+                users.c.appreciated_count != appreciated,
+                users.c.expressed_count != expressed,
+                users.c.likes_received != likes,
+            )
+        )
+        .values(
+            appreciated_count=appreciated,
+            expressed_count=expressed,
+            likes_received=likes,
+        )
+    )
+    db.commit()
+    logger.info("Reconciled counters of %s users", result.rowcount)
+    return result.rowcount
+
+
+# --- Activity rollups ---
+
+
+def record_activity(db: Session, field: str, user_ids: Iterable[int], delta: int = 1):
+    """Add ``delta`` to today's rollup row of each user for the given counter."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    table = models.UserActivityDaily.__table__
+    day = datetime.now(timezone.utc).date()
+    insert = _dialect_insert(db)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.day],
+            set_={field: table.c[field] + stmt.excluded[field]},
+        )
+        db.execute(
+            stmt,
+            [
+                {
+                    "user_id": uid,
+                    "day": day,
+                    "appreciated_count": 0,
+                    "expressed_count": 0,
+                    "likes_received": 0,
+                    field: delta,
+                }
+                for uid in user_ids
+            ],
+        )
+        return
+    # ON CONFLICT 非対応のDB向け: UPDATEして存在しなかった行だけINSERTします
+    for uid in user_ids:
+        result = db.execute(
+            update(table)
+            .where(table.c.user_id == uid, table.c.day == day)
+            .values({field: table.c[field] + delta})
+        )
+        if result.rowcount == 0:
+            db.execute(table.insert().values(user_id=uid, day=day, **{field: delta}))
+
+
+def _utc_day(db: Session, column):
+    """SQL expression for the (UTC) date of a ``UTCDateTime`` column."""
+    if db.get_bind().dialect.name == "sqlite":
+        # SQLite は日時を文字列で保存するため、CAST ではなく date() を使います
+        return func.date(column)
+    return cast(column, Date)
+
+
+def backfill_activity(db: Session) -> int:
+    """Fill the rollups for days before the first recorded one (one-time migration).
+
+    Installs upgraded from before the rollups only have rows from the day the
+    new code started running; this rebuilds the older days from posts,
+    mentions and likes so windowed rankings cover them too. Likes have no
+    timestamp and are counted on the day of the liked post. The rows are
+    aggregated in the database with one ``INSERT ... SELECT ... GROUP BY``.
+    Days that already have rows are left alone, so running it again changes
+    nothing. Returns the number of rows inserted.
+    """
+    table = models.UserActivityDaily.__table__
+    first_day = db.scalar(select(func.min(table.c.day)))
+    posts = models.Post.__table__
+    pm = models.post_mentions
+    likes = models.post_likes
+    conditions = [posts.c.created_at.is_not(None)]
+    if first_day is not None:
+        start = datetime.combine(first_day, datetime.min.time(), tzinfo=timezone.utc)
+        conditions.append(posts.c.created_at < start)
+    day = _utc_day(db, posts.c.created_at)
+
+    def source(user_id, appreciated: int, expressed: int, liked: int, from_):
+        return (
+            select(
+                user_id.label("user_id"),
+                day.label("day"),
+                literal(appreciated).label("appreciated_count"),
+                literal(expressed).label("expressed_count"),
+                literal(liked).label("likes_received"),
+            )
+            .select_from(from_)
+            .where(*conditions)
+        )
+
+    activity = union_all(
+        source(posts.c.author_id, 0, 1, 0, posts),
+        source(pm.c.user_id, 1, 0, 0, pm.join(posts, posts.c.id == pm.c.post_id)),
+        source(posts.c.author_id, 0, 0, 1, likes.join(posts, posts.c.id == likes.c.post_id)),
+    ).subquery()
+    fields = ["appreciated_count", "expressed_count", "likes_received"]
+    result = db.execute(
+        table.insert().from_select(
+            ["user_id", "day", *fields],
+            select(
+                activity.c.user_id,
+                activity.c.day,
+                *(func.sum(activity.c[field]) for field in fields),
+            )
+            .where(activity.c.user_id.is_not(None))
+            .group_by(activity.c.user_id, activity.c.day),
+        )
+    )
+    db.commit()
+    logger.info("Backfilled %s activity rollup rows before %s", result.rowcount, first_day)
+    return result.rowcount
+
+
 # --- User CRUD ---
 
 
@@ -14,7 +226,6 @@ def get_user_by_employee_id(db: Session, employee_id: str):
     """社員IDを元にユーザーを一件取得します。"""
     return (
         db.query(models.User)
-        .options(joinedload(models.User.department))
         .filter(models.User.employee_id == employee_id, models.User.is_active == True)
         .first()
     )
@@ -35,6 +246,7 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    cache.invalidate(USER_SEARCH_NAMESPACE)
     return db_user
 
 
@@ -42,7 +254,6 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     """Retrieve multiple users."""
     return (
         db.query(models.User)
-        .options(joinedload(models.User.department))
         .offset(skip)
         .limit(limit)
         .all()
@@ -53,7 +264,6 @@ def search_users(db: Session, query: str, limit: int = 10):
     """Search users by name with partial match."""
     return (
         db.query(models.User)
-        .options(joinedload(models.User.department))
         .filter(
             models.User.name.like(f"%{query}%"),
             models.User.is_active == True,
@@ -63,19 +273,55 @@ def search_users(db: Session, query: str, limit: int = 10):
     )
 
 
-def get_top_users(db: Session, field: str, limit: int = 10):
+def get_top_users(
+    db: Session, field: str, limit: int = 10, department_id: int | None = None
+):
     """Return top users ordered by given counter field."""
     column = getattr(models.User, field, None)
     if column is None:
         raise ValueError("Invalid field")
-    return (
+    query = (
         db.query(models.User)
-        .options(joinedload(models.User.department))
         .filter(models.User.is_active == True)
-        .order_by(column.desc())
-        .limit(limit)
-        .all()
     )
+    if department_id is not None:
+        query = query.filter(models.User.department_id == department_id)
+    return query.order_by(column.desc()).limit(limit).all()
+
+
+def get_top_users_in_window(
+    db: Session,
+    field: str,
+    days: int,
+    limit: int = 10,
+    department_id: int | None = None,
+):
+    """Return ``(user, total)`` pairs ranked by the counter over the last ``days`` days.
+
+    Only the rollup rows inside the window are read (via the ``day`` index),
+    so the cost does not grow with the size of the users table.
+    """
+    column = getattr(models.UserActivityDaily, field, None)
+    if column is None:
+        raise ValueError("Invalid field")
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    totals = (
+        select(
+            models.UserActivityDaily.user_id,
+            func.sum(column).label("total"),
+        )
+        .where(models.UserActivityDaily.day >= since)
+        .group_by(models.UserActivityDaily.user_id)
+        .subquery()
+    )
+    query = (
+        db.query(models.User, totals.c.total)
+        .join(totals, models.User.id == totals.c.user_id)
+        .filter(models.User.is_active == True, totals.c.total > 0)
+    )
+    if department_id is not None:
+        query = query.filter(models.User.department_id == department_id)
+    return query.order_by(totals.c.total.desc()).limit(limit).all()
 
 
 def deactivate_user(db: Session, user_id: int) -> bool:
@@ -85,13 +331,15 @@ def deactivate_user(db: Session, user_id: int) -> bool:
         return False
     user.is_active = False
     db.commit()
+    # メンション表示名が「[削除済み]」に変わります
+    registry.user_mentions.invalidate()
+    cache.invalidate(USER_SEARCH_NAMESPACE)
     return True
 
 
 def get_user(db: Session, user_id: int):
     return (
         db.query(models.User)
-        .options(joinedload(models.User.department))
         .filter(models.User.id == user_id)
         .first()
     )
@@ -105,6 +353,7 @@ def create_department(db: Session, department: schemas.DepartmentCreate):
     db.add(db_dept)
     db.commit()
     db.refresh(db_dept)
+    registry.departments.invalidate()
     return db_dept
 
 
@@ -122,9 +371,45 @@ def update_department(db: Session, dept_id: int, department: schemas.DepartmentC
     db_dept.name = department.name
     db.commit()
     db.refresh(db_dept)
+    registry.departments.invalidate()
+    # 検索結果の所属名も変わります
+    cache.invalidate(USER_SEARCH_NAMESPACE)
     return db_dept
 
 
+def normalize_department_names(db: Session) -> int:
+    """Rewrite stored department names to the normalized (half-width kana) form.
+
+    Names written before normalization was enforced everywhere may still be
+    full-width. A name whose normalized form is already taken by another
+    department is left unchanged and logged. Returns the number renamed.
+    """
+    departments = db.query(models.Department).order_by(models.Department.id).all()
+    taken = {d.name for d in departments}
+    renamed = 0
+    for dept in departments:
+        normalized = to_halfwidth_kana(dept.name)
+        if normalized == dept.name:
+            continue
+        if normalized in taken:
+            logger.warning(
+                "Department %s '%s' not normalized: '%s' already exists",
+                dept.id,
+                dept.name,
+                normalized,
+            )
+            continue
+        taken.discard(dept.name)
+        taken.add(normalized)
+        dept.name = normalized
+        renamed += 1
+    if renamed:
+        db.commit()
+        registry.departments.invalidate()
+        cache.invalidate(USER_SEARCH_NAMESPACE)
+    return renamed
+
+
 def delete_department(db: Session, dept_id: int) -> bool:
     db_dept = (
         db.query(models.Department).filter(models.Department.id == dept_id).first()
@@ -143,8 +428,10 @@ def delete_department(db: Session, dept_id: int) -> bool:
     )
     if has_users or has_posts:
         raise ValueError("Department is referenced by users or posts")
-    db.delete(db_dept)
+    # 所属ユーザーがいないことは確認済みのため、users の読み込みを伴う ORM の delete は使いません
+    db.execute(delete(models.Department).where(models.Department.id == dept_id))
     db.commit()
+    registry.departments.invalidate()
     return True
 
 
@@ -169,8 +456,6 @@ def get_posts(db: Session, skip: int = 0, limit: int = 100):
         .limit(limit)
         .all()
     )
-    for post in posts:
-        post.created_at = normalize_to_utc(post.created_at)
     return posts
 
 
@@ -203,17 +488,14 @@ def create_post(db: Session, post: schemas.PostCreate, user_id: int):
             db.query(models.User).filter(models.User.id.in_(mentioned_ids)).all()
         )
         db_post.mentions.extend(mentioned_users)
-        for u in mentioned_users:
-            u.appreciated_count += 1
+        adjust_counters(db, "appreciated_count", {u.id: 1 for u in mentioned_users})
 
-    author = db.query(models.User).filter(models.User.id == user_id).first()
-    if author:
-        author.expressed_count += 1
+    adjust_counters(db, "expressed_count", {user_id: 1})
 
     db.add(db_post)
     db.commit()
     db.refresh(db_post)
-    db_post.created_at = normalize_to_utc(db_post.created_at)
+    readmodels.invalidate_timeline()
     return db_post
 
 
@@ -251,8 +533,6 @@ def get_posts_mentioned(
     posts = (
         query.order_by(models.Post.created_at.desc()).offset(skip).limit(limit).all()
     )
-    for post in posts:
-        post.created_at = normalize_to_utc(post.created_at)
     return posts
 
 
@@ -260,7 +540,7 @@ def get_all_posts(db: Session):
     posts = (
         db.query(models.Post)
         .options(
-            joinedload(models.Post.author).joinedload(models.User.department),
+            joinedload(models.Post.author),
             joinedload(models.Post.mentions),
             joinedload(models.Post.mention_departments),
             joinedload(models.Post.likers),
@@ -270,8 +550,6 @@ def get_all_posts(db: Session):
         .order_by(models.Post.created_at.desc())
         .all()
     )
-    for post in posts:
-        post.created_at = normalize_to_utc(post.created_at)
     return posts
 
 
@@ -279,7 +557,7 @@ def get_reported_posts(db: Session):
     posts = (
         db.query(models.Post)
         .options(
-            joinedload(models.Post.author).joinedload(models.User.department),
+            joinedload(models.Post.author),
             joinedload(models.Post.mentions),
             joinedload(models.Post.mention_departments),
             joinedload(models.Post.likers),
@@ -290,8 +568,6 @@ def get_reported_posts(db: Session):
         .order_by(models.Post.created_at.desc())
         .all()
     )
-    for post in posts:
-        post.created_at = normalize_to_utc(post.created_at)
     return posts
 
 
@@ -299,7 +575,7 @@ def get_deleted_posts(db: Session):
     posts = (
         db.query(models.Post)
         .options(
-            joinedload(models.Post.author).joinedload(models.User.department),
+            joinedload(models.Post.author),
             joinedload(models.Post.mentions),
             joinedload(models.Post.mention_departments),
             joinedload(models.Post.likers),
@@ -309,8 +585,6 @@ def get_deleted_posts(db: Session):
         .order_by(models.Post.created_at.desc())
         .all()
     )
-    for post in posts:
-        post.created_at = normalize_to_utc(post.created_at)
     return posts
 
 
@@ -320,37 +594,179 @@ def delete_post(db: Session, post_id: int) -> bool:
         return False
     db.delete(post)
     db.commit()
+    readmodels.invalidate_timeline()
     return True
 
 
+def get_engagement(
+    db: Session, post_ids: list[int], user_id: int | None = None
+) -> list[tuple[int, int, bool]]:
+    """Return ``(post_id, like_count, liked_by_me)`` for visible posts among ``post_ids``.
+
+    One aggregate query counts likes and one membership query finds the
+    caller's likes; deleted or unknown posts are omitted.
+    """
+    if not post_ids:
+        return []
+    likes = models.post_likes
+    counts = db.execute(
+        select(models.Post.id, func.count(likes.c.user_id))
+        .outerjoin(likes, likes.c.post_id == models.Post.id)
+        .where(models.Post.id.in_(post_ids), models.Post.is_deleted == False)
+        .group_by(models.Post.id)
+        .order_by(models.Post.id)
+    ).all()
+    mine: set[int] = set()
+    if user_id is not None and counts:
+        mine = set(
+            db.scalars(
+                select(likes.c.post_id).where(
+                    likes.c.user_id == user_id,
+                    likes.c.post_id.in_([post_id for post_id, _ in counts]),
+                )
+            )
+        )
+    return [(post_id, count, post_id in mine) for post_id, count in counts]
+
+
+def _insert_like(db: Session, post_id: int, user_id: int) -> bool:
+    """Insert a ``post_likes`` row; return whether it was newly inserted."""
+    table = models.post_likes
+    insert = _dialect_insert(db)
+    if insert is not None:
+        result = db.execute(
+            insert(table)
+            .values(post_id=post_id, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=[table.c.post_id, table.c.user_id])
+        )
+        return result.rowcount > 0
+    exists = db.execute(
+        select(table.c.post_id).where(
+            table.c.post_id == post_id, table.c.user_id == user_id
+        )
+    ).first()
+    if exists:
+        return False
+    db.execute(table.insert().values(post_id=post_id, user_id=user_id))
+    return True
+
+
+def _delete_like(db: Session, post_id: int, user_id: int) -> bool:
+    """Delete a ``post_likes`` row; return whether it existed."""
+    result = db.execute(
+        delete(models.post_likes).where(
+            models.post_likes.c.post_id == post_id,
+            models.post_likes.c.user_id == user_id,
+        )
+    )
+    return result.rowcount > 0
+
+
 def like_post(db: Session, post_id: int, user_id: int) -> bool:
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not post or not user:
+    """Like a post as ``user_id`` (the authenticated caller); idempotent.
+
+    The like row is written with ``INSERT ... ON CONFLICT DO NOTHING`` and the
+    author's counter only changes when a row was actually inserted, so the
+    cost does not depend on how many likes the post already has.
+    """
+    post = db.execute(
+        select(models.Post.author_id).where(models.Post.id == post_id)
+    ).first()
+    if post is None:
         return False
-    if user in post.likers:
-        return True
-    post.likers.append(user)
-    if post.author:
-        post.author.likes_received += 1
+    if _insert_like(db, post_id, user_id):
+        adjust_counters(db, "likes_received", {post.author_id: 1})
     db.commit()
     return True
 
 
 def unlike_post(db: Session, post_id: int, user_id: int) -> bool:
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not post or not user:
+    """Remove a like by ``user_id``; idempotent."""
+    post = db.execute(
+        select(models.Post.author_id).where(models.Post.id == post_id)
+    ).first()
+    if post is None:
         return False
-    if user not in post.likers:
-        return True
-    post.likers.remove(user)
-    if post.author and post.author.likes_received > 0:
-        post.author.likes_received -= 1
+    if _delete_like(db, post_id, user_id):
+        adjust_counters(db, "likes_received", {post.author_id: -1})
     db.commit()
     return True
 
 
+def apply_like_operations(
+    db: Session, user_id: int, operations: list[tuple[int, bool]]
+) -> list[str]:
+    """Apply a sequence of ``(post_id, like)`` operations in one transaction.
+
+    Only the last operation per post takes effect (earlier ones are
+    ``superseded``); the rest are ``applied``, ``unchanged`` or ``not_found``.
+    Likes are inserted and removed with set-based statements and each
+    author's ``likes_received`` is adjusted once for the net change.
+    """
+    post_ids = {post_id for post_id, _ in operations}
+    authors = dict(
+        db.execute(
+            select(models.Post.id, models.Post.author_id).where(
+                models.Post.id.in_(post_ids)
+            )
+        ).all()
+    )
+    last_index = {post_id: i for i, (post_id, _) in enumerate(operations)}
+    wanted = {post_id: operations[i][1] for post_id, i in last_index.items()}
+    table = models.post_likes
+
+    to_like = sorted(p for p in authors if wanted[p])
+    to_unlike = sorted(p for p in authors if not wanted[p])
+    liked: set[int] = set()
+    unliked: set[int] = set()
+    insert = _dialect_insert(db)
+    if to_like and insert is not None:
+        # RETURNING は実際に挿入された行だけを返すため、同時実行でも二重に数えません
+        liked = set(
+            db.scalars(
+                insert(table)
+                .on_conflict_do_nothing(
+                    index_elements=[table.c.post_id, table.c.user_id]
+                )
+                .returning(table.c.post_id),
+                [{"post_id": p, "user_id": user_id} for p in to_like],
+            )
+        )
+    elif to_like:
+        liked = {p for p in to_like if _insert_like(db, p, user_id)}
+    if to_unlike and insert is not None:
+        unliked = set(
+            db.scalars(
+                delete(table)
+                .where(table.c.user_id == user_id, table.c.post_id.in_(to_unlike))
+                .returning(table.c.post_id)
+            )
+        )
+    elif to_unlike:
+        # RETURNING 非対応のDB向け: 1件ずつ削除し、影響行数で判定します
+        unliked = {p for p in to_unlike if _delete_like(db, p, user_id)}
+
+    deltas: dict[int, int] = {}
+    for post_id in liked:
+        deltas[authors[post_id]] = deltas.get(authors[post_id], 0) + 1
+    for post_id in unliked:
+        deltas[authors[post_id]] = deltas.get(authors[post_id], 0) - 1
+    adjust_counters(db, "likes_received", deltas)
+    db.commit()
+
+    results = []
+    for i, (post_id, _) in enumerate(operations):
+        if post_id not in authors:
+            results.append("not_found")
+        elif last_index[post_id] != i:
+            results.append("superseded")
+        elif post_id in liked or post_id in unliked:
+            results.append("applied")
+        else:
+            results.append("unchanged")
+    return results
+
+
 # --- Report CRUD ---
 
 
@@ -363,7 +779,6 @@ def create_report(db: Session, report: schemas.ReportCreate, reporter_id: int):
     db.add(db_report)
     db.commit()
     db.refresh(db_report)
-    db_report.reported_at = normalize_to_utc(db_report.reported_at)
     return db_report
 
 
@@ -371,29 +786,37 @@ def get_reports(db: Session):
     reports = (
         db.query(models.Report)
         .options(
-            joinedload(models.Report.reporter).joinedload(models.User.department),
+            joinedload(models.Report.reporter),
             joinedload(models.Report.reported_post).joinedload(models.Post.author),
         )
         .order_by(models.Report.reported_at.desc())
         .all()
     )
-    for r in reports:
-        r.reported_at = normalize_to_utc(r.reported_at)
     return reports
 
 
 def update_report_status(db: Session, report_id: int, status: models.ReportStatus):
-    report = db.query(models.Report).filter(models.Report.id == report_id).first()
+    # レスポンスで通報者・投稿・投稿者を参照するため、まとめて読み込みます
+    query = db.query(models.Report).options(
+        joinedload(models.Report.reporter),
+        joinedload(models.Report.reported_post).joinedload(models.Post.author),
+    )
+    report = query.filter(models.Report.id == report_id).first()
     if not report:
         return None
     logger.info("Updating report %s status to %s", report_id, status.value)
     post = report.reported_post
+    visibility_changed = False
     if post:
         post.report_status = status
         if status == models.ReportStatus.deleted:
+            visibility_changed = not post.is_deleted
             post.is_deleted = True
         elif status == models.ReportStatus.pending:
+            visibility_changed = bool(post.is_deleted)
             post.is_deleted = False
     db.commit()
-    db.refresh(report)
-    return report
+    if visibility_changed:
+        readmodels.invalidate_timeline()
+    # refresh() だと関連が遅延ロードになるため、eager load 付きで読み直します
+    return query.filter(models.Report.id == report_id).populate_existing().one()
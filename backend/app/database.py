@@ -1,5 +1,8 @@
 import os
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -22,3 +25,24 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # データベースのテーブル定義（モデル）を作成する際に、共通の親となるクラスです。
 Base = declarative_base()
+
+
+@contextmanager
+def lock_timeout(connection: Connection, seconds: float):
+    """Wait at most ``seconds`` for locks held by other connections in this block.
+
+    SQLite waits up to the driver's timeout (5 s) before "database is
+    locked"; read paths that have a fallback (stale pages, the cache bus)
+    use a shorter wait. The PRAGMA goes straight to the driver connection,
+    so it is not counted as a query. Other databases are left unchanged.
+    """
+    if connection.dialect.name != "sqlite":
+        yield connection
+        return
+    raw = connection.connection.driver_connection
+    previous = raw.execute("PRAGMA busy_timeout").fetchone()[0]
+    raw.execute(f"PRAGMA busy_timeout = {max(int(seconds * 1000), 0)}")
+    try:
+        yield connection
+    finally:
+        raw.execute(f"PRAGMA busy_timeout = {previous}")
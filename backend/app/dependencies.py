@@ -1,6 +1,5 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from . import crud, schemas, auth
@@ -26,14 +25,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        employee_id: str | None = payload.get("sub")
-        if employee_id is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(employee_id=employee_id)
-    except JWTError:
+    employee_id = auth.decode_access_token(token)
+    if employee_id is None:
         raise credentials_exception
+    token_data = schemas.TokenData(employee_id=employee_id)
     user = crud.get_user_by_employee_id(db, employee_id=token_data.employee_id)
     if user is None:
         raise credentials_exception
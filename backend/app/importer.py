@@ -0,0 +1,409 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from . import auth, cache, crud, models, registry, schemas
+from .utils import to_halfwidth_kana
+
+logger = logging.getLogger(__name__)
+
+# CSVに必須のヘッダー
+REQUIRED_FIELDS = {"user_id", "name", "department", "email"}
+
+# 1回のIN検索・一括INSERTで扱う行数
+BATCH_SIZE = 500
+
+# これより少ない件数ではプロセスプールの起動コストの方が大きいため、その場でハッシュ化します
+PARALLEL_HASH_THRESHOLD = 32
+
+HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _batched(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _parse_row(row: dict) -> tuple[schemas.UserCreate, str] | None:
+    """Convert a CSV row to ``(UserCreate, department name)``; ``None`` if incomplete."""
+    user_id = (row.get("user_id") or "").strip()
+    name = (row.get("name") or "").strip()
+    display_name = (row.get("display_name") or "").strip() or name
+    # 部署名は登録済みの名前と同じく半角カナに揃えて照合・登録します
+    department_name = to_halfwidth_kana((row.get("department") or "").strip())
+    email = (row.get("email") or "").strip()
+    if not user_id or not name or not department_name or not email:
+        return None
+    # department_id は後で部署名から一括解決します
+    user = schemas.UserCreate(
+        employee_id=user_id,
+        name=name,
+        display_name=display_name,
+        password=user_id,
+    )
+    return user, department_name
+
+
+class _PasswordHasher:
+    """Hash passwords on a process pool that is started on first use."""
+
+    def __init__(self):
+        self._pool: ProcessPoolExecutor | None = None
+
+    def hash_all(self, passwords: list[str]) -> list[str]:
+        if len(passwords) < PARALLEL_HASH_THRESHOLD or HASH_WORKERS <= 1:
+            return [auth.get_password_hash(p) for p in passwords]
+        if self._pool is None:
+            # Webサーバーはマルチスレッドなので fork ではなく spawn で起動します
+            self._pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        chunksize = max(1, len(passwords) // (HASH_WORKERS * 4))
+        return list(
+            self._pool.map(auth.get_password_hash, passwords, chunksize=chunksize)
+        )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def _resolve_departments(
+    db: Session, names: set[str], cache: dict[str, int]
+) -> None:
+    """Fill ``cache`` with ids for ``names``, creating missing departments."""
+    missing = names - cache.keys()
+    if not missing:
+        return
+    rows = db.execute(
+        select(models.Department.name, models.Department.id).where(
+            models.Department.name.in_(missing)
+        )
+    ).all()
+    cache.update(rows)
+    to_create = missing - cache.keys()
+    if to_create:
+        db.execute(
+            insert(models.Department), [{"name": name} for name in sorted(to_create)]
+        )
+        rows = db.execute(
+            select(models.Department.name, models.Department.id).where(
+                models.Department.name.in_(to_create)
+            )
+        ).all()
+        cache.update(rows)
+
+
+def _insert_users(
+    db: Session,
+    new_users: list[tuple[schemas.UserCreate, str]],
+    departments: dict[str, int],
+    hasher: _PasswordHasher,
+) -> None:
+    """Bulk INSERT ``(UserCreate, department name)`` pairs, creating departments."""
+    _resolve_departments(db, {d for _, d in new_users}, departments)
+    hashes = hasher.hash_all([u.password for u, _ in new_users])
+    db.execute(
+        insert(models.User),
+        [
+            {
+                "employee_id": u.employee_id,
+                "name": u.name,
+                "display_name": u.display_name,
+                "hashed_password": hashed,
+                "department_id": departments[department_name],
+                "is_admin": False,
+                "is_active": True,
+            }
+            for (u, department_name), hashed in zip(new_users, hashes)
+        ],
+    )
+
+
+def import_users(
+    db: Session,
+    rows: Iterable[dict],
+    batch_size: int = BATCH_SIZE,
+    on_batch: Callable[[int, list[str]], None] | None = None,
+) -> dict:
+    """Import users from CSV rows in bulk.
+
+    Existing employee ids and departments are prefetched with one ``IN``
+    query per batch and new users are inserted with a single bulk INSERT per
+    batch. Everything runs in one transaction, so a failure leaves no partial
+    state behind. Returns the ``added``/``skipped``/``errors`` report.
+
+    ``on_batch(rows_processed, errors)`` is called after every batch; an
+    exception raised from it aborts and rolls back the import.
+    """
+    added = 0
+    skipped = 0
+    errors: list[str] = []
+    # このインポート中に確定した社員IDとカナ名（ファイル内の重複検出用）
+    known_names: dict[str, str] = {}
+    departments: dict[str, int] = {}
+    processed = 0
+    hasher = _PasswordHasher()
+    try:
+        for batch in _batched(rows, batch_size):
+            processed += len(batch)
+            parsed = []
+            for row in batch:
+                item = _parse_row(row)
+                if item is None:
+                    skipped += 1
+                else:
+                    parsed.append(item)
+
+            lookup = {u.employee_id for u, _ in parsed} - known_names.keys()
+            if lookup:
+                # 退職済み(is_active=False)の社員IDも一意制約に掛かるため対象に含めます
+                known_names.update(
+                    db.execute(
+                        select(models.User.employee_id, models.User.name).where(
+                            models.User.employee_id.in_(lookup)
+                        )
+                    ).all()
+                )
+
+            new_users = []
+            for user, department_name in parsed:
+                existing_name = known_names.get(user.employee_id)
+                if existing_name is None:
+                    known_names[user.employee_id] = user.name
+                    new_users.append((user, department_name))
+                    continue
+                if existing_name != user.name:
+                    errors.append(
+                        f"ID {user.employee_id} already exists with kana '{existing_name}' but CSV has '{user.name}'"
+                    )
+                skipped += 1
+
+            if new_users:
+                _insert_users(db, new_users, departments, hasher)
+                added += len(new_users)
+            if on_batch:
+                on_batch(processed, errors)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        hasher.close()
+    # インポートで作成された部署・ユーザーを反映します
+    registry.departments.invalidate()
+    cache.invalidate(crud.USER_SEARCH_NAMESPACE)
+    logger.info("Imported users: added=%s skipped=%s", added, skipped)
+    return {"added": added, "skipped": skipped, "errors": errors}
+
+
+# 同期結果のプレビューに含める社員IDの最大件数（カテゴリごと）
+PREVIEW_LIMIT = 100
+
+# 同期で退職扱いにできる在職ユーザー（管理者を除く）の割合。超える場合は force が必要です
+MAX_DEACTIVATION_RATIO = float(os.getenv("SYNC_MAX_DEACTIVATION_RATIO", "0.2"))
+
+
+class SyncRefused(ValueError):
+    """The roster looks incomplete; ``sync_users`` needs ``force=True`` to apply it."""
+
+
+def sync_users(
+    db: Session,
+    rows: Iterable[dict],
+    dry_run: bool = False,
+    on_batch: Callable[[int, list[str]], None] | None = None,
+    force: bool = False,
+) -> dict:
+    """Synchronise users with a full HR roster keyed by ``employee_id``.
+
+    Current users and departments are loaded with one query each, the CSV is
+    streamed into a roster, and the difference is applied in bulk: new
+    employees are inserted, changed names and departments are updated,
+    retired users found in the roster are reactivated and active users
+    missing from it are deactivated. Administrators are never deactivated.
+    With ``dry_run`` nothing is written and the report doubles as a preview.
+
+    Rows with an employee id but a missing name, department or email are
+    reported in ``errors`` and leave that employee unchanged (in particular
+    not deactivated). An empty roster, or one that would deactivate more
+    than ``SYNC_MAX_DEACTIVATION_RATIO`` of the active users, raises
+    ``SyncRefused`` unless ``force`` is set; a dry run reports it in
+    ``refused`` instead.
+    """
+    errors: list[str] = []
+    skipped = 0
+    processed = 0
+    current = {
+        row.employee_id: row
+        for row in db.execute(
+            select(
+                models.User.id,
+                models.User.employee_id,
+                models.User.name,
+                models.User.display_name,
+                models.User.department_id,
+                models.User.is_active,
+                models.User.is_admin,
+            )
+        )
+    }
+    departments: dict[str, int] = dict(
+        db.execute(select(models.Department.name, models.Department.id)).all()
+    )
+
+    roster: dict[str, tuple[schemas.UserCreate, str]] = {}
+    # 不完全な行の社員ID（名簿に載っているため、退職扱いにはしません）
+    invalid_ids: set[str] = set()
+    for batch in _batched(rows, BATCH_SIZE):
+        for row in batch:
+            processed += 1
+            item = _parse_row(row)
+            if item is None:
+                skipped += 1
+                values = [v for v in row.values() if isinstance(v, str)]
+                if not any(v.strip() for v in values):
+                    # 空行は名簿の内容に含めません
+                    continue
+                employee_id = (row.get("user_id") or "").strip()
+                if employee_id:
+                    invalid_ids.add(employee_id)
+                    errors.append(
+                        f"ID {employee_id} is missing name, department or email; left unchanged"
+                    )
+                else:
+                    errors.append(f"Row {processed} has no user_id")
+                continue
+            employee_id = item[0].employee_id
+            if employee_id in roster:
+                errors.append(f"ID {employee_id} appears more than once in the CSV")
+                skipped += 1
+                continue
+            roster[employee_id] = item
+        if on_batch:
+            on_batch(processed, errors)
+
+    new_users: list[tuple[schemas.UserCreate, str]] = []
+    changes: dict[str, list[str]] = {
+        "inserted": [],
+        "renamed": [],
+        "moved": [],
+        "reactivated": [],
+        "deactivated": [],
+    }
+    updates: list[tuple[int, schemas.UserCreate, str]] = []
+    unchanged = 0
+    for employee_id, (user, department_name) in roster.items():
+        existing = current.get(employee_id)
+        if existing is None:
+            new_users.append((user, department_name))
+            changes["inserted"].append(employee_id)
+            continue
+        changed = False
+        if (existing.name, existing.display_name) != (user.name, user.display_name):
+            changes["renamed"].append(employee_id)
+            changed = True
+        if departments.get(department_name) != existing.department_id:
+            changes["moved"].append(employee_id)
+            changed = True
+        if not existing.is_active:
+            changes["reactivated"].append(employee_id)
+            changed = True
+        if changed:
+            updates.append((existing.id, user, department_name))
+        else:
+            unchanged += 1
+
+    deactivate_ids = []
+    active = 0
+    for employee_id, existing in current.items():
+        if not existing.is_active or existing.is_admin:
+            continue
+        active += 1
+        if employee_id not in roster and employee_id not in invalid_ids:
+            deactivate_ids.append(existing.id)
+            changes["deactivated"].append(employee_id)
+
+    refused = None
+    if not roster:
+        refused = "The roster has no valid rows"
+    elif len(deactivate_ids) > active * MAX_DEACTIVATION_RATIO:
+        refused = (
+            f"The roster would deactivate {len(deactivate_ids)} of {active} active users "
+            f"(more than {MAX_DEACTIVATION_RATIO:.0%})"
+        )
+
+    new_departments = sorted(
+        ({d for _, d in new_users} | {d for _, _, d in updates}) - departments.keys()
+    )
+    report = {key: len(ids) for key, ids in changes.items()}
+    report.update(
+        {
+            "unchanged": unchanged,
+            "skipped": skipped,
+            "errors": errors,
+            "dry_run": dry_run,
+            "refused": None if force else refused,
+            "new_departments": new_departments,
+            "preview": {key: ids[:PREVIEW_LIMIT] for key, ids in changes.items()},
+        }
+    )
+    if dry_run:
+        return report
+    if refused and not force:
+        raise SyncRefused(f"{refused}; nothing was changed. Use force=true to apply it anyway.")
+
+    hasher = _PasswordHasher()
+    try:
+        if new_users:
+            _insert_users(db, new_users, departments, hasher)
+        if updates:
+            _resolve_departments(db, {d for _, _, d in updates}, departments)
+            # 主キー指定のバルクUPDATE（executemany）
+            db.execute(
+                update(models.User),
+                [
+                    {
+                        "id": user_id,
+                        "name": user.name,
+                        "display_name": user.display_name,
+                        "department_id": departments[department_name],
+                        "is_active": True,
+                    }
+                    for user_id, user, department_name in updates
+                ],
+            )
+        for ids in _batched(deactivate_ids, BATCH_SIZE):
+            db.execute(
+                update(models.User)
+                .where(models.User.id.in_(ids))
+                .values(is_active=False)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        hasher.close()
+    if new_departments:
+        registry.departments.invalidate()
+    if updates or deactivate_ids:
+        # 氏名の変更・退職者の無効化をメンション表示名に反映します
+        registry.user_mentions.invalidate()
+    if new_users or updates or deactivate_ids:
+        cache.invalidate(crud.USER_SEARCH_NAMESPACE)
+    logger.info(
+        "Synced users: %s",
+        {key: value for key, value in report.items() if isinstance(value, int)},
+    )
+    return report
@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# 1ワーカープロセスあたりで同時に実行するジョブ数。超えた分はキューで待機します
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+
+# メモリ上に保持する完了済みジョブの上限
+MAX_RETAINED_JOBS = 100
+
+# 停止時に実行中のジョブの完了を待つ秒数（超えたらキャンセルしてロールバック）
+DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "25"))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+class Job:
+    """State of a background job, updated by the worker thread."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.rows_processed = 0
+        self.errors: list[str] = []
+        self.result: dict | None = None
+        self._cancel = threading.Event()
+        self._future: Future | None = None
+        self._cleanup: Callable[[], Any] | None = None
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def report_progress(self, rows_processed: int, errors: list[str]) -> None:
+        """Record progress; raises ``JobCancelled`` if the job was cancelled."""
+        self.rows_processed = rows_processed
+        self.errors = list(errors)
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self.started_at:
+            return 0.0
+        end = self.finished_at or datetime.now(timezone.utc)
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+
+class JobManager:
+    """Run jobs on a bounded thread pool and keep their status for polling."""
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_JOBS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        fn: Callable[..., Any],
+        *args,
+        cleanup: Callable[[], Any] | None = None,
+    ) -> Job:
+        """Queue ``fn(job, *args)``; its return value becomes ``job.result``.
+
+        ``cleanup()`` runs exactly once when the job is over, also if it was
+        cancelled before ``fn`` started or could not be queued (e.g. to remove
+        a spooled upload).
+        """
+        job = Job(kind)
+        job._cleanup = cleanup
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        try:
+            job._future = self._executor.submit(self._run, job, fn, *args)
+        except BaseException:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._release(job)
+            raise
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], *args) -> None:
+        try:
+            if job.cancel_requested:
+                job.status = "cancelled"
+                job.finished_at = datetime.now(timezone.utc)
+                return
+            self._execute(job, fn, *args)
+        finally:
+            self._release(job)
+
+    def _release(self, job: Job) -> None:
+        cleanup, job._cleanup = job._cleanup, None
+        if cleanup is None:
+            return
+        try:
+            cleanup()
+        except Exception:
+            logger.exception("Cleanup of job %s (%s) failed", job.id, job.kind)
+
+    def _execute(self, job: Job, fn: Callable[..., Any], *args) -> None:
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        try:
+            job.result = fn(job, *args)
+            job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed", job.id, job.kind)
+            job.errors.append(str(exc))
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            logger.info(
+                "Job %s (%s) %s: %s rows in %.2fs",
+                job.id,
+                job.kind,
+                job.status,
+                job.rows_processed,
+                time.perf_counter() - start,
+            )
+
+    def _evict(self) -> None:
+        finished = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.status in ("succeeded", "failed", "cancelled")
+        ]
+        while len(self._jobs) > MAX_RETAINED_JOBS and finished:
+            self._jobs.pop(finished.pop(0), None)
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self.get(job_id)
+        if job and job.status in ("queued", "running"):
+            job._cancel.set()
+        return job
+
+    def wait(self, job_id: str, timeout: float | None = None) -> Job | None:
+        """Block until the job has finished (mainly for tests and CLI use)."""
+        job = self.get(job_id)
+        if job and job._future is not None:
+            job._future.result(timeout=timeout)
+        return job
+
+    def drain(self, timeout: float | None = None, cancel_timeout: float = 10) -> bool:
+        """Wait for queued and running jobs (graceful shutdown).
+
+        Jobs still unfinished after ``timeout`` seconds are cancelled, which
+        rolls back their transaction at the next progress report. Returns
+        ``True`` if every job finished on its own. The manager stays usable.
+        """
+        with self._lock:
+            futures = [
+                job._future
+                for job in self._jobs.values()
+                if job._future is not None and not job._future.done()
+            ]
+        if not futures:
+            return True
+        _, pending = wait(futures, timeout=timeout)
+        if not pending:
+            return True
+        for job in self.list():
+            if job.status in ("queued", "running"):
+                logger.warning("Cancelling job %s (%s) on shutdown", job.id, job.kind)
+                job._cancel.set()
+        wait(pending, timeout=cancel_timeout)
+        return False
+
+    def shutdown(self, cancel: bool = True) -> None:
+        if cancel:
+            for job in self.list():
+                job._cancel.set()
+        self._executor.shutdown(wait=True)
+
+
+manager = JobManager()
@@ -1,32 +1,59 @@
+import hashlib
+import json
 import logging
-from fastapi import FastAPI, Depends, HTTPException, status, Response
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import JWTError, jwt  # JWTError, jwtをインポート
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 # これまでに作成した各モジュールをインポート
-from . import crud, models, schemas, auth
-from .database import SessionLocal, engine, Base
+from . import cache, crud, database, models, schemas, auth, bootstrap, jobs, metrics, profiling, querybudget, readmodels, registry, slowquery
+from .database import SessionLocal, engine
 from .dependencies import get_db, oauth2_scheme
+from .querybudget import query_budget
+from .responses import dump_list, etag_response, stale_headers
 from .routers.admin import users as admin_users
 from .routers.admin import departments as admin_departments
 from .routers.admin import posts as admin_posts
 from .routers.admin import reports as admin_reports
+from .routers.admin import jobs as admin_jobs
+from .routers.admin import diagnostics as admin_diagnostics
 
-# Configure basic logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
 logger = logging.getLogger(__name__)
 
-# データベースのテーブルを起動時に作成（もし存在しなければ）
-Base.metadata.create_all(bind=engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にテーブル作成と初期データ登録、終了時にジョブの完了待ちを行います
+
+    インポート時には DB に触れないため、``import app.main`` は軽量です。
+    """
+    # uvicorn app.main:app で直接起動した場合に備えます（設定済みなら何もしません）
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    if not bootstrap.startup_seed_skipped():
+        # app.server のプレスタート（または python -m app.cli init-db）を使う場合は省略されます
+        bootstrap.init_db(engine)
+        db = SessionLocal()
+        try:
+            bootstrap.seed(db)
+        finally:
+            db.close()
+    yield
+    if not jobs.manager.drain(timeout=jobs.DRAIN_TIMEOUT):
+        logger.warning("Some jobs were cancelled during shutdown")
+
 
 # FastAPIアプリケーションのインスタンスを作成
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- ミドルウェア/イベントハンドラ設定 ---
 
@@ -42,97 +69,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ルートごとのSQL発行数の上限チェック（N+1検出）
+app.add_middleware(querybudget.QueryBudgetMiddleware)
+querybudget.instrument_engine(engine)
 
-@app.on_event("startup")
-def on_startup():
-    """アプリ起動時の初期データ登録を行います"""
-    db = SessionLocal()
+# SLOW_QUERY_MS を設定した場合のみ、遅いSQLを実行計画付きで記録します
+slowquery.instrument_engine(engine)
 
-    # --- Departments ---
-    departments = [
-        {"id": 0, "name": "テスト部署"},
-        {"id": 2, "name": "2A病棟"},
-        {"id": 3, "name": "3B病棟"},
-        {"id": 4, "name": "情報システム"},
-    ]
+# 管理者の X-Profile ヘッダー付きリクエスト（と PROFILE_SAMPLE_RATE 分）をプロファイルします
+app.add_middleware(profiling.ProfilingMiddleware)
+profiling.instrument_engine(engine)
 
-    for dept in departments:
-        existing = (
-            db.query(models.Department)
-            .filter(models.Department.id == dept["id"])
-            .first()
-        )
-        if existing:
-            existing.name = dept["name"]
-        else:
-            db.add(models.Department(**dept))
-    db.commit()
-
-    # --- Users ---
-    users = [
-        {
-            "employee_id": "000000",
-            "name": "ﾃｽﾄﾕｰｻﾞｰ",
-            "display_name": "テストユーザー",
-            "password": "pass",
-            "department_id": 0,
-        },
-        {
-            "employee_id": "000001",
-            "name": "ﾃｽﾄｲﾁ",
-            "display_name": "テストイチ",
-            "password": "000001",
-            "department_id": 2,
-        },
-        {
-            "employee_id": "000002",
-            "name": "ﾃｽﾄﾆ",
-            "display_name": "テストニ",
-            "password": "000002",
-            "department_id": 3,
-        },
-        {
-            "employee_id": "000003",
-            "name": "ﾃｽﾄｻﾝ",
-            "display_name": "テストサン",
-            "password": "000003",
-            "department_id": 4,
-        },
-        {
-            "employee_id": "999999",
-            "name": "ﾃｽﾄｶﾝﾘｼｬ",
-            "display_name": "テスト管理者",
-            "password": "admin",
-            "department_id": 0,
-            "is_admin": True,
-        },
-    ]
+# リクエスト/SQLのメトリクス収集（最後に追加して最も外側で計測します）
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
 
-    for user_data in users:
-        user = crud.get_user_by_employee_id(db, employee_id=user_data["employee_id"])
-        if user:
-            user.department_id = user_data["department_id"]
-            normalized = schemas.UserUpdate(
-                name=user_data["name"], display_name=user_data["display_name"]
-            )
-            user.name = normalized.name
-            user.display_name = normalized.display_name or user_data["display_name"]
-            user.hashed_password = auth.get_password_hash(user_data["password"])
-            user.is_admin = user_data.get("is_admin", False)
-            db.commit()
-        else:
-            user_in = schemas.UserCreate(**user_data)
-            crud.create_user(db=db, user=user_in)
-            if user_data["employee_id"] == "000000":
-                logger.info("初期テストユーザー(ID:000000)を作成しました。")
-
-    db.close()
 
 
 # --- 依存関係 ---
 
 oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# last_seen を書き込む間隔（ログイン状態は5分以内の活動で判定します）
+LAST_SEEN_INTERVAL = timedelta(seconds=int(os.getenv("LAST_SEEN_INTERVAL_SECONDS", "60")))
+
+
+def _touch_last_seen(db: Session, user: models.User) -> None:
+    """Record activity at most once per ``LAST_SEEN_INTERVAL``; best effort.
+
+    The update runs on its own connection and waits at most
+    ``CACHE_REFRESH_TIMEOUT`` for a lock, so a locked database (e.g. during an
+    import) neither fails nor stalls the request.
+    """
+    now = datetime.now(timezone.utc)
+    if user.last_seen is not None and now - user.last_seen < LAST_SEEN_INTERVAL:
+        return
+    users = models.User.__table__
+    try:
+        with db.get_bind().connect() as conn, database.lock_timeout(conn, cache.REFRESH_TIMEOUT):
+            conn.execute(update(users).where(users.c.id == user.id).values(last_seen=now))
+            conn.commit()
+    except OperationalError:
+        logger.warning("Could not update last_seen of user %s", user.id, exc_info=True)
+        return
+    # 保存済みの値としてセッションに反映します（再度の UPDATE は不要）
+    set_committed_value(user, "last_seen", now)
+
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
@@ -143,20 +125,14 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        employee_id: str = payload.get("sub")
-        if employee_id is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(employee_id=employee_id)
-    except JWTError:
+    employee_id = auth.decode_access_token(token)
+    if employee_id is None:
         raise credentials_exception
+    token_data = schemas.TokenData(employee_id=employee_id)
     user = crud.get_user_by_employee_id(db, employee_id=token_data.employee_id)
     if user is None:
         raise credentials_exception
-    user.last_seen = datetime.now(timezone.utc)
-    db.add(user)
-    db.commit()
+    _touch_last_seen(db, user)
     return user
 
 
@@ -166,20 +142,14 @@ async def get_current_user_optional(
 ) -> schemas.User | None:
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        employee_id: str | None = payload.get("sub")
-        if employee_id is None:
-            return None
-        token_data = schemas.TokenData(employee_id=employee_id)
-    except JWTError:
+    employee_id = auth.decode_access_token(token)
+    if employee_id is None:
         return None
+    token_data = schemas.TokenData(employee_id=employee_id)
     user = crud.get_user_by_employee_id(db, employee_id=token_data.employee_id)
     if not user:
         return None
-    user.last_seen = datetime.now(timezone.utc)
-    db.add(user)
-    db.commit()
+    _touch_last_seen(db, user)
     return user
 
 
@@ -187,6 +157,7 @@ async def get_current_user_optional(
 
 
 @app.post("/token", response_model=schemas.Token)
+@query_budget(3)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
 ):
@@ -206,56 +177,67 @@ async def login_for_access_token(
 
 
 @app.get("/users/me", response_model=schemas.User)
+@query_budget(4)
 async def read_users_me(current_user: schemas.User = Depends(get_current_user)):
     """現在ログインしているユーザーの情報を取得するエンドポイント"""
     return current_user
 
 
 @app.get("/users/search", response_model=list[schemas.UserSearchResult])
+@query_budget(3)
 def search_users(query: str, db: Session = Depends(get_db)):
     """Search users by name. Requires query length >= 2 characters."""
     if len(query) < 2:
         return []
-    users = crud.search_users(db, query=query)
-    return users
+    body = cache.get_or_set(
+        crud.USER_SEARCH_NAMESPACE,
+        query,
+        lambda: dump_list(
+            schemas.UserSearchResult, crud.search_users(db, query=query), from_attributes=True
+        ),
+        ttl=crud.USER_SEARCH_CACHE_TTL,
+    )
+    return Response(content=body, media_type="application/json")
+
+
+# 部署一覧はほとんど変わらないため、短時間のキャッシュと ETag による再検証を許可します
+DEPARTMENTS_CACHE_CONTROL = "public, max-age=60"
 
 
 @app.get("/departments", response_model=list[schemas.Department])
-def list_departments(db: Session = Depends(get_db)):
+@query_budget(1)
+def list_departments(request: Request, db: Session = Depends(get_db)):
     """Public endpoint to retrieve all departments."""
-    return crud.get_departments(db)
+    # プロセス内の部署レジストリから返します（DB へのアクセスは再読み込み時のみ）
+    body, etag = registry.departments_payload(db)
+    # DB が使えず再読み込みできなかった場合は、古い一覧であることをヘッダーで示します
+    headers = stale_headers(
+        registry.departments.stale_age(), cache.REVALIDATION_FAILED_WARNING
+    )
+    return etag_response(request, body, etag, DEPARTMENTS_CACHE_CONTROL, headers)
 
 
 @app.get("/posts/", response_model=list[schemas.Post])
+# 認証（最大3）+ 本文・メンション（キャッシュ時は0、最大2）+ いいね（1）+ registry の再読み込み（最大2）
+@query_budget(8)
 def read_posts(
     db: Session = Depends(get_db),
     current_user: schemas.User | None = Depends(get_current_user_optional),
 ):
     """投稿を全件取得するエンドポイント。誰でも見れるように認証はかけない。"""
-    posts = crud.get_posts(db)
-    result = []
-    for p in posts:
-        result.append(
-            schemas.Post(
-                id=p.id,
-                content=p.content,
-                created_at=p.created_at,
-                mention_user_ids=p.mention_user_ids,
-                mention_department_ids=p.mention_department_ids,
-                mention_user_names=p.mention_user_names,
-                mention_department_names=p.mention_department_names,
-                like_count=p.like_count,
-                liked_by_me=(
-                    current_user.id in [u.id for u in p.likers]
-                    if current_user
-                    else False
-                ),
-            )
-        )
-    return result
+    # ORM のグラフを組み立てず、Core の結果から直接 JSON を生成します（schemas.Post と同じ形）
+    posts, page = readmodels.cached_timeline(
+        db, user_id=current_user.id if current_user else None
+    )
+    return Response(
+        content=readmodels.dump_posts(posts),
+        media_type="application/json",
+        headers=stale_headers(page.age, page.warning),
+    )
 
 
 @app.post("/posts/", response_model=schemas.Post, status_code=status.HTTP_201_CREATED)
+@query_budget(18)
 def create_post_for_user(
     post: schemas.PostCreate,
     db: Session = Depends(get_db),
@@ -268,35 +250,65 @@ def create_post_for_user(
 
 
 @app.get("/posts/mentioned", response_model=list[schemas.Post])
+@query_budget(7)
 def read_mentioned_posts(
     db: Session = Depends(get_db),
     current_user: schemas.User = Depends(get_current_user),
 ):
     """Retrieve posts where the current user is mentioned."""
-    posts = crud.get_posts_mentioned(
+    posts = readmodels.mentioned(
         db,
         user_id=current_user.id,
         department_id=current_user.department_id,
     )
-    result = []
-    for p in posts:
-        result.append(
-            schemas.Post(
-                id=p.id,
-                content=p.content,
-                created_at=p.created_at,
-                mention_user_ids=p.mention_user_ids,
-                mention_department_ids=p.mention_department_ids,
-                mention_user_names=p.mention_user_names,
-                mention_department_names=p.mention_department_names,
-                like_count=p.like_count,
-                liked_by_me=current_user.id in [u.id for u in p.likers],
-            )
+    return Response(content=readmodels.dump_posts(posts), media_type="application/json")
+
+
+# 1回の /posts/engagement で問い合わせ可能な投稿IDの上限
+MAX_ENGAGEMENT_IDS = 200
+
+
+@app.get("/posts/engagement", response_model=list[schemas.PostEngagement])
+@query_budget(5)
+def read_post_engagement(
+    request: Request,
+    ids: str,
+    db: Session = Depends(get_db),
+    current_user: schemas.User | None = Depends(get_current_user_optional),
+):
+    """Return like counts and the caller's like state for comma-separated post ids."""
+    try:
+        post_ids = sorted({int(i) for i in ids.split(",") if i.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if len(post_ids) > MAX_ENGAGEMENT_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_ENGAGEMENT_IDS} ids are allowed"
         )
-    return result
+    rows = crud.get_engagement(
+        db, post_ids, user_id=current_user.id if current_user else None
+    )
+    body = json.dumps(
+        [
+            {"post_id": post_id, "like_count": count, "liked_by_me": liked}
+            for post_id, count, liked in rows
+        ],
+        separators=(",", ":"),
+    ).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        # liked_by_me は利用者ごとに異なるため、ログイン中は共有キャッシュさせません
+        "Cache-Control": "private, max-age=5" if current_user else "public, max-age=5",
+        "Vary": "Authorization",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @app.post("/posts/{post_id}/like", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(7)
 def like_post_endpoint(
     post_id: int,
     db: Session = Depends(get_db),
@@ -309,6 +321,7 @@ def like_post_endpoint(
 
 
 @app.delete("/posts/{post_id}/like", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(7)
 def unlike_post_endpoint(
     post_id: int,
     db: Session = Depends(get_db),
@@ -320,9 +333,26 @@ def unlike_post_endpoint(
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@app.post("/posts/likes:batch", response_model=list[schemas.LikeOperationResult])
+@query_budget(10)
+def batch_like_posts(
+    batch: schemas.LikeBatch,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user),
+):
+    """Apply queued like/unlike operations in one transaction."""
+    operations = [(op.post_id, op.action == "like") for op in batch.operations]
+    statuses = crud.apply_like_operations(db, current_user.id, operations)
+    return [
+        schemas.LikeOperationResult(post_id=op.post_id, action=op.action, status=s)
+        for op, s in zip(batch.operations, statuses)
+    ]
+
+
 @app.post(
     "/reports", response_model=schemas.ReportOut, status_code=status.HTTP_201_CREATED
 )
+@query_budget(7)
 def create_report(
     report: schemas.ReportCreate,
     db: Session = Depends(get_db),
@@ -341,8 +371,19 @@ def create_report(
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+@query_budget(0)
+def read_metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return Response(
+        content=metrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
 # include routers
 app.include_router(admin_users.router)
 app.include_router(admin_departments.router)
 app.include_router(admin_posts.router)
 app.include_router(admin_reports.router)
+app.include_router(admin_jobs.router)
+app.include_router(admin_diagnostics.router)
@@ -0,0 +1,279 @@
+"""Prometheus-style metrics without external dependencies.
+
+Metrics are kept in process memory and rendered in the Prometheus text
+exposition format at ``/metrics``. Each worker process exposes its own
+values, so scrape every worker (or aggregate per pod).
+"""
+import abc
+import bisect
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Set by MetricsMiddleware for the duration of an HTTP request; the ASGI scope
+# gains a "route" entry once FastAPI has matched the request.
+request_scope: contextvars.ContextVar[dict | None] = contextvars.ContextVar(
+    "request_scope", default=None
+)
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def route_of(scope: dict | None) -> str:
+    """Return the route template (e.g. ``/posts/{post_id}/like``) of a request scope."""
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def current_route() -> str:
+    return route_of(request_scope.get())
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(map(labels.__getitem__, self.labelnames))
+
+    def _format_labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self._samples(),
+        ]
+
+    @abc.abstractmethod
+    def _samples(self) -> list[str]:
+        """Return the exposition lines for every label set of this metric."""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # label key -> [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def count(self, **labels) -> int:
+        values = self._values.get(self._key(labels))
+        return int(sum(values[:-1])) if values else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, values in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = self._format_labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route"),
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled.", ("method",)
+)
+# Statement counts are the histogram's _count series
+DB_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "SQL statement execution time.",
+    ("route", "operation"),
+)
+# プールの待ち時間そのものを測る公開イベントは無いため、
+# 「使用中の接続数」と「接続を保持していた時間」で飽和を読み取る
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Pooled database connections currently checked out."
+)
+DB_POOL_HOLD = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time a pooled database connection stayed checked out.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_CONNECT = Histogram(
+    "db_pool_connect_duration_seconds",
+    "Time spent opening a new database connection for the pool.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt hashing/verification time.",
+    ("operation",),
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0),
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by namespace and result.", ("namespace", "result")
+)
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total", "Cache entries evicted to stay within the size limit.", ("namespace",)
+)
+SINGLEFLIGHT_EXECUTIONS = Counter(
+    "singleflight_executions_total", "Computations run by single-flight groups.", ("group",)
+)
+SINGLEFLIGHT_COALESCED = Counter(
+    "singleflight_coalesced_total",
+    "Callers that waited for an identical in-flight computation instead of running it.",
+    ("group",),
+)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = request_scope.set(scope)
+        HTTP_IN_PROGRESS.inc(method=method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_PROGRESS.dec(method=method)
+            route = route_of(scope)
+            HTTP_LATENCY.observe(elapsed, method=method, route=route)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status_code)
+            request_scope.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_start
+    operation = statement.split(None, 1)[0].upper() if statement else ""
+    DB_LATENCY.observe(elapsed, route=current_route(), operation=operation)
+
+
+def _do_connect(dialect, connection_record, cargs, cparams):
+    connection_record.info["_metrics_connect_start"] = time.perf_counter()
+
+
+def _on_connect(dbapi_connection, connection_record):
+    start = connection_record.info.pop("_metrics_connect_start", None)
+    if start is not None:
+        DB_POOL_CONNECT.observe(time.perf_counter() - start)
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["_metrics_checkout_start"] = time.perf_counter()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    start = connection_record.info.pop("_metrics_checkout_start", None)
+    if start is not None:
+        DB_POOL_CHECKED_OUT.dec()
+        DB_POOL_HOLD.observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record statement timings and connection pool usage for ``engine``."""
+    if getattr(engine, "_metrics_instrumented", False):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "do_connect", _do_connect)
+    event.listen(engine.pool, "connect", _on_connect)
+    event.listen(engine.pool, "checkout", _on_checkout)
+    event.listen(engine.pool, "checkin", _on_checkin)
+    engine._metrics_instrumented = True
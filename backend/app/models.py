@@ -2,19 +2,20 @@ from sqlalchemy import (
     Column,
     Integer,
     String,
-    DateTime,
+    Date,
     ForeignKey,
     Table,
     Boolean,
     Enum,
+    Index,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import object_session, relationship
 import enum
 from datetime import datetime, timezone
-import jaconv
 
 # No.7で作成したdatabase.pyから、全てのモデルが継承するBaseクラスをインポートします
 from .database import Base
+from .utils import UTCDateTime
 
 
 class ReportStatus(enum.Enum):
@@ -74,19 +75,22 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     # last activity timestamp for login status
     last_seen = Column(
-        DateTime(timezone=True),
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
         nullable=False,
     )
-    appreciated_count = Column(Integer, default=0, nullable=False)
-    expressed_count = Column(Integer, default=0, nullable=False)
-    likes_received = Column(Integer, default=0, nullable=False)
+    appreciated_count = Column(Integer, default=0, nullable=False, index=True)
+    expressed_count = Column(Integer, default=0, nullable=False, index=True)
+    likes_received = Column(Integer, default=0, nullable=False, index=True)
 
     department = relationship("Department", back_populates="users")
 
     @property
     def department_name(self):
-        return self.department.name if self.department else None
+        # 部署を JOIN せず、プロセス内の部署レジストリから名前を引きます
+        from . import registry
+
+        return registry.departments.get(object_session(self), self.department_id)
 
     # リレーションシップの定義: UserとPostを連携させます
     # これにより、あるユーザーがした投稿一覧を簡単に取得できるようになります
@@ -112,7 +116,7 @@ class Post(Base):
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String(140), index=True)  # 140文字制限を意識
     created_at = Column(
-        DateTime(timezone=True),
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
     )
 
@@ -174,11 +178,8 @@ class Post(Base):
 
     @property
     def mention_department_names(self) -> list[str]:
-        names = []
-        for dept in self.mention_departments:
-            if dept and dept.name:
-                names.append(jaconv.z2h(dept.name, kana=True, ascii=False, digit=False))
-        return names
+        # 部署名は登録時に半角カナへ正規化済みです
+        return [dept.name for dept in self.mention_departments if dept and dept.name]
 
     @property
     def like_count(self) -> int:
@@ -193,7 +194,7 @@ class Report(Base):
     reporter_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     reason = Column(String(255))
     reported_at = Column(
-        DateTime(timezone=True),
+        UTCDateTime,
         default=lambda: datetime.now(timezone.utc),
     )
 
@@ -207,3 +208,36 @@ class Report(Base):
             if self.reported_post
             else ReportStatus.pending
         )
+
+
+class UserActivityDaily(Base):
+    """Per-user, per-day (UTC) rollup of the counters on ``User``.
+
+    Rows are upserted incrementally when posts are created and liked, so
+    time-windowed rankings only sum a few days of rows. ``likes_received`` is
+    a net value: an unlike decrements the day it happens on.
+    """
+
+    __tablename__ = "user_activity_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    appreciated_count = Column(Integer, default=0, nullable=False)
+    expressed_count = Column(Integer, default=0, nullable=False)
+    likes_received = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (Index("ix_user_activity_daily_day_user", "day", "user_id"),)
+
+
+class CacheVersion(Base):
+    """Version counter per cache namespace, shared by all worker processes.
+
+    See ``app.cachebus``: writers increment the row of a namespace and every
+    worker drops its in-process cache of that namespace when it sees the
+    version move.
+    """
+
+    __tablename__ = "cache_versions"
+
+    namespace = Column(String, primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
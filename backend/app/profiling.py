@@ -0,0 +1,292 @@
+"""On-demand request profiling.
+
+An administrator sends ``X-Profile: 1`` with any request; the request runs
+under a sampling profiler and the response carries ``X-Profile-Id``. The
+artifact can then be downloaded from ``/admin/diagnostics/profiles/{id}`` as
+a zip containing:
+
+* ``stacks.folded`` - collapsed stacks (flamegraph.pl / speedscope format)
+* ``queries.json`` - the SQL statements executed, with redacted parameters
+* ``profile.json`` - request name, duration and sample count
+
+The sampler reads ``sys._current_frames()`` every ``PROFILE_INTERVAL_MS``
+for the event-loop thread that handles the request and for the threadpool
+threads that execute its SQL. Other requests running concurrently on the
+event loop can therefore show up in the loop thread's stacks.
+
+``PROFILE_SAMPLE_RATE`` (e.g. ``0.001``) additionally profiles a random
+fraction of all requests; those artifacts are only written to
+``PROFILE_DIR``.
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+from . import auth, crud, database
+from .slowquery import redact
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(
+    tempfile.gettempdir(), "musatoku-profiles"
+)
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+# ディレクトリに残すプロファイルの上限（古いものから削除します）
+MAX_PROFILES = int(os.getenv("PROFILE_RETAIN", "50"))
+
+PROFILE_HEADER = b"x-profile"
+
+_active: contextvars.ContextVar["Profile | None"] = contextvars.ContextVar(
+    "active_profile", default=None
+)
+
+
+def _fold(frame, thread_name: str) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        filename = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+        stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class Profile:
+    """Samples the stacks of the threads working on one request."""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.created_at = datetime.now(timezone.utc)
+        self.threads: dict[int, str] = {}
+        self.stacks: Counter[str] = Counter()
+        self.queries: list[dict] = []
+        self.samples = 0
+        self.duration_ms = 0.0
+        self._start = time.perf_counter()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._run, name=f"profiler-{self.id[:8]}", daemon=True
+        )
+
+    def watch_current_thread(self) -> None:
+        thread = threading.current_thread()
+        self.threads.setdefault(thread.ident, thread.name)
+
+    def start(self) -> None:
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+
+    def _run(self) -> None:
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, thread_name in list(self.threads.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame, thread_name)] += 1
+            self.samples += 1
+
+    def write(self, directory: str | None = None) -> str:
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.id}.zip")
+        meta = {
+            "id": self.id,
+            "name": self.name,
+            "created_at": self.created_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "samples": self.samples,
+            "interval_ms": SAMPLE_INTERVAL * 1000,
+            "queries": len(self.queries),
+        }
+        folded = "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("stacks.folded", folded)
+            zf.writestr(
+                "queries.json", json.dumps(self.queries, ensure_ascii=False, indent=2)
+            )
+            zf.writestr("profile.json", json.dumps(meta, ensure_ascii=False, indent=2))
+        _prune(directory)
+        return path
+
+
+def _prune(directory: str) -> None:
+    paths = [
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(".zip")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[MAX_PROFILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def artifact_path(profile_id: str, directory: str | None = None) -> str | None:
+    """Path of a stored profile, or ``None`` (ids are 32 hex characters)."""
+    directory = directory or PROFILE_DIR
+    if len(profile_id) != 32 or any(c not in "0123456789abcdef" for c in profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.zip")
+    return path if os.path.exists(path) else None
+
+
+def list_artifacts(directory: str | None = None) -> list[dict]:
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in os.listdir(directory):
+        if not name.endswith(".zip"):
+            continue
+        stat = os.stat(os.path.join(directory, name))
+        result.append(
+            {
+                "id": name[:-4],
+                "size_bytes": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+            }
+        )
+    result.sort(key=lambda a: a["created_at"], reverse=True)
+    return result
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    if profile is None:
+        return
+    # SQLを実行したスレッド（同期エンドポイントのワーカー）をサンプリング対象に加えます
+    profile.watch_current_thread()
+    context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _active.get()
+    if profile is None:
+        return
+    profile.queries.append(
+        {
+            "statement": statement,
+            "parameters": redact(parameters),
+            "executemany": executemany,
+            "duration_ms": round(
+                (time.perf_counter() - context._profile_start) * 1000, 3
+            ),
+            "thread": threading.current_thread().name,
+        }
+    )
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _is_admin(authorization: str) -> bool:
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    employee_id = auth.decode_access_token(token)
+    if not employee_id:
+        return False
+    db = database.SessionLocal()
+    try:
+        user = crud.get_user_by_employee_id(db, employee_id=employee_id)
+        return bool(user and user.is_admin and user.is_active)
+    finally:
+        db.close()
+
+
+def _save(profile: Profile) -> None:
+    profile.stop()
+    try:
+        profile.write()
+    except OSError:
+        logger.exception("Could not write profile %s", profile.id)
+
+
+class ProfilingMiddleware:
+    """Profile requests that carry ``X-Profile`` from an admin, or a random sample."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        requested = PROFILE_HEADER in headers and await run_in_threadpool(
+            _is_admin, headers.get(b"authorization", b"").decode("latin-1")
+        )
+        sampled = not requested and SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+        if not (requested or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(f"{scope['method']} {scope['path']}")
+        profile.watch_current_thread()
+        finished = False
+
+        async def finish():
+            nonlocal finished
+            finished = True
+            # サンプラースレッドの join と zip の書き出しはイベントループを止めないよう別スレッドで行います
+            await run_in_threadpool(_save, profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and requested:
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"x-profile-id", profile.id.encode()),
+                    ],
+                }
+            elif message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                # レスポンス完了前に書き出し、X-Profile-Id で即ダウンロードできるようにします
+                await finish()
+            await send(message)
+
+        token = _active.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active.reset(token)
+            if not finished:
+                # 最後の本文が送られずに終わった（例外など）場合のみここで保存します
+                await finish()
+            logger.info(
+                "Profiled %s in %.1f ms (%s samples, %s queries) -> %s",
+                profile.name,
+                profile.duration_ms,
+                profile.samples,
+                len(profile.queries),
+                profile.id,
+            )
@@ -0,0 +1,172 @@
+"""Per-request SQL query budgets and N+1 detection.
+
+Endpoints declare how many statements they may issue with ``@query_budget``::
+
+    @app.get("/posts/")
+    @query_budget(6)
+    def read_posts(...):
+
+``QueryBudgetMiddleware`` counts the statements of each request (via engine
+events) and logs a warning when the budget is exceeded or when the same SQL
+text repeats more than ``max_repeats`` times, the signature of an N+1 lazy
+load. With ``QUERY_BUDGET_STRICT=1`` (used by the tests) the offending
+statement raises ``QueryBudgetExceeded`` instead.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+STRICT = os.getenv("QUERY_BUDGET_STRICT", "0") == "1"
+
+# 同一SQLがこの回数を超えて繰り返されたらN+1とみなします
+DEFAULT_MAX_REPEATS = 3
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_queries: int
+    max_repeats: int = DEFAULT_MAX_REPEATS
+
+
+def query_budget(max_queries: int, max_repeats: int = DEFAULT_MAX_REPEATS):
+    """Declare the maximum number of SQL statements an endpoint may issue."""
+
+    def decorator(fn: Callable) -> Callable:
+        fn.__query_budget__ = QueryBudget(max_queries, max_repeats)
+        return fn
+
+    return decorator
+
+
+def budget_of(endpoint: Callable | None) -> QueryBudget | None:
+    return getattr(endpoint, "__query_budget__", None)
+
+
+class QueryLog:
+    """Statements issued within one request (or ``capture()`` block)."""
+
+    def __init__(self, budget: QueryBudget | None = None, scope: dict | None = None):
+        self.budget = budget
+        self.scope = scope
+        self.name = ""
+        self.statements: list[str] = []
+        self._counts: Counter[str] = Counter()
+
+    def add(self, statement: str) -> None:
+        self.statements.append(statement)
+        self._counts[statement] += 1
+
+    def bind_route(self) -> None:
+        """Pick up the budget of the matched route once FastAPI has routed."""
+        if self.budget is not None or self.scope is None:
+            return
+        route = self.scope.get("route")
+        if route is not None:
+            self.budget = budget_of(getattr(route, "endpoint", None))
+            self.name = f"{self.scope['method']} {route.path}"
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = DEFAULT_MAX_REPEATS) -> dict[str, int]:
+        """Statements issued more than ``threshold`` times."""
+        return {sql: n for sql, n in self._counts.items() if n > threshold}
+
+    def violations(self) -> list[str]:
+        if self.budget is None:
+            return []
+        problems = []
+        if self.count > self.budget.max_queries:
+            problems.append(
+                f"{self.count} statements (budget {self.budget.max_queries})"
+            )
+        for sql, n in self.repeated(self.budget.max_repeats).items():
+            problems.append(f"possible N+1: {n}x {sql[:120]}")
+        return problems
+
+
+_current: contextvars.ContextVar[QueryLog | None] = contextvars.ContextVar(
+    "query_log", default=None
+)
+
+
+@contextlib.contextmanager
+def capture(budget: QueryBudget | None = None, name: str = "capture"):
+    """Collect the statements issued inside the block (handy in tests)."""
+    log = QueryLog(budget)
+    log.name = name
+    token = _current.set(log)
+    try:
+        yield log
+    finally:
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def unmetered():
+    """Do not charge the statements inside the block to the current request.
+
+    For infrastructure queries (e.g. the cache invalidation poll) that run
+    at intervals, independent of the endpoint.
+    """
+    token = _current.set(None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    log = _current.get()
+    if log is None:
+        return
+    log.add(statement)
+    if STRICT:
+        log.bind_route()
+        budget = log.budget
+        if budget is not None and (
+            log.count > budget.max_queries
+            or log._counts[statement] > budget.max_repeats
+        ):
+            raise QueryBudgetExceeded(f"{log.name}: " + "; ".join(log.violations()))
+
+
+def instrument_engine(engine: Engine) -> None:
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class QueryBudgetMiddleware:
+    """Attach a ``QueryLog`` to each HTTP request and report budget violations."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # ルーティング後に予算を取り出せるよう、scope を保持させます
+        log = QueryLog(scope=scope)
+        token = _current.set(log)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+        log.bind_route()
+        for problem in log.violations():
+            logger.warning("Query budget exceeded by %s: %s", log.name, problem)
@@ -0,0 +1,307 @@
+"""Read-optimized timeline queries.
+
+The timeline endpoints only need a handful of columns, so instead of loading
+``Post`` graphs (mentions, departments and every liker) through the ORM they
+run two Core statements:
+
+1. the page of posts with the like count and the caller's like state, and
+2. the user/department mention ids of that page (one ``UNION ALL``), whose
+   names come from the in-process ``registry``,
+
+and serialize plain ``__slots__`` records straight to JSON bytes. The output
+matches ``schemas.Post``; the endpoints keep it as their ``response_model``
+for the OpenAPI schema.
+
+Timeline pages are the same for every reader except for the like state, so
+the posts and their mention ids are cached (``app.cache``, namespace
+``timeline``) until a post is created, deleted or hidden. Like counts, the
+caller's likes and the mention names are added per request.
+
+When the database is slow or locked (e.g. during a long import), an expired
+page is served stale for a while instead of failing: at once while it is
+refreshed in the background, or after ``CACHE_REFRESH_TIMEOUT`` seconds if
+the refresh fails or hangs. The per-request like query waits at most as
+long for a lock; if it fails, the like counts stored with the page are
+used. Names from a registry map that could not be reloaded also mark the
+response stale; mentioned users missing from such a map are shown as
+``UNKNOWN_USER_NAME``.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import case, exists, func, literal, or_, select, union_all
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import cache, database, models, registry
+from .registry import DELETED_USER_NAME, UNKNOWN_USER_NAME
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_NAMESPACE = "timeline"
+# 無効化が届かない場合（TTL 切れまで）の上限秒数
+TIMELINE_CACHE_TTL = float(os.getenv("TIMELINE_CACHE_TTL", "30"))
+# 期限切れ後、バックグラウンドで更新しながら古いページを即座に返す秒数
+TIMELINE_STALE_WHILE_REVALIDATE = float(os.getenv("TIMELINE_STALE_WHILE_REVALIDATE", "30"))
+# 期限切れ後、更新が失敗・時間切れしたときに古いページを返してよい秒数
+TIMELINE_STALE_IF_ERROR = float(os.getenv("TIMELINE_STALE_IF_ERROR", "600"))
+
+
+class TimelinePost:
+    __slots__ = (
+        "id",
+        "content",
+        "created_at",
+        "mention_user_ids",
+        "mention_department_ids",
+        "mention_user_names",
+        "mention_department_names",
+        "like_count",
+        "liked_by_me",
+    )
+
+    def __init__(self, id, content, created_at, like_count, liked_by_me):
+        self.id = id
+        self.content = content
+        self.created_at = created_at
+        self.like_count = like_count
+        self.liked_by_me = bool(liked_by_me)
+        self.mention_user_ids = []
+        self.mention_department_ids = []
+        self.mention_user_names = []
+        self.mention_department_names = []
+
+    def copy(self) -> "TimelinePost":
+        """Copy sharing the (read-only) mention id lists, without names."""
+        post = TimelinePost(self.id, self.content, self.created_at, self.like_count, self.liked_by_me)
+        post.mention_user_ids = self.mention_user_ids
+        post.mention_department_ids = self.mention_department_ids
+        return post
+
+
+def _page_query(user_id: int | None):
+    post = models.Post.__table__
+    likes = models.post_likes
+    like_count = (
+        select(func.count())
+        .where(likes.c.post_id == post.c.id)
+        .correlate(post)
+        .scalar_subquery()
+    )
+    if user_id is None:
+        liked_by_me = literal(False)
+    else:
+        liked_by_me = exists().where(
+            likes.c.post_id == post.c.id, likes.c.user_id == user_id
+        )
+    return select(
+        post.c.id, post.c.content, post.c.created_at, like_count, liked_by_me
+    ).where(post.c.is_deleted == False)
+
+
+def _load_mention_ids(db: Session, posts: list[TimelinePost]) -> list[TimelinePost]:
+    if not posts:
+        return posts
+    by_id = {p.id: p for p in posts}
+    pm = models.post_mentions
+    pdm = models.post_department_mentions
+    # 名前は registry から引くため、関連テーブルだけを読みます（JOIN なし）
+    mentions = db.execute(
+        union_all(
+            select(pm.c.post_id, literal(0).label("kind"), pm.c.user_id).where(
+                pm.c.post_id.in_(by_id)
+            ),
+            select(pdm.c.post_id, literal(1).label("kind"), pdm.c.department_id).where(
+                pdm.c.post_id.in_(by_id)
+            ),
+        )
+    ).all()
+    for post_id, kind, target_id in mentions:
+        if kind == 0:
+            by_id[post_id].mention_user_ids.append(target_id)
+        else:
+            by_id[post_id].mention_department_ids.append(target_id)
+    return posts
+
+
+def _resolve_names(db: Session, posts: list[TimelinePost]) -> bool:
+    """Set the mention names; return whether every mentioned user was found."""
+    if not posts:
+        return True
+    user_names = registry.user_mentions.resolve(
+        db, (i for p in posts for i in p.mention_user_ids)
+    )
+    department_names = registry.departments.resolve(
+        db, (i for p in posts for i in p.mention_department_ids)
+    )
+    resolved = True
+    for p in posts:
+        # 古い名前表を使っている間は、新しいユーザーの名前が見つからないことがあります
+        p.mention_user_names = [
+            user_names.get(i, UNKNOWN_USER_NAME) for i in p.mention_user_ids
+        ]
+        resolved = resolved and all(i in user_names for i in p.mention_user_ids)
+        p.mention_department_names = [
+            department_names[i] for i in p.mention_department_ids if department_names.get(i)
+        ]
+    return resolved
+
+
+def _attach_names(db: Session, posts: list[TimelinePost]) -> list[TimelinePost]:
+    _resolve_names(db, posts)
+    return posts
+
+
+def _attach_mentions(db: Session, posts: list[TimelinePost]) -> list[TimelinePost]:
+    return _attach_names(db, _load_mention_ids(db, posts))
+
+
+def _attach_likes(
+    db: Session, posts: list[TimelinePost], user_id: int | None
+) -> list[TimelinePost]:
+    if not posts:
+        return posts
+    likes = models.post_likes
+    if user_id is None:
+        mine = literal(0)
+    else:
+        mine = func.max(case((likes.c.user_id == user_id, 1), else_=0))
+    counts = {
+        post_id: (count, liked)
+        for post_id, count, liked in db.execute(
+            select(likes.c.post_id, func.count(), mine)
+            .where(likes.c.post_id.in_([p.id for p in posts]))
+            .group_by(likes.c.post_id)
+        )
+    }
+    for p in posts:
+        p.like_count, liked = counts.get(p.id, (0, 0))
+        p.liked_by_me = bool(liked)
+    return posts
+
+
+def _timeline_page(db: Session, skip: int, limit: int) -> list[TimelinePost]:
+    post = models.Post.__table__
+    rows = db.execute(
+        _page_query(None)
+        .order_by(post.c.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    return _load_mention_ids(db, [TimelinePost(*row) for row in rows])
+
+
+def _build_page(skip: int, limit: int) -> list[TimelinePost]:
+    # バックグラウンド更新でも使うため、リクエストのセッションとは別に接続します
+    db = database.SessionLocal()
+    try:
+        return _timeline_page(db, skip, limit)
+    finally:
+        db.close()
+
+
+def cached_timeline(
+    db: Session, user_id: int | None = None, skip: int = 0, limit: int = 100
+) -> tuple[list[TimelinePost], cache.Lookup]:
+    """``timeline()`` plus the cache lookup (age and warning of the page)."""
+    page = cache.lookup(
+        TIMELINE_NAMESPACE,
+        f"{skip}:{limit}",
+        lambda: _build_page(skip, limit),
+        ttl=TIMELINE_CACHE_TTL,
+        stale_while_revalidate=TIMELINE_STALE_WHILE_REVALIDATE,
+        stale_if_error=TIMELINE_STALE_IF_ERROR,
+        timeout=cache.REFRESH_TIMEOUT,
+    )
+    # キャッシュされたオブジェクトは共有されるため、コピーにいいね・名前を付けます
+    posts = [p.copy() for p in page.value]
+    try:
+        # ロック中は driver の待ち時間（5秒）ではなく CACHE_REFRESH_TIMEOUT で諦めます
+        with database.lock_timeout(db.connection(), cache.REFRESH_TIMEOUT):
+            _attach_likes(db, posts, user_id)
+    except OperationalError:
+        # ページ作成時のいいね数を返します（liked_by_me は不明のため False）
+        logger.warning("Serving timeline likes from the cached page", exc_info=True)
+        db.rollback()
+        page.warning = cache.REVALIDATION_FAILED_WARNING
+    # 再読み込みできなかった名前表の名前（見つからないユーザーは UNKNOWN_USER_NAME）は古い値です
+    if not _resolve_names(db, posts):
+        page.warning = cache.REVALIDATION_FAILED_WARNING
+    for names in (registry.user_mentions, registry.departments):
+        stale_age = names.stale_age()
+        if stale_age is not None:
+            page.age = max(page.age, stale_age)
+            page.warning = cache.REVALIDATION_FAILED_WARNING
+    return posts, page
+
+
+def timeline(
+    db: Session, user_id: int | None = None, skip: int = 0, limit: int = 100
+) -> list[TimelinePost]:
+    """Latest visible posts; ``user_id`` only sets ``liked_by_me``."""
+    return cached_timeline(db, user_id, skip, limit)[0]
+
+
+def invalidate_timeline() -> None:
+    """Call after committing a change to which posts are visible."""
+    cache.invalidate(TIMELINE_NAMESPACE)
+
+
+def mentioned(
+    db: Session,
+    user_id: int,
+    department_id: int | None = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> list[TimelinePost]:
+    """Visible posts mentioning the user or (if given) their department."""
+    post = models.Post.__table__
+    pm = models.post_mentions
+    pdm = models.post_department_mentions
+    condition = post.c.id.in_(select(pm.c.post_id).where(pm.c.user_id == user_id))
+    if department_id is not None:
+        condition = or_(
+            condition,
+            post.c.id.in_(
+                select(pdm.c.post_id).where(pdm.c.department_id == department_id)
+            ),
+        )
+    rows = db.execute(
+        _page_query(user_id)
+        .where(condition)
+        .order_by(post.c.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    return _attach_mentions(db, [TimelinePost(*row) for row in rows])
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    if value is None:
+        return None
+    # schemas.Post（pydantic）と同じく UTC は "Z" で表します
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def dump_posts(posts: list[TimelinePost]) -> bytes:
+    """JSON body equivalent to ``list[schemas.Post]``."""
+    return json.dumps(
+        [
+            {
+                "content": p.content,
+                "id": p.id,
+                "created_at": _isoformat(p.created_at),
+                "mention_user_ids": p.mention_user_ids,
+                "mention_department_ids": p.mention_department_ids,
+                "mention_user_names": p.mention_user_names,
+                "mention_department_names": p.mention_department_names,
+                "like_count": p.like_count,
+                "liked_by_me": p.liked_by_me,
+            }
+            for p in posts
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
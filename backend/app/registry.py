@@ -0,0 +1,189 @@
+"""In-process name maps for rendering mentions.
+
+Timelines show the names of mentioned users and departments. Both change
+rarely, so instead of joining ``users``/``departments`` (and converting kana)
+for every post, each process keeps an id -> display name map that is loaded
+on first use and rebuilt after it is invalidated:
+
+* ``departments`` - department id -> name (stored normalized to half-width
+  kana, see ``schemas.DepartmentBase``)
+* ``user_mentions`` - user id -> kana name, or ``DELETED_USER_NAME`` for
+  deactivated users
+
+Writers call ``invalidate()`` after committing a change that affects a map
+(department create/rename/delete, CSV import, user deactivation, roster
+sync). It drops the map here and publishes the registry's namespace on
+``app.cachebus``, so other worker processes drop theirs at their next poll;
+every read polls the bus first. Every drop bumps ``version``. An id that is
+missing from a loaded map (e.g. a user created since) triggers one reload.
+
+``derive()`` memoizes values computed from the current map (such as the
+``/departments`` response body and its ETag) until the next invalidation.
+
+The map that was dropped is kept as a fallback (stale-if-error). While one
+exists, reloads run on a ``cache.refresh_executor()`` thread with their own
+session; when a reload fails or takes longer than ``CACHE_REFRESH_TIMEOUT``
+(e.g. SQLite locked by an import), callers get the previous map and
+``stale_age()`` reports how old it is. Explicit invalidations are not
+served stale-while-revalidate, so a rename is visible to the next read.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import cache, cachebus, database, models, responses, schemas, singleflight
+
+logger = logging.getLogger(__name__)
+
+# 退会済みユーザーへのメンションに表示する名前
+DELETED_USER_NAME = "[削除済み]"
+# 名前表にないユーザー（古い名前表で再読み込みできない間の新規ユーザーなど）の表示名
+UNKNOWN_USER_NAME = "[不明]"
+
+
+class NameRegistry:
+    def __init__(self, name: str, loader: Callable[[Session], dict[int, str]]):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._names: dict[int, str] | None = None
+        self._derived: dict[Callable, tuple[dict[int, str], Any]] = {}
+        # 無効化前の表（再読み込みに失敗したときに返します）と無効化された時刻
+        self._stale: dict[int, str] | None = None
+        self._stale_since = 0.0
+        self._flights = singleflight.group(f"registry:{name}")
+        self.version = 0
+        cachebus.subscribe(name, self._drop)
+
+    def _drop(self) -> None:
+        with self._lock:
+            self.version += 1
+            if self._names is not None:
+                self._stale, self._stale_since = self._names, time.time()
+            self._names = None
+            self._derived.clear()
+
+    def reset(self) -> None:
+        """Drop the map and the fallback here; the next read loads inline."""
+        self._drop()
+        with self._lock:
+            self._stale = None
+
+    def invalidate(self) -> None:
+        """Drop the map in this and (via the cache bus) every other process."""
+        cachebus.publish(self.name)
+
+    def _fetch(self, version: int, db: Session | None) -> dict[int, str]:
+        if db is None:
+            # セッション外のオブジェクトから参照された場合・バックグラウンドでの読み込み
+            db = database.SessionLocal()
+            try:
+                names = self._loader(db)
+            finally:
+                db.close()
+        else:
+            names = self._loader(db)
+        with self._lock:
+            # 読み込み中に無効化された場合は保存せず、今回の呼び出しでのみ使います
+            if self.version == version:
+                self._names = names
+                self._stale = None
+        logger.debug("Loaded %s registry (%s entries, v%s)", self.name, len(names), version)
+        return names
+
+    def _load(self, db: Session | None) -> dict[int, str]:
+        with self._lock:
+            version = self.version
+            fallback = self._names if self._names is not None else self._stale
+        if fallback is None:
+            return self._fetch(version, db)
+        future = self._flights.submit(
+            version, lambda: self._fetch(version, None), cache.refresh_executor()
+        )
+        try:
+            return future.result(timeout=cache.REFRESH_TIMEOUT)
+        except Exception:
+            logger.warning("Serving the previous %s registry", self.name, exc_info=True)
+            return fallback
+
+    def stale_age(self) -> float | None:
+        """Seconds since the map being served was invalidated, if it could not be reloaded."""
+        with self._lock:
+            if self._names is None and self._stale is not None:
+                return time.time() - self._stale_since
+        return None
+
+    def names(self, db: Session | None) -> dict[int, str]:
+        cachebus.poll()
+        names = self._names
+        if names is None:
+            names = self._load(db)
+        return names
+
+    def get(self, db: Session | None, key: int | None) -> str | None:
+        """Name for one id (``None`` for ``None`` or an unknown id)."""
+        if key is None:
+            return None
+        cachebus.poll()
+        names = self._names
+        if names is None or key not in names:
+            names = self._load(db)
+        return names.get(key)
+
+    def derive(self, db: Session | None, build: Callable[[dict[int, str]], Any]) -> Any:
+        """``build(names)`` computed once per loaded map."""
+        names = self.names(db)
+        cached = self._derived.get(build)
+        if cached is None or cached[0] is not names:
+            cached = (names, build(names))
+            with self._lock:
+                if self._names is names:
+                    self._derived[build] = cached
+        return cached[1]
+
+    def resolve(self, db: Session, ids: Iterable[int]) -> dict[int, str]:
+        """Map for ``ids``; reloads once if one of them is not known yet."""
+        cachebus.poll()
+        names = self._names
+        if names is None:
+            return self._load(db)
+        if any(i not in names for i in ids):
+            names = self._load(db)
+        return names
+
+
+def _load_departments(db: Session) -> dict[int, str]:
+    return dict(
+        db.execute(
+            select(models.Department.id, models.Department.name).order_by(models.Department.id)
+        ).all()
+    )
+
+
+def _load_user_mentions(db: Session) -> dict[int, str]:
+    return {
+        user_id: name if is_active else DELETED_USER_NAME
+        for user_id, name, is_active in db.execute(
+            select(models.User.id, models.User.name, models.User.is_active)
+        )
+    }
+
+
+departments = NameRegistry("departments", _load_departments)
+user_mentions = NameRegistry("user_mentions", _load_user_mentions)
+
+
+def _departments_payload(names: dict[int, str]) -> tuple[bytes, str]:
+    body = responses.dump_list(
+        schemas.Department, [schemas.Department(id=i, name=n) for i, n in names.items()]
+    )
+    return body, responses.etag_for(body)
+
+
+def departments_payload(db: Session | None) -> tuple[bytes, str]:
+    """``list[schemas.Department]`` JSON body (ordered by id) and its ETag."""
+    return departments.derive(db, _departments_payload)
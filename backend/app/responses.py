@@ -0,0 +1,97 @@
+"""One-pass JSON responses for list endpoints.
+
+Returning a list of models from an endpoint makes FastAPI validate every row
+again against ``response_model``, convert it to Python primitives and only
+then ``json.dumps`` it. ``list_response`` instead serializes the whole list
+straight to bytes with a cached ``TypeAdapter(list[model])`` (pydantic-core),
+using FastAPI's defaults (``by_alias=True``, JSON mode). Endpoints opt in by
+returning it and keep their ``response_model``, so the OpenAPI schema does
+not change::
+
+    @router.get("/", response_model=list[schemas.AdminUser])
+    def list_users(...):
+        return list_response(schemas.AdminUser, [...])
+"""
+import functools
+import hashlib
+from typing import Any, Iterable
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel, TypeAdapter
+
+
+@functools.lru_cache(maxsize=None)
+def list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    """``TypeAdapter(list[model])``, built (and its serializer compiled) once per model."""
+    return TypeAdapter(list[model])
+
+
+def dump_list(
+    model: type[BaseModel], items: Iterable[Any], *, from_attributes: bool = False
+) -> bytes:
+    """Serialize ``items`` as ``list[model]`` JSON.
+
+    ``items`` are expected to be ``model`` instances already. With
+    ``from_attributes=True`` they may be ORM rows (or any objects with the
+    right attributes), which are validated once in bulk before serializing.
+    """
+    adapter = list_adapter(model)
+    if from_attributes:
+        items = adapter.validate_python(items, from_attributes=True)
+    elif not isinstance(items, list):
+        items = list(items)
+    return adapter.dump_json(items, by_alias=True)
+
+
+def list_response(
+    model: type[BaseModel],
+    items: Iterable[Any],
+    *,
+    from_attributes: bool = False,
+    status_code: int = 200,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    return Response(
+        content=dump_list(model, items, from_attributes=from_attributes),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def stale_headers(age: float | None, warning: str | None) -> dict[str, str]:
+    """``Age``/``Warning`` for a body served from a stale cache entry (else empty)."""
+    if warning is None or age is None:
+        return {}
+    return {"Age": str(int(age)), "Warning": warning}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """``If-None-Match`` の照合（RFC 9110 の弱い比較。カンマ区切りと ``*`` に対応）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def etag_response(
+    request: Request,
+    body: bytes,
+    etag: str,
+    cache_control: str,
+    headers: dict[str, str] | None = None,
+) -> Response:
+    """JSON ``body`` with ``ETag``/``Cache-Control``; 304 when ``If-None-Match`` matches."""
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,23 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Response
 from sqlalchemy.orm import Session
 
-from ... import crud, schemas
+from ... import crud, registry, schemas
 from ...dependencies import get_db, require_admin
+from ...querybudget import query_budget
+from ...responses import etag_response
 
 
 router = APIRouter(prefix="/admin/departments", tags=["admin"])
 
 
 @router.get("/", response_model=list[schemas.Department])
+@query_budget(2)
 def list_departments(
+    request: Request,
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
 ):
     """Return all departments."""
-    return crud.get_departments(db)
+    body, etag = registry.departments_payload(db)
+    # 管理画面では毎回再検証させます（変更がなければ 304）
+    return etag_response(request, body, etag, "private, no-cache")
 
 
 @router.post("/", response_model=schemas.Department, status_code=status.HTTP_201_CREATED)
+@query_budget(4)
 def create_department(
     department: schemas.DepartmentCreate,
     db: Session = Depends(get_db),
@@ -27,6 +34,7 @@ def create_department(
 
 
 @router.put("/{dept_id}", response_model=schemas.Department)
+@query_budget(4)
 def update_department(
     dept_id: int,
     department: schemas.DepartmentCreate,
@@ -40,6 +48,8 @@ def update_department(
 
 
 @router.delete("/{dept_id}", status_code=status.HTTP_204_NO_CONTENT)
+# 認証 + 部署 + 参照チェック（ユーザー・投稿）+ DELETE
+@query_budget(5)
 def delete_department(
     dept_id: int,
     db: Session = Depends(get_db),
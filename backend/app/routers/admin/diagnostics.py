@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import FileResponse
+
+from ... import cache, profiling, schemas, slowquery
+from ...dependencies import require_admin
+from ...querybudget import query_budget
+
+
+router = APIRouter(prefix="/admin/diagnostics", tags=["admin"])
+
+
+@router.get("/slow-queries", response_model=list[schemas.SlowQuery])
+@query_budget(1)
+def list_slow_queries(_: schemas.User = Depends(require_admin)):
+    """Return recorded slow queries of this worker, newest first."""
+    return slowquery.records()
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(1)
+def clear_slow_queries(_: schemas.User = Depends(require_admin)):
+    slowquery.clear()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/profiles", response_model=list[schemas.ProfileArtifact])
+@query_budget(1)
+def list_profiles(_: schemas.User = Depends(require_admin)):
+    """List stored request profiles, newest first."""
+    return profiling.list_artifacts()
+
+
+@router.get("/profiles/{profile_id}")
+@query_budget(1)
+def download_profile(profile_id: str, _: schemas.User = Depends(require_admin)):
+    """Download a profile (zip of collapsed stacks and executed SQL)."""
+    path = profiling.artifact_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(
+        path, media_type="application/zip", filename=f"profile-{profile_id}.zip"
+    )
+
+
+@router.get("/cache", response_model=schemas.CacheStats)
+@query_budget(1)
+def read_cache_stats(_: schemas.User = Depends(require_admin)):
+    """Cache and single-flight counters of this worker."""
+    return cache.stats()
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from ... import jobs, schemas
+from ...dependencies import require_admin
+from ...querybudget import query_budget
+
+
+router = APIRouter(prefix="/admin/jobs", tags=["admin"])
+
+
+@router.get("/", response_model=list[schemas.JobStatus])
+@query_budget(1)
+def list_jobs(_: schemas.User = Depends(require_admin)):
+    """Return recent background jobs, newest first."""
+    return jobs.manager.list()
+
+
+@router.get("/{job_id}", response_model=schemas.JobStatus)
+@query_budget(1)
+def get_job(job_id: str, _: schemas.User = Depends(require_admin)):
+    """Report progress, errors so far and throughput of a job."""
+    job = jobs.manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.delete("/{job_id}", response_model=schemas.JobStatus)
+@query_budget(1)
+def cancel_job(job_id: str, _: schemas.User = Depends(require_admin)):
+    """Request cancellation; a running import is rolled back."""
+    job = jobs.manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -3,12 +3,15 @@ from sqlalchemy.orm import Session
 
 from ... import crud, schemas
 from ...dependencies import get_db, require_admin
+from ...querybudget import query_budget
+from ...responses import list_response
 
 
 router = APIRouter(prefix="/admin/posts", tags=["admin"])
 
 
 @router.get("/", response_model=list[schemas.AdminPost])
+@query_budget(3)
 def list_posts(
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
@@ -31,7 +34,7 @@ def list_posts(
                 content=p.content,
                 created_at=p.created_at,
                 author_name=p.author.name if p.author else None,
-                department_name=p.author.department.name if p.author and p.author.department else None,
+                department_name=p.author.department_name if p.author else None,
                 mention_user_ids=p.mention_user_ids,
                 mention_department_ids=p.mention_department_ids,
                 mention_user_names=p.mention_user_names,
@@ -40,10 +43,11 @@ def list_posts(
                 status=p.report_status,
             )
         )
-    return result
+    return list_response(schemas.AdminPost, result)
 
 
 @router.get("/deleted", response_model=list[schemas.AdminPost])
+@query_budget(3)
 def list_deleted_posts(
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
@@ -66,7 +70,7 @@ def list_deleted_posts(
                 content=p.content,
                 created_at=p.created_at,
                 author_name=p.author.name if p.author else None,
-                department_name=p.author.department.name if p.author and p.author.department else None,
+                department_name=p.author.department_name if p.author else None,
                 mention_user_ids=p.mention_user_ids,
                 mention_department_ids=p.mention_department_ids,
                 mention_user_names=p.mention_user_names,
@@ -75,10 +79,11 @@ def list_deleted_posts(
                 status=p.report_status,
             )
         )
-    return result
+    return list_response(schemas.AdminPost, result)
 
 
 @router.delete("/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(10)
 def delete_post(
     post_id: int,
     db: Session = Depends(get_db),
@@ -3,11 +3,14 @@ from sqlalchemy.orm import Session
 
 from ... import crud, schemas, models
 from ...dependencies import get_db, require_admin
+from ...querybudget import query_budget
+from ...responses import list_response
 
 router = APIRouter(prefix="/admin/reports", tags=["admin"])
 
 
 @router.get("/", response_model=list[schemas.AdminPost])
+@query_budget(3)
 def list_reports(
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
@@ -30,18 +33,17 @@ def list_reports(
                 content=p.content,
                 created_at=p.created_at,
                 author_name=p.author.name if p.author else None,
-                department_name=(
-                    p.author.department.name if p.author and p.author.department else None
-                ),
+                department_name=p.author.department_name if p.author else None,
                 mention_user_ids=p.mention_user_ids,
                 reports=reports,
                 status=p.report_status,
             )
         )
-    return result
+    return list_response(schemas.AdminPost, result)
 
 
 @router.patch("/{report_id}", response_model=schemas.AdminReport)
+@query_budget(4)
 def update_report(
     report_id: int,
     body: schemas.ReportStatusUpdate,
@@ -1,22 +1,52 @@
-from fastapi import APIRouter, Depends, UploadFile, File
+from fastapi import APIRouter, Depends, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, Response
+import codecs
 import csv
 import io
-import jaconv
+import os
+import tempfile
 from datetime import datetime, timezone, timedelta
+from typing import BinaryIO, Literal
 
-from ...utils import normalize_to_utc
-
-from ... import models, schemas, crud
+from ... import schemas, crud, importer, jobs
+from ...database import SessionLocal
 from ...dependencies import get_db, require_admin
+from ...responses import list_response
+from ...querybudget import query_budget
 
 
 router = APIRouter(prefix="/admin/users", tags=["admin"])
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _to_admin_user(
+    u, now: datetime, window_count: int | None = None
+) -> schemas.AdminUser:
+    logged_in = False
+    if u.last_seen:
+        logged_in = now - u.last_seen <= timedelta(minutes=5)
+    return schemas.AdminUser(
+        id=u.id,
+        employee_id=u.employee_id,
+        display_name=u.display_name,
+        kana_name=u.name,
+        department_name=u.department_name,
+        is_admin=u.is_admin,
+        is_active=u.is_active,
+        is_logged_in=logged_in,
+        appreciated_count=u.appreciated_count,
+        expressed_count=u.expressed_count,
+        likes_received=u.likes_received,
+        window_count=window_count,
+    )
+
 
 @router.get("/", response_model=list[schemas.AdminUser])
+@query_budget(3)
 def list_users(
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
@@ -24,38 +54,25 @@ def list_users(
     """List all registered users with login status."""
     users = crud.get_users(db)
     now = datetime.now(timezone.utc)
-    result: list[schemas.AdminUser] = []
-    for u in users:
-        logged_in = False
-        if u.last_seen:
-            last_seen = normalize_to_utc(u.last_seen)
-            logged_in = now - last_seen <= timedelta(minutes=5)
-        result.append(
-            schemas.AdminUser(
-                id=u.id,
-                employee_id=u.employee_id,
-                display_name=u.display_name,
-                kana_name=u.name,
-                department_name=u.department_name,
-                is_admin=u.is_admin,
-                is_active=u.is_active,
-                is_logged_in=logged_in,
-                appreciated_count=u.appreciated_count,
-                expressed_count=u.expressed_count,
-                likes_received=u.likes_received,
-            )
-        )
-    return result
+    return list_response(schemas.AdminUser, [_to_admin_user(u, now) for u in users])
 
 
 @router.get("/top/{counter}", response_model=list[schemas.AdminUser])
+@query_budget(3)
 def top_users(
     counter: str,
     limit: int = 10,
+    window: str | None = Query(None, pattern=r"^[1-9][0-9]*d$"),
+    department_id: int | None = None,
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
 ):
-    """Return top users ranked by a specific counter."""
+    """Return top users ranked by a specific counter.
+
+    Without ``window`` the all-time counters are used. With ``window=7d``
+    (any number of days) users are ranked by the daily rollups of that
+    period and ``window_count`` holds their total for the window.
+    """
     field_map = {
         "appreciated": "appreciated_count",
         "expressed": "expressed_count",
@@ -64,33 +81,22 @@ def top_users(
     field = field_map.get(counter)
     if not field:
         raise HTTPException(status_code=400, detail="Invalid counter")
-    users = crud.get_top_users(db, field, limit)
     now = datetime.now(timezone.utc)
-    result: list[schemas.AdminUser] = []
-    for u in users:
-        logged_in = False
-        if u.last_seen:
-            last_seen = normalize_to_utc(u.last_seen)
-            logged_in = now - last_seen <= timedelta(minutes=5)
-        result.append(
-            schemas.AdminUser(
-                id=u.id,
-                employee_id=u.employee_id,
-                display_name=u.display_name,
-                kana_name=u.name,
-                department_name=u.department_name,
-                is_admin=u.is_admin,
-                is_active=u.is_active,
-                is_logged_in=logged_in,
-                appreciated_count=u.appreciated_count,
-                expressed_count=u.expressed_count,
-                likes_received=u.likes_received,
-            )
-        )
-    return result
+    if window is None:
+        users = crud.get_top_users(db, field, limit, department_id=department_id)
+        return list_response(schemas.AdminUser, [_to_admin_user(u, now) for u in users])
+    days = int(window[:-1])
+    ranked = crud.get_top_users_in_window(
+        db, field, days, limit, department_id=department_id
+    )
+    return list_response(
+        schemas.AdminUser,
+        [_to_admin_user(u, now, window_count=total) for u, total in ranked],
+    )
 
 
 @router.get("/export")
+@query_budget(3)
 def export_users(
     db: Session = Depends(get_db),
     _: schemas.User = Depends(require_admin),
@@ -133,6 +139,7 @@ def export_users(
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@query_budget(3)
 def delete_user(
     user_id: int,
     db: Session = Depends(get_db),
@@ -145,72 +152,95 @@ def delete_user(
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
-@router.post("/import")
-async def import_users(
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    _: schemas.User = Depends(require_admin),
-):
-    """Import users from a CSV file."""
-    content = await file.read()
+def _run_import(
+    job: jobs.Job, path: str, mode: str, dry_run: bool, force: bool = False
+) -> dict:
+    """Parse the spooled CSV incrementally and import or sync it in batches.
+
+    The file is removed by the job's cleanup hook, which also runs when the
+    job is cancelled before it starts.
+    """
+    db = SessionLocal()
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if mode == "sync":
+                return importer.sync_users(
+                    db, reader, dry_run=dry_run, on_batch=job.report_progress, force=force
+                )
+            return importer.import_users(db, reader, on_batch=job.report_progress)
+    finally:
+        db.close()
+
+
+def _remove(path: str) -> None:
     try:
-        csv_content = content.decode("utf-8")
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _spool(source: BinaryIO) -> str:
+    """Copy the upload to a temp file, checking that it is valid UTF-8.
+
+    The file is removed again on every error (bad encoding or headers, a
+    malformed CSV, a failing read).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=".csv")
+    spooled = False
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                decoder.decode(chunk)
+                out.write(chunk)
+            decoder.decode(b"", final=True)
+        with open(path, newline="", encoding="utf-8") as f:
+            fieldnames = csv.DictReader(f).fieldnames
+        if not fieldnames or not importer.REQUIRED_FIELDS.issubset(fieldnames):
+            raise HTTPException(status_code=400, detail="Invalid CSV headers")
+        spooled = True
+        return path
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
-    csv_file = io.StringIO(csv_content)
-    reader = csv.DictReader(csv_file)
-
-    required_fields = {"user_id", "name", "department", "email"}
-    if not reader.fieldnames or not required_fields.issubset(reader.fieldnames):
-        raise HTTPException(status_code=400, detail="Invalid CSV headers")
-
-    added = 0
-    skipped = 0
-    errors: list[str] = []
-    for row in reader:
-        user_id = (row.get("user_id") or "").strip()
-        name = (row.get("name") or "").strip()
-        display_name = (row.get("display_name") or "").strip()
-        if not display_name:
-            display_name = name
-        department_name = (row.get("department") or "").strip()
-        email = (row.get("email") or "").strip()
-
-        if not user_id or not name or not department_name or not email:
-            skipped += 1
-            continue
-
-        existing = crud.get_user_by_employee_id(db, user_id)
-        if existing:
-            normalized_name = jaconv.z2h(name, kana=True, ascii=False, digit=False)
-            if existing.name == normalized_name:
-                skipped += 1
-            else:
-                errors.append(
-                    f"ID {user_id} already exists with kana '{existing.name}' but CSV has '{normalized_name}'"
-                )
-                skipped += 1
-            continue
+    except csv.Error:
+        raise HTTPException(status_code=400, detail="Invalid CSV file")
+    finally:
+        if not spooled:
+            _remove(path)
 
-        dept = (
-            db.query(models.Department)
-            .filter(models.Department.name == department_name)
-            .first()
-        )
-        if not dept:
-            dept = models.Department(name=department_name)
-            db.add(dept)
-            db.commit()
-            db.refresh(dept)
-
-        user_in = schemas.UserCreate(
-            employee_id=user_id,
-            name=name,
-            display_name=display_name,
-            password=user_id,
-            department_id=dept.id,
-        )
-        crud.create_user(db, user_in)
-        added += 1
 
-    return {"added": added, "skipped": skipped, "errors": errors}
+async def _spool_upload(file: UploadFile) -> str:
+    # ファイル入出力でイベントループを止めないよう、スレッドプールで書き出します
+    return await run_in_threadpool(_spool, file.file)
+
+
+@router.post(
+    "/import",
+    response_model=schemas.JobStatus,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+@query_budget(1)
+async def import_users(
+    file: UploadFile = File(...),
+    mode: Literal["add", "sync"] = "add",
+    dry_run: bool = False,
+    force: bool = False,
+    _: schemas.User = Depends(require_admin),
+):
+    """Queue a CSV user import; poll ``/admin/jobs/{id}`` for its progress.
+
+    ``mode=add`` only adds new users. ``mode=sync`` treats the file as the full
+    HR roster and also applies renames, department moves and deactivations;
+    combine it with ``dry_run=true`` to preview the changes. A sync of an
+    empty roster or one that deactivates many users fails unless
+    ``force=true``.
+    """
+    if (dry_run or force) and mode != "sync":
+        raise HTTPException(status_code=400, detail="dry_run and force require mode=sync")
+    path = await _spool_upload(file)
+    kind = "user_sync" if mode == "sync" else "user_import"
+    job = jobs.manager.submit(
+        kind, _run_import, path, mode, dry_run, force, cleanup=lambda: _remove(path)
+    )
+    return job
@@ -1,8 +1,9 @@
 from pydantic import BaseModel, constr, field_validator, Field, ConfigDict
 from enum import Enum
-import jaconv
 from datetime import datetime
-from typing import Optional
+from typing import Any, Literal, Optional
+
+from .utils import to_halfwidth_kana
 
 # --- Post Schemas ---
 
@@ -40,6 +41,28 @@ class Post(PostBase):
         from_attributes = True
 
 
+class PostEngagement(BaseModel):
+    post_id: int
+    like_count: int = 0
+    liked_by_me: bool = False
+
+
+# 「いいね」の一括操作（オフライン端末からの再送用）
+class LikeOperation(BaseModel):
+    post_id: int
+    action: Literal["like", "unlike"]
+
+
+class LikeBatch(BaseModel):
+    operations: list[LikeOperation] = Field(..., min_length=1, max_length=500)
+
+
+class LikeOperationResult(BaseModel):
+    post_id: int
+    action: Literal["like", "unlike"]
+    status: Literal["applied", "unchanged", "superseded", "not_found"]
+
+
 # --- User Schemas ---
 
 
@@ -55,7 +78,7 @@ class UserBase(BaseModel):
     def normalize_name(cls, v: str) -> str:
         if v is None:
             return v
-        return jaconv.z2h(v, kana=True, ascii=False, digit=False)
+        return to_halfwidth_kana(v)
 
 
 # ユーザーを作成する際に受け取るデータ型（パスワードを含む）
@@ -75,7 +98,7 @@ class UserUpdate(BaseModel):
     def normalize_name(cls, v: str) -> str | None:
         if v is None:
             return v
-        return jaconv.z2h(v, kana=True, ascii=False, digit=False)
+        return to_halfwidth_kana(v)
 
 
 # API経由で返すユーザーのデータ型（パスワードは含めない）
@@ -116,6 +139,8 @@ class AdminUser(BaseModel):
     appreciated_count: int = 0
     expressed_count: int = 0
     likes_received: int = 0
+    # Total of the ranked counter within the requested window (top users only)
+    window_count: Optional[int] = None
 
     model_config = ConfigDict(from_attributes=True, populate_by_name=True)
 
@@ -131,7 +156,7 @@ class DepartmentBase(BaseModel):
     def normalize_name(cls, v: str) -> str:
         if v is None:
             return v
-        return jaconv.z2h(v, kana=True, ascii=False, digit=False)
+        return to_halfwidth_kana(v)
 
 
 class DepartmentCreate(DepartmentBase):
@@ -239,3 +264,65 @@ class ReportForPost(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# --- Job Schemas ---
+
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    rows_processed: int = 0
+    rows_per_second: float = 0.0
+    errors: list[str] = []
+    result: Optional[dict] = None
+
+    class Config:
+        from_attributes = True
+
+
+# --- Diagnostics Schemas ---
+
+
+class SlowQuery(BaseModel):
+    statement: str
+    parameters: Any = None
+    duration_ms: float
+    route: str
+    plan: list[str] = []
+    recorded_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class CacheNamespaceStats(BaseModel):
+    hits: int
+    misses: int
+    sets: int
+    evictions: int
+    invalidations: int
+    stale: int = 0
+
+
+class SingleFlightStats(BaseModel):
+    executions: int
+    coalesced: int
+    in_flight: int
+
+
+class CacheStats(BaseModel):
+    backend: str
+    entries: Optional[int] = None
+    namespaces: dict[str, CacheNamespaceStats]
+    flights: dict[str, SingleFlightStats] = {}
+
+
+class ProfileArtifact(BaseModel):
+    id: str
+    size_bytes: int
+    created_at: datetime
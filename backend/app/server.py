@@ -0,0 +1,88 @@
+"""Production entry point: ``python -m app.server``.
+
+Runs uvicorn with ``WEB_CONCURRENCY`` worker processes on uvloop/httptools.
+Schema creation and initial data seeding run once here, in the master
+process, before the workers start; the workers are told to skip their own
+startup seeding. On SIGTERM/SIGINT uvicorn stops accepting connections,
+finishes in-flight requests and runs the app's shutdown handler, which waits
+for background jobs (see ``JobManager.drain``).
+
+Settings (environment variables):
+
+* ``WEB_CONCURRENCY`` - worker processes (default: CPU count, at most 4)
+* ``HOST`` / ``PORT`` - bind address (default ``0.0.0.0:8000``)
+* ``KEEP_ALIVE`` - idle keep-alive timeout in seconds (default 65, longer
+  than the usual 60s of a fronting load balancer)
+* ``BACKLOG`` - listen backlog (default 2048)
+* ``GRACEFUL_TIMEOUT`` - seconds to finish requests on shutdown (default 30)
+* ``FORWARDED_ALLOW_IPS`` - proxies trusted for X-Forwarded-* (default 127.0.0.1)
+* ``APP_PRESTART`` - set to ``0`` to skip the schema/seed step
+"""
+import importlib.util
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def _default_workers() -> int:
+    return min(4, os.cpu_count() or 1)
+
+
+def settings() -> dict:
+    """uvicorn keyword arguments derived from the environment."""
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    has_httptools = importlib.util.find_spec("httptools") is not None
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "8000")),
+        "workers": int(os.getenv("WEB_CONCURRENCY", "0")) or _default_workers(),
+        "loop": "uvloop" if has_uvloop else "asyncio",
+        "http": "httptools" if has_httptools else "h11",
+        "timeout_keep_alive": int(os.getenv("KEEP_ALIVE", "65")),
+        "backlog": int(os.getenv("BACKLOG", "2048")),
+        "timeout_graceful_shutdown": int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "access_log": os.getenv("ACCESS_LOG", "0") == "1",
+    }
+
+
+def prestart() -> None:
+    """Create tables and seed initial data once, before any worker starts."""
+    from . import bootstrap
+    from .database import SessionLocal, engine
+
+    bootstrap.init_db(engine)
+    db = SessionLocal()
+    try:
+        bootstrap.seed(db)
+    finally:
+        db.close()
+    # マスターで使った接続はワーカーに引き継がないよう閉じておきます
+    engine.dispose()
+    # ワーカープロセスは環境変数を引き継ぐので、起動時の初期データ登録を省略させます
+    os.environ[bootstrap.SKIP_STARTUP_SEED_ENV] = "1"
+
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    options = settings()
+    if os.getenv("APP_PRESTART", "1") == "1":
+        prestart()
+    logger.info(
+        "Starting %s workers (loop=%s, http=%s)",
+        options["workers"],
+        options["loop"],
+        options["http"],
+    )
+    uvicorn.run("app.main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
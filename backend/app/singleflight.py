@@ -0,0 +1,136 @@
+"""Coalesce identical concurrent computations ("single flight").
+
+When many requests miss the same cache entry at once (e.g. every client
+reloading the timeline right after a new post), only the first caller runs
+the computation; the others wait for it and share its result or exception::
+
+    flights = singleflight.group("timeline")
+    page = flights.do(key, lambda: build_page(db))            # sync handlers
+    page = await flights.do_async(key, lambda: build(...))    # async handlers
+    future = flights.submit(key, build_page, executor)        # in the background
+
+The key must identify everything the result depends on (endpoint, params
+and data version); a call that starts after the computation finished runs
+again. Flights are shared between threads and event loops of one process,
+since both wait on the same ``concurrent.futures.Future``.
+
+Coalesced callers are counted in ``singleflight_coalesced_total`` and in
+``Group.stats()``.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from . import metrics
+
+T = TypeVar("T")
+
+
+class Group:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights: dict[Hashable, Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """Return the flight for ``key`` and whether the caller has to run it."""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.coalesced += 1
+                metrics.SINGLEFLIGHT_COALESCED.inc(group=self.name)
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            self.executions += 1
+        metrics.SINGLEFLIGHT_EXECUTIONS.inc(group=self.name)
+        return future, True
+
+    def _land(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """Run ``fn()`` once for concurrent callers with the same ``key``."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._land(key, future)
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """``do()`` for coroutines; waiting does not block the event loop."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._land(key, future)
+
+    def submit(self, key: Hashable, fn: Callable[[], T], executor: Executor) -> Future:
+        """Start ``fn()`` on ``executor`` unless it is in flight; return the shared future.
+
+        Callers decide how long to wait, e.g. ``future.result(timeout)``.
+        """
+        future, leader = self._join(key)
+        if leader:
+
+            def run():
+                try:
+                    result = fn()
+                except BaseException as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+                finally:
+                    self._land(key, future)
+
+            executor.submit(run)
+        return future
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight(),
+        }
+
+
+_groups: dict[str, Group] = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str) -> Group:
+    """The process-wide ``Group`` called ``name``."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = Group(name)
+        return _groups[name]
+
+
+def stats() -> dict[str, dict[str, Any]]:
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {g.name: g.stats() for g in groups}
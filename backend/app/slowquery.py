@@ -0,0 +1,135 @@
+"""Opt-in slow-query log with automatic EXPLAIN capture.
+
+Set ``SLOW_QUERY_MS`` to record statements that take at least that many
+milliseconds. Each record keeps the SQL, its bound parameters (strings and
+bytes redacted to their length), the originating route and, for SELECTs,
+the plan from ``EXPLAIN QUERY PLAN`` (SQLite) or ``EXPLAIN`` (PostgreSQL).
+Records live in a bounded in-memory ring buffer per worker process and are
+listed at ``/admin/diagnostics/slow-queries``.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 未設定なら無効（計測のオーバーヘッドもかかりません）
+THRESHOLD_MS: float | None = (
+    float(os.environ["SLOW_QUERY_MS"]) if os.getenv("SLOW_QUERY_MS") else None
+)
+
+# 保持する記録の上限（古いものから捨てます）
+BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER", "200"))
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: object
+    duration_ms: float
+    route: str
+    plan: list[str] = field(default_factory=list)
+    recorded_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+_records: deque[SlowQuery] = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+
+
+def records() -> list[SlowQuery]:
+    """Recorded slow queries, newest first."""
+    with _lock:
+        return list(reversed(_records))
+
+
+def clear() -> None:
+    with _lock:
+        _records.clear()
+
+
+def redact(parameters):
+    """Replace string/bytes values with their length so no user data is kept."""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if isinstance(parameters, str):
+        return f"<str len={len(parameters)}>"
+    if isinstance(parameters, (bytes, bytearray, memoryview)):
+        return f"<bytes len={len(parameters)}>"
+    if parameters is None or isinstance(parameters, (bool, int, float)):
+        return parameters
+    return str(parameters)
+
+
+def _explain(conn, cursor, statement: str, parameters) -> list[str]:
+    if conn.dialect.name == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    elif conn.dialect.name == "postgresql":
+        prefix = "EXPLAIN "
+    else:
+        return []
+    # 元のカーソルは結果を読み出し中のため、生のDBAPI接続に別カーソルを開きます
+    # （エンジンのイベントを通らないので、この EXPLAIN 自体は記録されません）
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        rows = explain_cursor.fetchall()
+    except Exception as exc:
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        explain_cursor.close()
+    if conn.dialect.name == "sqlite":
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._slow_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    threshold = THRESHOLD_MS
+    if threshold is None:
+        return
+    duration_ms = (time.perf_counter() - context._slow_query_start) * 1000
+    if duration_ms < threshold:
+        return
+    plan = []
+    if not executemany and statement.lstrip()[:6].upper() == "SELECT":
+        plan = _explain(conn, cursor, statement, parameters)
+    record = SlowQuery(
+        statement=statement,
+        parameters=redact(parameters),
+        duration_ms=round(duration_ms, 3),
+        route=metrics.current_route(),
+        plan=plan,
+    )
+    with _lock:
+        _records.append(record)
+    logger.warning(
+        "Slow query (%.1f ms) on %s: %s | plan: %s",
+        duration_ms,
+        record.route,
+        " ".join(statement.split())[:500],
+        "; ".join(plan),
+    )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach the recorder to ``engine`` if ``SLOW_QUERY_MS`` is configured."""
+    if THRESHOLD_MS is None:
+        return
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
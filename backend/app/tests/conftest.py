@@ -1,24 +1,40 @@
+import atexit
 import os
+import shutil
+import tempfile
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 from .. import database
 
 # Ensure environment variables are set before any application modules are imported
 os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
 os.environ.setdefault("SECRET_KEY", "test-secret")
+# Endpoints that exceed their declared SQL budget fail the test instead of logging
+os.environ.setdefault("QUERY_BUDGET_STRICT", "1")
 
-# Override database engine with in-memory SQLite that persists for the whole session
+# Override database engine with a temporary SQLite file that persists for the whole session.
+# A file (rather than a single shared in-memory connection) gives background job
+# threads their own connections, as in production.
+TEST_DB_DIR = tempfile.mkdtemp(prefix="musatoku-test-")
+TEST_DB_PATH = os.path.join(TEST_DB_DIR, "test.db")
 engine = create_engine(
-    "sqlite:///:memory:",
+    f"sqlite:///{TEST_DB_PATH}",
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 database.engine = engine
 database.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 database.Base.metadata.create_all(bind=engine)
 
+
+def _remove_test_db():
+    engine.dispose()
+    shutil.rmtree(TEST_DB_DIR, ignore_errors=True)
+
+
+# テスト終了時（バックグラウンドのスレッドが止まった後）にDBファイルを削除します
+atexit.register(_remove_test_db)
+
 @pytest.fixture(autouse=True)
 def apply_test_env(monkeypatch):
     monkeypatch.setenv("DATABASE_URL", "sqlite:///:memory:")
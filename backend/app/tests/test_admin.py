@@ -1,8 +1,9 @@
 from fastapi.testclient import TestClient
 from ..main import app
 from ..database import SessionLocal
-from .. import crud, schemas, models
+from .. import crud, schemas, models, importer, auth, jobs
 import jaconv
+import pytest
 import uuid
 
 
@@ -12,6 +13,15 @@ def _get_admin_token(client: TestClient) -> str:
     return resp.json()["access_token"]
 
 
+def _wait_for_job(client: TestClient, token: str, job_id: str) -> dict:
+    jobs.manager.wait(job_id, timeout=60)
+    resp = client.get(
+        f"/admin/jobs/{job_id}", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert resp.status_code == 200
+    return resp.json()
+
+
 def test_admin_delete_user():
     with TestClient(app) as client:
         token = _get_admin_token(client)
@@ -131,8 +141,11 @@ def test_import_users():
             files=files,
             headers={"Authorization": f"Bearer {token}"},
         )
-        assert resp.status_code == 200
-        result = resp.json()
+        assert resp.status_code == 202
+        job = _wait_for_job(client, token, resp.json()["id"])
+        assert job["status"] == "succeeded"
+        assert job["rows_processed"] == 3
+        result = job["result"]
         assert result["added"] == 1
         assert result["skipped"] == 2
 
@@ -158,8 +171,10 @@ def test_import_users_conflicting_name():
             files=files,
             headers={"Authorization": f"Bearer {token}"},
         )
-        assert resp.status_code == 200
-        result = resp.json()
+        assert resp.status_code == 202
+        job = _wait_for_job(client, token, resp.json()["id"])
+        assert job["errors"]
+        result = job["result"]
         assert result["added"] == 0
         assert result["skipped"] == 1
         assert result["errors"]
@@ -255,3 +270,266 @@ def test_admin_users_include_counts():
         assert "appreciated_count" in sample
         assert "expressed_count" in sample
         assert "likes_received" in sample
+
+
+def test_import_users_bulk_duplicates_and_inactive():
+    """Duplicate rows in one file and retired users are skipped, not re-created"""
+    db = SessionLocal()
+    retired_id = "ret" + str(uuid.uuid4())[:8]
+    retired = crud.create_user(
+        db,
+        schemas.UserCreate(
+            employee_id=retired_id,
+            name="Retired",
+            display_name="Retired",
+            password="pass",
+            department_id=2,
+        ),
+    )
+    crud.deactivate_user(db, retired.id)
+    db.close()
+
+    new_id = "bulk" + str(uuid.uuid4())[:8]
+    rows = [
+        {"user_id": new_id, "name": "ｶﾅ", "department": "BulkDept", "email": "a@example.com"},
+        {"user_id": new_id, "name": "ﾍﾞﾂ", "department": "BulkDept", "email": "b@example.com"},
+        {"user_id": retired_id, "name": "Retired", "department": "BulkDept", "email": "c@example.com"},
+    ]
+    db = SessionLocal()
+    result = importer.import_users(db, rows)
+    db.close()
+    assert result["added"] == 1
+    assert result["skipped"] == 2
+    assert len(result["errors"]) == 1
+    assert new_id in result["errors"][0]
+
+
+def test_import_users_rolls_back_on_failure(monkeypatch):
+    """A failure mid-import must not leave earlier batches behind"""
+    ids = ["rb" + str(uuid.uuid4())[:8] for _ in range(3)]
+    rows = [
+        {"user_id": i, "name": "kana", "department": "RollbackDept", "email": "r@example.com"}
+        for i in ids
+    ]
+    calls = {"n": 0}
+
+    def failing_hash(password: str) -> str:
+        calls["n"] += 1
+        if calls["n"] > 2:
+            raise RuntimeError("hash failure")
+        return "hashed"
+
+    monkeypatch.setattr(importer.auth, "get_password_hash", failing_hash)
+    db = SessionLocal()
+    try:
+        importer.import_users(db, rows, batch_size=2)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("import should have failed")
+    finally:
+        db.close()
+
+    db = SessionLocal()
+    assert (
+        db.query(models.User).filter(models.User.employee_id.in_(ids)).count() == 0
+    )
+    assert (
+        db.query(models.Department)
+        .filter(models.Department.name == "RollbackDept")
+        .first()
+        is None
+    )
+    db.close()
+
+
+def test_import_users_parallel_hashing(monkeypatch):
+    """Large batches are hashed on the process pool"""
+    monkeypatch.setattr(importer, "HASH_WORKERS", 2)
+    monkeypatch.setattr(importer, "PARALLEL_HASH_THRESHOLD", 2)
+    ids = ["ph" + str(uuid.uuid4())[:8] for _ in range(3)]
+    rows = [
+        {"user_id": i, "name": "kana", "department": "ParallelDept", "email": "p@example.com"}
+        for i in ids
+    ]
+    db = SessionLocal()
+    result = importer.import_users(db, rows)
+    db.close()
+    assert result == {"added": 3, "skipped": 0, "errors": []}
+
+    db = SessionLocal()
+    user = crud.get_user_by_employee_id(db, ids[0])
+    assert auth.verify_password(ids[0], user.hashed_password)
+    db.close()
+
+
+def _roster_csv(overrides: dict[str, tuple[str, str, str]], drop: set[str]) -> str:
+    """Build a full roster from current active users, applying overrides."""
+    db = SessionLocal()
+    users = (
+        db.query(models.User)
+        .filter(models.User.is_active == True, models.User.is_admin == False)
+        .all()
+    )
+    lines = ["user_id,name,display_name,department,email"]
+    for u in users:
+        if u.employee_id in drop:
+            continue
+        name, display_name, dept = overrides.pop(
+            u.employee_id, (u.name, u.display_name, u.department.name)
+        )
+        lines.append(f"{u.employee_id},{name},{display_name},{dept},x@example.com")
+    db.close()
+    for employee_id, (name, display_name, dept) in overrides.items():
+        lines.append(f"{employee_id},{name},{display_name},{dept},x@example.com")
+    return "\n".join(lines) + "\n"
+
+
+def test_sync_users_dry_run_and_apply():
+    with TestClient(app) as client:
+        token = _get_admin_token(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        db = SessionLocal()
+        suffix = str(uuid.uuid4())[:8]
+        ids = {key: f"sync{key}{suffix}" for key in ("rename", "move", "leave")}
+        for employee_id in ids.values():
+            crud.create_user(
+                db,
+                schemas.UserCreate(
+                    employee_id=employee_id,
+                    name="ｼﾝｸ",
+                    display_name="Sync",
+                    password="pass",
+                    department_id=2,
+                ),
+            )
+        db.close()
+        new_id = f"syncnew{suffix}"
+        csv_data = _roster_csv(
+            {
+                ids["rename"]: ("ｶｲﾒｲ", "Renamed", "2A病棟"),
+                ids["move"]: ("ｼﾝｸ", "Sync", "SyncDept"),
+                new_id: ("ｼﾝｷ", "New", "2A病棟"),
+            },
+            drop={ids["leave"]},
+        )
+        files = {"file": ("roster.csv", csv_data, "text/csv")}
+
+        resp = client.post(
+            "/admin/users/import?mode=sync&dry_run=true", files=files, headers=headers
+        )
+        assert resp.status_code == 202
+        preview = _wait_for_job(client, token, resp.json()["id"])["result"]
+        assert preview["dry_run"] is True
+        assert preview["preview"]["inserted"] == [new_id]
+        assert preview["preview"]["renamed"] == [ids["rename"]]
+        assert preview["preview"]["moved"] == [ids["move"]]
+        assert preview["preview"]["deactivated"] == [ids["leave"]]
+        assert preview["new_departments"] == ["SyncDept"]
+        db = SessionLocal()
+        assert crud.get_user_by_employee_id(db, new_id) is None
+        db.close()
+
+        resp = client.post("/admin/users/import?mode=sync", files=files, headers=headers)
+        result = _wait_for_job(client, token, resp.json()["id"])["result"]
+        assert result["inserted"] == 1
+        assert result["deactivated"] == 1
+
+        db = SessionLocal()
+        assert crud.get_user_by_employee_id(db, new_id).display_name == "New"
+        assert crud.get_user_by_employee_id(db, ids["rename"]).name == "ｶｲﾒｲ"
+        assert crud.get_user_by_employee_id(db, ids["move"]).department.name == "SyncDept"
+        assert crud.get_user_by_employee_id(db, ids["leave"]) is None
+        assert crud.get_user_by_employee_id(db, "999999").is_admin
+        db.close()
+
+
+def test_sync_keeps_invalid_rows_and_refuses_incomplete_rosters():
+    import csv
+    import io
+
+    with TestClient(app):
+        db = SessionLocal()
+        active_before = db.query(models.User).filter(models.User.is_active == True).count()
+        roster = list(csv.DictReader(io.StringIO(_roster_csv({}, drop=set()))))
+        # メール欄が空の行は不完全ですが、その社員を退職扱いにはしません
+        blank = roster[:3]
+        for row in blank:
+            row["email"] = ""
+        report = importer.sync_users(db, roster + [{"user_id": "", "name": ""}], dry_run=True)
+        assert report["deactivated"] == 0
+        assert report["skipped"] == 4
+        assert len(report["errors"]) == 3
+        assert all(row["user_id"] in error for row, error in zip(blank, report["errors"]))
+        assert report["refused"] is None
+
+        # 空の名簿・大量の退職は force なしでは適用しません
+        for rows in ([], roster[:1]):
+            preview = importer.sync_users(db, rows, dry_run=True)
+            assert preview["refused"]
+            with pytest.raises(importer.SyncRefused):
+                importer.sync_users(db, rows)
+        assert db.query(models.User).filter(models.User.is_active == True).count() == active_before
+        db.close()
+
+
+def test_sync_dry_run_requires_sync_mode():
+    with TestClient(app) as client:
+        token = _get_admin_token(client)
+        files = {"file": ("users.csv", "user_id,name,department,email\n", "text/csv")}
+        resp = client.post(
+            "/admin/users/import?dry_run=true",
+            files=files,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert resp.status_code == 400
+
+
+def test_departments_served_from_registry_with_etag():
+    from sqlalchemy import event
+    from .. import database, registry
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with TestClient(app) as client:
+        first = client.get("/departments")
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "public, max-age=60"
+        etag = first.headers["etag"]
+
+        # 2回目以降はレジストリから返すため SQL を発行しません
+        event.listen(database.engine, "before_cursor_execute", count)
+        try:
+            assert client.get("/departments").json() == first.json()
+            cached = client.get("/departments", headers={"If-None-Match": etag})
+            weak = client.get("/departments", headers={"If-None-Match": f'"stale", W/{etag}'})
+        finally:
+            event.remove(database.engine, "before_cursor_execute", count)
+        # キャッシュ無効化の確認（cachebus.poll）は対象外です
+        assert [s for s in statements if "cache_versions" not in s] == []
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert weak.status_code == 304
+
+        token = _get_admin_token(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        version = registry.departments.version
+        created = client.post(
+            "/admin/departments/", json={"name": f"ETag-{uuid.uuid4().hex[:6]}"}, headers=headers
+        )
+        assert created.status_code == 201
+        assert registry.departments.version == version + 1
+        after_create = client.get("/departments", headers={"If-None-Match": etag})
+        assert after_create.status_code == 200
+        assert any(d["id"] == created.json()["id"] for d in after_create.json())
+
+        admin_list = client.get("/admin/departments/", headers=headers)
+        assert admin_list.json() == after_create.json()
+        assert admin_list.headers["cache-control"] == "private, no-cache"
+
+        deleted = client.delete(f"/admin/departments/{created.json()['id']}", headers=headers)
+        assert deleted.status_code == 204
+        assert all(d["id"] != created.json()["id"] for d in client.get("/departments").json())
@@ -0,0 +1,419 @@
+import fnmatch
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+
+from .. import cache, readmodels
+from ..main import app
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for ``redis.Redis`` (get/set/delete/incr/scan_iter)."""
+
+    def __init__(self):
+        self.data: dict[str, tuple[bytes, float | None]] = {}
+        self.fail = False
+
+    def _check(self):
+        if self.fail:
+            raise ConnectionError("redis is down")
+
+    def get(self, name):
+        self._check()
+        value, expires_at = self.data.get(name, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(name, None)
+            return None
+        return value
+
+    def set(self, name, value, px=None):
+        self._check()
+        self.data[name] = (value, None if px is None else time.monotonic() + px / 1000)
+        return True
+
+    def delete(self, *names):
+        self._check()
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+    def incr(self, name):
+        self._check()
+        value = int(self.get(name) or 0) + 1
+        self.data[name] = (str(value).encode(), None)
+        return value
+
+    def scan_iter(self, match="*"):
+        self._check()
+        return [name for name in list(self.data) if fnmatch.fnmatchcase(name, match)]
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return cache.MemoryCache(max_entries=3)
+    if request.param == "sqlite":
+        return cache.SQLiteCache(str(tmp_path / "cache.db"), max_entries=3, touch_interval=0)
+    return cache.RedisCache(FakeRedis())
+
+
+@pytest.fixture
+def use_backend():
+    previous = []
+
+    def use(new_backend):
+        previous.append(cache.configure(new_backend))
+        return new_backend
+
+    yield use
+    if previous:
+        cache.configure(previous[0])
+
+
+def test_backend_basic_operations(backend):
+    assert backend.get("ns", "a") is cache.MISSING
+    backend.set("ns", "a", {"value": [1, 2]})
+    backend.set("ns", "none", None)
+    backend.set("other", "a", "other")
+    assert backend.get("ns", "a") == {"value": [1, 2]}
+    assert backend.get("ns", "none") is None
+
+    backend.delete("ns", "none")
+    assert backend.get("ns", "none") is cache.MISSING
+    backend.clear("ns")
+    assert backend.get("ns", "a") is cache.MISSING
+    assert backend.get("other", "a") == "other"
+
+    stats = backend.stats()
+    assert stats["ns"] == {
+        "hits": 2,
+        "misses": 3,
+        "sets": 2,
+        "evictions": 0,
+        "invalidations": 1,
+        "stale": 0,
+    }
+    assert stats["other"]["hits"] == 1
+
+
+def test_backend_ttl(backend):
+    backend.set("ns", "short", 1, ttl=0.05)
+    backend.set("ns", "long", 2, ttl=60)
+    assert backend.get("ns", "short") == 1
+    time.sleep(0.1)
+    assert backend.get("ns", "short") is cache.MISSING
+    assert backend.get("ns", "long") == 2
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_least_recently_used_entries_are_evicted(kind, tmp_path):
+    if kind == "memory":
+        backend = cache.MemoryCache(max_entries=3)
+    else:
+        backend = cache.SQLiteCache(str(tmp_path / "lru.db"), max_entries=3, touch_interval=0)
+    for key in "abc":
+        backend.set("ns", key, key)
+        time.sleep(0.01)
+    # "a" を参照したので、次に追い出されるのは "b"
+    assert backend.get("ns", "a") == "a"
+    time.sleep(0.01)
+    backend.set("ns", "d", "d")
+
+    assert len(backend) == 3
+    assert backend.get("ns", "b") is cache.MISSING
+    assert [backend.get("ns", k) for k in "acd"] == ["a", "c", "d"]
+    assert backend.stats()["ns"]["evictions"] == 1
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.db")
+    writer = cache.SQLiteCache(path)
+    reader = cache.SQLiteCache(path)
+    writer.set("ns", "key", [1, 2, 3])
+    assert reader.get("ns", "key") == [1, 2, 3]
+    reader.clear("ns")
+    assert writer.get("ns", "key") is cache.MISSING
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_value_computed_across_another_workers_invalidation_is_not_stored(
+    kind, tmp_path, use_backend
+):
+    # 2つのインスタンスで、同じストアを共有する別ワーカーを再現します
+    if kind == "sqlite":
+        path = str(tmp_path / "workers.db")
+        this, other = cache.SQLiteCache(path), cache.SQLiteCache(path)
+    else:
+        client = FakeRedis()
+        this, other = cache.RedisCache(client), cache.RedisCache(client)
+    use_backend(this)
+
+    def compute():
+        # 計算中に他のワーカーが変更をコミットし、名前空間を無効化します
+        other.clear("ns")
+        return "before change"
+
+    assert cache.get_or_set("ns", "key", compute) == "before change"
+    assert this.get("ns", "key") is cache.MISSING
+    assert this.version("ns") == other.version("ns") == 1
+
+    assert cache.get_or_set("ns", "key", lambda: "after change") == "after change"
+    assert other.get("ns", "key") == ("after change", pytest.approx(time.time(), abs=5))
+    assert not other.set_if_current("ns", "key", ("stale", 0), None, version=0)
+    assert other.get("ns", "key")[0] == "after change"
+
+
+def test_get_or_set_treats_backend_errors_as_misses(use_backend):
+    client = FakeRedis()
+    use_backend(cache.RedisCache(client, errors=(ConnectionError,)))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "fresh"
+
+    assert cache.get_or_set("ns", "key", compute) == "fresh"
+    assert cache.get_or_set("ns", "key", compute) == "fresh"
+    assert len(calls) == 1
+
+    client.fail = True
+    assert cache.get_or_set("ns", "key", compute) == "fresh"
+    assert len(calls) == 2
+    cache.invalidate("ns")
+
+
+def test_memory_cache_invalidation_goes_through_the_bus(use_backend, monkeypatch):
+    with TestClient(app):
+        pass
+    backend = use_backend(cache.MemoryCache())
+    published = []
+    monkeypatch.setattr(cache.cachebus, "publish", lambda ns: published.append(ns))
+
+    assert cache.get_or_set("ns", "key", lambda: 1) == 1
+    cache.invalidate("ns")
+    assert published == ["cache:ns"]
+
+    # 他のワーカーからの通知（購読しているコールバック）でローカルの名前空間を破棄します
+    monkeypatch.undo()
+    cache.cachebus.publish("cache:ns")
+    assert backend.get("ns", "key") is cache.MISSING
+
+
+def test_timeline_and_search_are_cached_until_invalidated(use_backend):
+    backend = use_backend(cache.MemoryCache())
+    with TestClient(app) as client:
+        token = client.post(
+            "/token", data={"username": "999999", "password": "admin"}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        first = client.get("/posts/").json()
+        assert client.get("/posts/").json() == first
+        assert backend.stats()[readmodels.TIMELINE_NAMESPACE]["hits"] >= 1
+
+        created = client.post("/posts/", json={"content": "cached?"}, headers=headers).json()
+        posts = client.get("/posts/", headers=headers).json()
+        assert posts[0]["id"] == created["id"]
+
+        # いいねはキャッシュ済みのページにもそのまま反映されます
+        client.post(f"/posts/{created['id']}/like", headers=headers)
+        post = client.get("/posts/", headers=headers).json()[0]
+        assert post["like_count"] == 1 and post["liked_by_me"] is True
+
+        client.get("/users/search", params={"query": "ﾃｽﾄ"})
+        client.get("/users/search", params={"query": "ﾃｽﾄ"})
+        assert backend.stats()["user_search"]["hits"] >= 1
+
+        stats = client.get("/admin/diagnostics/cache", headers=headers)
+        assert stats.status_code == 200
+        assert stats.json()["backend"] == "memory"
+
+
+def _locked(*args):
+    raise OperationalError("SELECT", {}, Exception("database is locked"))
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_lookup_serves_stale_while_revalidating(use_backend):
+    use_backend(cache.MemoryCache())
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    options = dict(ttl=0.05, stale_while_revalidate=60)
+    assert cache.lookup("swr", "page", compute, **options).value == 1
+    time.sleep(0.1)
+
+    # 更新中も待たずに古い値を返し、更新は1回だけ実行されます
+    start = time.perf_counter()
+    stale = cache.lookup("swr", "page", compute, **options)
+    again = cache.lookup("swr", "page", compute, **options)
+    assert time.perf_counter() - start < 0.5
+    assert stale.value == again.value == 1
+    assert stale.warning == cache.STALE_WARNING and stale.age >= 0.05
+
+    release.set()
+    _wait_for(lambda: not cache.lookup("swr", "page", compute, **options).stale)
+    assert cache.lookup("swr", "page", compute, **options).value == 2
+    assert len(calls) == 2
+
+
+def test_lookup_serves_stale_if_error_or_timeout(use_backend):
+    use_backend(cache.MemoryCache())
+    options = dict(ttl=0.05, stale_if_error=60, timeout=0.2)
+    assert cache.lookup("sie", "page", lambda: "good", **options).value == "good"
+    time.sleep(0.1)
+
+    failed = cache.lookup("sie", "page", _locked, **options)
+    assert failed.value == "good"
+    assert failed.warning == cache.REVALIDATION_FAILED_WARNING
+
+    def slow():
+        time.sleep(0.5)
+        return "late"
+
+    start = time.perf_counter()
+    timed_out = cache.lookup("sie", "page", slow, **options)
+    assert time.perf_counter() - start < 0.45
+    assert (timed_out.value, timed_out.warning) == ("good", cache.REVALIDATION_FAILED_WARNING)
+
+    # 時間切れ後もバックグラウンドで完了した結果が保存されます
+    _wait_for(lambda: cache.lookup("sie", "page", slow, **options).value == "late")
+    assert cache.backend().stats()["sie"]["stale"] >= 2
+
+
+@contextmanager
+def _database_lock(mode: str):
+    """Hold a real SQLite lock on the test database from another connection."""
+    from .. import database
+
+    conn = sqlite3.connect(database.engine.url.database, isolation_level=None)
+    try:
+        conn.execute(f"BEGIN {mode}")
+        yield
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def _timed_get(client, url, **kwargs):
+    start = time.perf_counter()
+    resp = client.get(url, **kwargs)
+    return resp, time.perf_counter() - start
+
+
+def test_timeline_is_served_stale_when_database_is_locked(use_backend, monkeypatch):
+    from .. import database, models
+
+    use_backend(cache.MemoryCache())
+    monkeypatch.setattr(readmodels, "TIMELINE_CACHE_TTL", 0.05)
+    monkeypatch.setattr(readmodels, "TIMELINE_STALE_WHILE_REVALIDATE", 0)
+    monkeypatch.setattr(cache, "REFRESH_TIMEOUT", 0.3)
+    with TestClient(app) as client:
+        token = client.post(
+            "/token", data={"username": "000001", "password": "000001"}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        fresh = client.get("/posts/")
+        assert "warning" not in fresh.headers
+        time.sleep(1.1)
+
+        # 書き込みロック中: last_seen の更新は諦め、ログイン中の読み込みも成功します
+        db = database.SessionLocal()
+        user = db.query(models.User).filter_by(employee_id="000001").one()
+        user.last_seen = datetime.now(timezone.utc) - timedelta(hours=1)
+        db.commit()
+        last_seen = user.last_seen
+        with _database_lock("IMMEDIATE"):
+            resp, elapsed = _timed_get(client, "/posts/", headers=headers)
+        assert resp.status_code == 200
+        assert elapsed < 2
+        db.refresh(user)
+        assert user.last_seen == last_seen
+        db.close()
+
+        # 読み込みもできない排他ロック中: 古いページを CACHE_REFRESH_TIMEOUT 程度で返します
+        time.sleep(1.1)
+        with _database_lock("EXCLUSIVE"):
+            stale, elapsed = _timed_get(client, "/posts/")
+        assert stale.status_code == 200
+        assert elapsed < 2
+        assert stale.headers["warning"] == cache.REVALIDATION_FAILED_WARNING
+        assert int(stale.headers["age"]) >= 1
+        assert [p["id"] for p in stale.json()] == [p["id"] for p in resp.json()]
+
+
+def test_timeline_marks_unknown_mention_names(use_backend, monkeypatch):
+    from .. import database, models, registry
+
+    use_backend(cache.MemoryCache())
+    with TestClient(app) as client:
+        headers = {
+            "Authorization": "Bearer "
+            + client.post("/token", data={"username": "999999", "password": "admin"}).json()[
+                "access_token"
+            ]
+        }
+        assert client.get("/posts/").status_code == 200
+
+        db = database.SessionLocal()
+        newcomer = models.User(
+            employee_id="unknown-name", name="ｼﾝｼﾞﾝ", display_name="New", hashed_password="x"
+        )
+        db.add(newcomer)
+        db.commit()
+        newcomer_id = newcomer.id
+        db.close()
+
+        # 名前表を再読み込みできない間は、空文字ではなく UNKNOWN_USER_NAME と Warning を返します
+        monkeypatch.setattr(registry.user_mentions, "_loader", _locked)
+        client.post(
+            "/posts/", json={"content": "welcome", "mention_user_ids": [newcomer_id]}, headers=headers
+        )
+        resp = client.get("/posts/")
+        post = next(p for p in resp.json() if p["mention_user_ids"] == [newcomer_id])
+        assert post["mention_user_names"] == [registry.UNKNOWN_USER_NAME]
+        assert resp.headers["warning"] == cache.REVALIDATION_FAILED_WARNING
+
+        monkeypatch.undo()
+        resp = client.get("/posts/")
+        post = next(p for p in resp.json() if p["mention_user_ids"] == [newcomer_id])
+        assert post["mention_user_names"] == ["ｼﾝｼﾞﾝ"]
+        assert "warning" not in resp.headers
+
+
+def test_departments_are_served_stale_when_reload_fails(monkeypatch):
+    from .. import registry
+
+    monkeypatch.setattr(cache, "REFRESH_TIMEOUT", 0.2)
+    with TestClient(app) as client:
+        fresh = client.get("/departments")
+        assert "warning" not in fresh.headers
+
+        monkeypatch.setattr(registry.departments, "_loader", _locked)
+        registry.departments.invalidate()
+        stale = client.get("/departments")
+        assert stale.status_code == 200
+        assert stale.json() == fresh.json()
+        assert stale.headers["warning"] == cache.REVALIDATION_FAILED_WARNING
+        assert "age" in stale.headers
+
+        monkeypatch.undo()
+        recovered = client.get("/departments")
+        assert "warning" not in recovered.headers
+        assert registry.departments.stale_age() is None
@@ -0,0 +1,149 @@
+import os
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+from .. import cachebus
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# 1つの SQLite ファイルを共有するワーカープロセスを模したスクリプト
+_WORKER = textwrap.dedent(
+    """
+    import sys
+    from app import bootstrap, crud, registry, schemas
+    from app.database import SessionLocal, engine
+
+    bootstrap.init_db(engine)
+    db = SessionLocal()
+    print("ready", flush=True)
+    for line in sys.stdin:
+        command, _, arg = line.strip().partition(" ")
+        if command == "create":
+            dept = crud.create_department(db, schemas.DepartmentCreate(name=arg))
+            print(dept.id, flush=True)
+        elif command == "rename":
+            dept_id, _, name = arg.partition(" ")
+            crud.update_department(db, int(dept_id), schemas.DepartmentCreate(name=name))
+            print("ok", flush=True)
+        elif command == "name":
+            print(registry.departments.get(db, int(arg)), flush=True)
+        elif command == "quit":
+            break
+    db.close()
+    """
+)
+
+
+class _Worker:
+    def __init__(self, db_path: Path, poll_ms: int):
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{db_path}",
+            SECRET_KEY="test-secret",
+            CACHE_BUS_POLL_MS=str(poll_ms),
+        )
+        self.proc = subprocess.Popen(
+            [sys.executable, "-c", _WORKER],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        # テーブル作成が他のプロセスと競合しないよう、準備完了を待ちます
+        assert self.proc.stdout.readline().strip() == "ready"
+
+    def send(self, line: str) -> str:
+        self.proc.stdin.write(line + "\n")
+        self.proc.stdin.flush()
+        return self.proc.stdout.readline().strip()
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.write("quit\n")
+            self.proc.stdin.close()
+        self.proc.wait(timeout=30)
+
+
+def test_invalidation_reaches_other_processes(tmp_path):
+    db_path = tmp_path / "shared.db"
+    writer = _Worker(db_path, poll_ms=50)
+    reader = _Worker(db_path, poll_ms=50)
+    # 確認間隔が長いワーカーは、その間は古い名前を返し続けます
+    slow_reader = _Worker(db_path, poll_ms=60_000)
+    workers = (writer, reader, slow_reader)
+    try:
+        dept_id = writer.send("create ﾊﾞｽ部")
+        assert reader.send(f"name {dept_id}") == "ﾊﾞｽ部"
+        assert slow_reader.send(f"name {dept_id}") == "ﾊﾞｽ部"
+
+        assert writer.send(f"rename {dept_id} ﾘﾈｰﾑ部") == "ok"
+        # 書き込んだプロセスでは即座に反映されます
+        assert writer.send(f"name {dept_id}") == "ﾘﾈｰﾑ部"
+        time.sleep(0.1)
+        assert reader.send(f"name {dept_id}") == "ﾘﾈｰﾑ部"
+        assert slow_reader.send(f"name {dept_id}") == "ﾊﾞｽ部"
+    finally:
+        for worker in workers:
+            worker.close()
+
+
+def test_publish_and_poll_in_process():
+    from .. import bootstrap
+    from ..database import engine
+
+    bootstrap.init_db(engine)
+    calls = []
+    cachebus.subscribe("test-namespace", lambda: calls.append(1))
+    cachebus.poll(force=True)
+    calls.clear()
+
+    cachebus.publish("test-namespace")
+    # 発行したプロセスではコールバックが即座に1回だけ呼ばれます
+    assert calls == [1]
+    assert "test-namespace" not in cachebus.poll(force=True)
+    assert calls == [1]
+
+    # 他プロセスによる更新（バージョンが進んだ状態）を検知します
+    with engine.begin() as conn:
+        cachebus._bump(conn, "test-namespace")
+    assert cachebus.poll(force=True) == ["test-namespace"]
+    assert calls == [1, 1]
+
+
+def test_failed_publish_is_retried(monkeypatch):
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+
+    from .. import bootstrap
+    from ..database import engine
+
+    bootstrap.init_db(engine)
+    cachebus.publish("test-retry")
+
+    def version():
+        with engine.connect() as conn:
+            return conn.execute(
+                select(cachebus._table.c.version).where(
+                    cachebus._table.c.namespace == "test-retry"
+                )
+            ).scalar_one()
+
+    before = version()
+
+    def locked(conn, namespace):
+        raise OperationalError("UPDATE", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(cachebus, "_bump", locked)
+    cachebus.publish("test-retry")
+    assert "test-retry" in cachebus._pending
+    assert version() == before
+
+    # ロック解除後の次の poll で他のワーカーに届きます
+    monkeypatch.undo()
+    cachebus.poll(force=True)
+    assert "test-retry" not in cachebus._pending
+    assert version() == before + 1
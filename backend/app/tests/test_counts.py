@@ -1,7 +1,13 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
 from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
 from ..main import app
 from ..database import SessionLocal
-from .. import crud
+from .. import cli, crud, models, schemas
 
 
 def _get_token(client: TestClient, username: str, password: str) -> str:
@@ -69,3 +75,178 @@ def test_like_unlike_updates_author_likes_received():
         db.close()
         assert likes_final == likes_before
 
+
+def test_top_users_windowed_rollups():
+    with TestClient(app) as client:
+        admin_token = _get_token(client, "999999", "admin")
+        admin_headers = {"Authorization": f"Bearer {admin_token}"}
+
+        def window_count(counter: str, params: str, employee_id: str):
+            resp = client.get(
+                f"/admin/users/top/{counter}?limit=100&{params}", headers=admin_headers
+            )
+            assert resp.status_code == 200
+            return next(
+                (u["window_count"] for u in resp.json() if u["employee_id"] == employee_id),
+                0,
+            )
+
+        before = window_count("expressed", "window=7d", "000003")
+        likes_before = window_count("likes", "window=1d", "000003")
+
+        token = _get_token(client, "000003", "000003")
+        headers = {"Authorization": f"Bearer {token}"}
+        post_id = client.post(
+            "/posts/", json={"content": "rollup"}, headers=headers
+        ).json()["id"]
+        other = {"Authorization": f"Bearer {_get_token(client, '000002', '000002')}"}
+        assert client.post(f"/posts/{post_id}/like", headers=other).status_code == 204
+
+        assert window_count("expressed", "window=7d", "000003") == before + 1
+        assert window_count("likes", "window=1d", "000003") == likes_before + 1
+
+        db = SessionLocal()
+        author = crud.get_user_by_employee_id(db, "000003")
+        dept_id, dept_name = author.department_id, author.department_name
+        db.close()
+        resp = client.get(
+            f"/admin/users/top/expressed?window=30d&department_id={dept_id}",
+            headers=admin_headers,
+        )
+        assert resp.status_code == 200
+        assert resp.json()
+        assert all(u["department_name"] == dept_name for u in resp.json())
+
+        client.delete(f"/posts/{post_id}/like", headers=other)
+        assert window_count("likes", "window=1d", "000003") == likes_before
+
+        bad = client.get("/admin/users/top/likes?window=week", headers=admin_headers)
+        assert bad.status_code == 422
+
+
+def _create_plain_users(db, count: int, prefix: str) -> list[int]:
+    users = [
+        models.User(
+            employee_id=f"{prefix}{uuid.uuid4().hex[:8]}",
+            name="ｶｳﾝﾄ",
+            display_name="Counter",
+            hashed_password="x",
+            department_id=2,
+        )
+        for _ in range(count)
+    ]
+    db.add_all(users)
+    db.commit()
+    return [u.id for u in users]
+
+
+def test_concurrent_likes_keep_exact_counters():
+    db = SessionLocal()
+    author_id = _create_plain_users(db, 1, "hammerauthor")[0]
+    liker_ids = _create_plain_users(db, 24, "hammer")
+    post = crud.create_post(db, schemas.PostCreate(content="hammer"), author_id)
+    post_id = post.id
+    db.close()
+
+    def hammer(uid: int):
+        for attempt in range(50):
+            session = SessionLocal()
+            try:
+                assert crud.like_post(session, post_id, uid)
+                return
+            except OperationalError:
+                # SQLite が書き込みロック中の場合は再試行します
+                session.rollback()
+                time.sleep(0.01 * (attempt + 1))
+            finally:
+                session.close()
+        raise AssertionError("like never succeeded")
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        # 各ユーザーが2回ずつ「いいね」しても1回分しか数えられないこと
+        list(pool.map(hammer, liker_ids + liker_ids))
+
+    db = SessionLocal()
+    author = db.get(models.User, author_id)
+    assert author.likes_received == len(liker_ids)
+    assert author.expressed_count == 1
+    db.close()
+
+
+def test_reconcile_counters():
+    db = SessionLocal()
+    author_id, mentioned_id = _create_plain_users(db, 2, "recon")
+    crud.create_post(
+        db, schemas.PostCreate(content="recon", mention_user_ids=[mentioned_id]), author_id
+    )
+    db.query(models.User).filter(models.User.id.in_([author_id, mentioned_id])).update(
+        {"expressed_count": 99, "appreciated_count": 7}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+
+    assert cli.main(["reconcile-counters"]) == 0
+
+    db = SessionLocal()
+    author = db.get(models.User, author_id)
+    mentioned = db.get(models.User, mentioned_id)
+    assert (author.expressed_count, author.appreciated_count) == (1, 0)
+    assert (mentioned.expressed_count, mentioned.appreciated_count) == (0, 1)
+    assert crud.reconcile_counters(db) == 0
+    db.close()
+
+
+def test_backfill_activity_fills_days_before_the_first_rollup():
+    db = SessionLocal()
+    author_id, mentioned_id, liker_id = _create_plain_users(db, 3, "backfill")
+    # ロールアップ導入前の投稿（ロールアップ行なし）
+    created_at = datetime.now(timezone.utc) - timedelta(days=400)
+    post = models.Post(content="old", author_id=author_id, created_at=created_at)
+    post.mentions.append(db.get(models.User, mentioned_id))
+    post.likers.append(db.get(models.User, liker_id))
+    db.add(post)
+    db.commit()
+    # 導入後の活動は増分で記録されています
+    crud.record_activity(db, "expressed_count", [author_id])
+    db.query(models.User).filter(models.User.id == author_id).update(
+        {"expressed_count": 2}, synchronize_session=False
+    )
+    db.commit()
+    db.close()
+
+    assert cli.main(["backfill-activity"]) == 0
+
+    db = SessionLocal()
+    rows = {
+        (row.user_id, row.day): (row.expressed_count, row.appreciated_count, row.likes_received)
+        for row in db.query(models.UserActivityDaily).filter(
+            models.UserActivityDaily.user_id.in_([author_id, mentioned_id])
+        )
+    }
+    old_day = created_at.date()
+    today = datetime.now(timezone.utc).date()
+    assert rows == {
+        (author_id, old_day): (1, 0, 1),
+        (mentioned_id, old_day): (0, 1, 0),
+        (author_id, today): (1, 0, 0),
+    }
+    # 2回目は何も追加しません
+    assert crud.backfill_activity(db) == 0
+    db.close()
+
+
+def test_create_missing_indexes_adds_indexes_to_existing_tables(tmp_path):
+    from sqlalchemy import create_engine, inspect
+
+    from .. import bootstrap
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'upgrade.db'}")
+    bootstrap.init_db(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_users_likes_received")
+    assert bootstrap.create_missing_indexes(engine) == ["ix_users_likes_received"]
+    assert "ix_users_likes_received" in {
+        index["name"] for index in inspect(engine).get_indexes("users")
+    }
+    assert bootstrap.create_missing_indexes(engine) == []
+    engine.dispose()
@@ -0,0 +1,28 @@
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from bench import datagen
+from .. import crud, models
+
+
+def test_generated_dataset_is_consistent(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bench.db'}"
+    summary = datagen.generate(
+        url, users=60, departments=5, posts=400, likes=1500, days=10, log=lambda _: None
+    )
+    assert summary["posts"] == 400
+    assert 0 < summary["post_likes"] <= 1500
+
+    engine = create_engine(url)
+    with Session(engine) as db:
+        # カウンターとソース表が一致していれば補正件数は0
+        assert crud.reconcile_counters(db) == 0
+        rollup = db.scalar(select(func.sum(models.UserActivityDaily.expressed_count)))
+        assert rollup == 400
+        likes = db.scalar(select(func.sum(models.UserActivityDaily.likes_received)))
+        assert likes == summary["post_likes"]
+        admin = db.scalar(
+            select(models.User).where(models.User.employee_id == datagen.ADMIN_EMPLOYEE_ID)
+        )
+        assert admin.is_admin
+    engine.dispose()
@@ -0,0 +1,156 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from ..main import app
+from .. import jobs
+from .test_admin import _get_admin_token
+
+
+def test_job_cancellation():
+    started = threading.Event()
+
+    def work(job: jobs.Job) -> dict:
+        started.set()
+        rows = 0
+        while True:
+            rows += 1
+            job.report_progress(rows, [])
+            time.sleep(0.01)
+
+    manager = jobs.JobManager(max_workers=1)
+    job = manager.submit("test", work)
+    assert started.wait(5)
+    manager.cancel(job.id)
+    manager.wait(job.id, timeout=5)
+    assert job.status == "cancelled"
+    assert job.rows_processed > 0
+    manager.shutdown()
+
+
+def test_jobs_run_with_bounded_concurrency():
+    release = threading.Event()
+    running = []
+    lock = threading.Lock()
+    peak = {"n": 0}
+
+    def work(job: jobs.Job) -> dict:
+        with lock:
+            running.append(job.id)
+            peak["n"] = max(peak["n"], len(running))
+        release.wait(5)
+        with lock:
+            running.remove(job.id)
+        return {"ok": True}
+
+    manager = jobs.JobManager(max_workers=2)
+    submitted = [manager.submit("test", work) for _ in range(4)]
+    time.sleep(0.1)
+    assert sum(j.status == "queued" for j in submitted) == 2
+    release.set()
+    for j in submitted:
+        manager.wait(j.id, timeout=5)
+    assert peak["n"] == 2
+    assert all(j.status == "succeeded" and j.result == {"ok": True} for j in submitted)
+    manager.shutdown()
+
+
+def test_drain_waits_for_jobs_then_cancels_stragglers():
+    def quick(job: jobs.Job) -> dict:
+        time.sleep(0.05)
+        return {"ok": True}
+
+    def endless(job: jobs.Job) -> dict:
+        while True:
+            job.report_progress(0, [])
+            time.sleep(0.01)
+
+    manager = jobs.JobManager(max_workers=2)
+    finished = manager.submit("test", quick)
+    assert manager.drain(timeout=5)
+    assert finished.status == "succeeded"
+
+    stuck = manager.submit("test", endless)
+    assert not manager.drain(timeout=0.1)
+    assert stuck.status == "cancelled"
+    # drain の後も新しいジョブを受け付けます
+    after = manager.submit("test", quick)
+    manager.wait(after.id, timeout=5)
+    assert after.status == "succeeded"
+    manager.shutdown()
+
+
+def test_job_endpoints():
+    with TestClient(app) as client:
+        token = _get_admin_token(client)
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.get("/admin/jobs/unknown", headers=headers).status_code == 404
+
+        job = jobs.manager.submit("test", lambda job: {"done": True})
+        jobs.manager.wait(job.id, timeout=5)
+        resp = client.get(f"/admin/jobs/{job.id}", headers=headers)
+        assert resp.status_code == 200
+        assert resp.json()["status"] == "succeeded"
+        assert resp.json()["result"] == {"done": True}
+        assert any(j["id"] == job.id for j in client.get("/admin/jobs/", headers=headers).json())
+
+        cancel = client.delete(f"/admin/jobs/{job.id}", headers=headers)
+        assert cancel.status_code == 200
+        assert cancel.json()["status"] == "succeeded"
+
+
+def test_cleanup_runs_for_jobs_cancelled_while_queued():
+    release = threading.Event()
+    cleaned = []
+
+    def blocking(job: jobs.Job) -> dict:
+        release.wait(5)
+        return {"ok": True}
+
+    manager = jobs.JobManager(max_workers=1)
+    running = manager.submit("test", blocking, cleanup=lambda: cleaned.append("running"))
+    queued = manager.submit("test", blocking, cleanup=lambda: cleaned.append("queued"))
+    manager.cancel(queued.id)
+    release.set()
+    manager.wait(running.id, timeout=5)
+    manager.wait(queued.id, timeout=5)
+    assert (running.status, queued.status) == ("succeeded", "cancelled")
+    assert sorted(cleaned) == ["queued", "running"]
+    manager.shutdown()
+
+
+def test_import_spool_is_removed_on_every_path(tmp_path, monkeypatch):
+    import tempfile
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_admin_token(client)}"}
+        # フィールドサイズの上限を超えるヘッダーは csv.Error になります
+        oversized = b'"' + b"x" * 200_000 + b'"\n'
+        for content in (b"\xff\xfe", b"id\n1\n", oversized):
+            resp = client.post(
+                "/admin/users/import",
+                files={"file": ("users.csv", content, "text/csv")},
+                headers=headers,
+            )
+            assert resp.status_code == 400
+        assert list(tmp_path.iterdir()) == []
+
+        # キューで待っている間にキャンセルされたジョブもファイルを削除します
+        release = threading.Event()
+        monkeypatch.setattr(jobs, "manager", jobs.JobManager(max_workers=1))
+        blocker = jobs.manager.submit("test", lambda job: release.wait(5))
+        resp = client.post(
+            "/admin/users/import",
+            files={"file": ("users.csv", b"user_id,name,department,email\n", "text/csv")},
+            headers=headers,
+        )
+        assert resp.status_code == 202
+        assert len(list(tmp_path.iterdir())) == 1
+        jobs.manager.cancel(resp.json()["id"])
+        release.set()
+        jobs.manager.wait(blocker.id, timeout=5)
+        jobs.manager.wait(resp.json()["id"], timeout=5)
+        assert jobs.manager.get(resp.json()["id"]).status == "cancelled"
+        assert list(tmp_path.iterdir()) == []
+        jobs.manager.shutdown()
@@ -1,7 +1,7 @@
 from fastapi.testclient import TestClient
 from ..main import app
 from ..database import SessionLocal
-from .. import crud
+from .. import crud, models, querybudget, schemas
 
 
 def _get_token(client: TestClient, username: str, password: str) -> str:
@@ -64,3 +64,144 @@ def test_like_unlike_flow():
         # unauthorized like
         unauth = client.post(f"/posts/{post_id}/like")
         assert unauth.status_code == 401
+
+
+def test_like_missing_post_and_query_count():
+    with TestClient(app) as client:
+        token = _get_token(client, "000002", "000002")
+        headers = {"Authorization": f"Bearer {token}"}
+        assert client.post("/posts/999999/like", headers=headers).status_code == 404
+        assert client.delete("/posts/999999/like", headers=headers).status_code == 404
+
+    db = SessionLocal()
+    author = crud.get_user_by_employee_id(db, "000001")
+    post = crud.create_post(db, schemas.PostCreate(content="popular"), author.id)
+    post_id, author_id = post.id, author.id
+    liker_ids = [
+        uid
+        for uid, in db.query(models.User.id).filter(models.User.id != author_id).limit(5)
+    ]
+    db.close()
+
+    for uid in liker_ids:
+        db = SessionLocal()
+        with querybudget.capture() as log:
+            assert crud.like_post(db, post_id, uid)
+        db.close()
+        # 既存の「いいね」数に関係なく、発行されるSQLの数は一定
+        assert not any("FROM users" in s for s in log.statements)
+        assert log.count == len(set(log.statements)) <= 5
+
+
+def test_batch_like_operations():
+    with TestClient(app) as client:
+        author_headers = {"Authorization": f"Bearer {_get_token(client, '000001', '000001')}"}
+        post_ids = [
+            client.post("/posts/", json={"content": f"batch {i}"}, headers=author_headers).json()["id"]
+            for i in range(3)
+        ]
+        headers = {"Authorization": f"Bearer {_get_token(client, '000003', '000003')}"}
+        assert client.post(f"/posts/{post_ids[2]}/like", headers=headers).status_code == 204
+
+        db = SessionLocal()
+        likes_before = crud.get_user_by_employee_id(db, "000001").likes_received
+        db.close()
+
+        resp = client.post(
+            "/posts/likes:batch",
+            json={
+                "operations": [
+                    {"post_id": post_ids[0], "action": "like"},
+                    {"post_id": post_ids[1], "action": "like"},
+                    {"post_id": post_ids[1], "action": "unlike"},
+                    {"post_id": post_ids[2], "action": "like"},
+                    {"post_id": 999999, "action": "like"},
+                ]
+            },
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        assert [r["status"] for r in resp.json()] == [
+            "applied",
+            "superseded",
+            "unchanged",
+            "unchanged",
+            "not_found",
+        ]
+
+        db = SessionLocal()
+        assert crud.get_user_by_employee_id(db, "000001").likes_received == likes_before + 1
+        db.close()
+
+        resp = client.post(
+            "/posts/likes:batch",
+            json={
+                "operations": [
+                    {"post_id": post_ids[0], "action": "unlike"},
+                    {"post_id": post_ids[2], "action": "unlike"},
+                ]
+            },
+            headers=headers,
+        )
+        assert [r["status"] for r in resp.json()] == ["applied", "applied"]
+        db = SessionLocal()
+        assert crud.get_user_by_employee_id(db, "000001").likes_received == likes_before - 1
+        db.close()
+
+        empty = client.post("/posts/likes:batch", json={"operations": []}, headers=headers)
+        assert empty.status_code == 422
+
+
+def test_batch_like_operations_without_on_conflict(monkeypatch):
+    # ON CONFLICT / RETURNING のないDBでも同じ結果になること
+    monkeypatch.setattr(crud, "_dialect_insert", lambda db: None)
+    db = SessionLocal()
+    author = crud.get_user_by_employee_id(db, "000001")
+    liker = crud.get_user_by_employee_id(db, "000002")
+    post_ids = [
+        crud.create_post(db, schemas.PostCreate(content=f"fallback {i}"), author.id).id
+        for i in range(2)
+    ]
+    likes_before = author.likes_received
+    operations = [(post_ids[0], True), (post_ids[1], True)]
+    assert crud.apply_like_operations(db, liker.id, operations) == ["applied", "applied"]
+    assert crud.apply_like_operations(db, liker.id, operations) == ["unchanged", "unchanged"]
+    operations = [(post_ids[0], False), (post_ids[1], False)]
+    assert crud.apply_like_operations(db, liker.id, operations) == ["applied", "applied"]
+    assert crud.apply_like_operations(db, liker.id, operations) == ["unchanged", "unchanged"]
+    db.refresh(author)
+    assert author.likes_received == likes_before
+    db.close()
+
+
+def test_post_engagement_lookup():
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '000001', '000001')}"}
+        liked_id = client.post("/posts/", json={"content": "eng 1"}, headers=headers).json()["id"]
+        other_id = client.post("/posts/", json={"content": "eng 2"}, headers=headers).json()["id"]
+        client.post(f"/posts/{liked_id}/like", headers=headers)
+
+        resp = client.get(
+            f"/posts/engagement?ids={other_id},{liked_id},999999,{liked_id}",
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        assert resp.json() == [
+            {"post_id": liked_id, "like_count": 1, "liked_by_me": True},
+            {"post_id": other_id, "like_count": 0, "liked_by_me": False},
+        ]
+        assert resp.headers["cache-control"].startswith("private")
+
+        etag = resp.headers["etag"]
+        cached = client.get(
+            f"/posts/engagement?ids={liked_id},{other_id}",
+            headers={**headers, "If-None-Match": etag},
+        )
+        assert cached.status_code == 304
+
+        anonymous = client.get(f"/posts/engagement?ids={liked_id}")
+        assert anonymous.json()[0]["liked_by_me"] is False
+
+        too_many = ",".join(str(i) for i in range(1, 300))
+        assert client.get(f"/posts/engagement?ids={too_many}").status_code == 400
+        assert client.get("/posts/engagement?ids=a,b").status_code == 400
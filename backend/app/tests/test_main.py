@@ -57,7 +57,8 @@ def test_user_department_name():
         headers = {"Authorization": f"Bearer {token}"}
         user_resp = client.get("/users/me", headers=headers)
         assert user_resp.status_code == 200
-        assert user_resp.json().get("department_name") == "テスト部署"
+        # 部署名は半角カナに正規化して保存されます
+        assert user_resp.json().get("department_name") == "ﾃｽﾄ部署"
 
 
 def test_user_counts_returned():
@@ -261,7 +262,7 @@ def test_post_department_mentions():
         assert ids == []
         assert data["mention_department_ids"] == [user_dept2.department_id]
         assert data["mention_department_names"] == [
-            jaconv.z2h(user_dept2.department.name, kana=True, ascii=False, digit=False)
+            jaconv.z2h(user_dept2.department_name, kana=True, ascii=False, digit=False)
         ]
 
         resp2 = client.post(
@@ -284,8 +285,8 @@ def test_post_department_mentions():
             user_dept3.department_id,
         }
         assert set(data2["mention_department_names"]) == {
-            jaconv.z2h(user_dept2.department.name, kana=True, ascii=False, digit=False),
-            jaconv.z2h(user_dept3.department.name, kana=True, ascii=False, digit=False),
+            jaconv.z2h(user_dept2.department_name, kana=True, ascii=False, digit=False),
+            jaconv.z2h(user_dept3.department_name, kana=True, ascii=False, digit=False),
         }
 
         resp3 = client.post(
@@ -303,7 +304,7 @@ def test_post_department_mentions():
         assert ids3 == [user_dept2.id]
         assert data3["mention_department_ids"] == [user_dept2.department_id]
         assert data3["mention_department_names"] == [
-            jaconv.z2h(user_dept2.department.name, kana=True, ascii=False, digit=False)
+            jaconv.z2h(user_dept2.department_name, kana=True, ascii=False, digit=False)
         ]
 
         resp_invalid = client.post(
@@ -323,5 +324,68 @@ def test_post_department_mentions():
         post = next(p for p in timeline.json() if p["id"] == resp.json()["id"])
         assert user_dept2.department_id in post.get("mention_department_ids", [])
         assert jaconv.z2h(
-            user_dept2.department.name, kana=True, ascii=False, digit=False
+            user_dept2.department_name, kana=True, ascii=False, digit=False
         ) in post.get("mention_department_names", [])
+
+
+def test_startup_seed_can_be_skipped(monkeypatch):
+    from .. import bootstrap
+
+    calls = []
+    monkeypatch.setattr(bootstrap, "seed", lambda db: calls.append(db))
+    monkeypatch.setenv(bootstrap.SKIP_STARTUP_SEED_ENV, "1")
+    with TestClient(app):
+        pass
+    assert calls == []
+    monkeypatch.setenv(bootstrap.SKIP_STARTUP_SEED_ENV, "0")
+    with TestClient(app):
+        pass
+    assert len(calls) == 1
+
+
+def test_import_is_lazy(tmp_path):
+    """import app.main はDBに触れず、認証・かな変換のライブラリも読み込まない"""
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    db_path = tmp_path / "lazy.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", SECRET_KEY="test-secret")
+    code = (
+        "import sys, app.main; "
+        "print(sorted(m for m in ('jose', 'passlib', 'jaconv') if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        cwd=Path(__file__).resolve().parents[2],
+    ).stdout
+    assert out.strip() == "[]"
+    assert not db_path.exists()
+
+
+def test_datetime_columns_load_as_utc_without_dirtying_session():
+    """UTCDateTime は読み込み時に UTC を付与し、セッションを汚さない"""
+    from datetime import datetime, timedelta, timezone
+
+    with TestClient(app):
+        pass
+    db = SessionLocal()
+    try:
+        user = crud.get_user_by_employee_id(db, "000001")
+        jst = timezone(timedelta(hours=9))
+        user.last_seen = datetime(2024, 4, 1, 9, 0, tzinfo=jst)
+        db.commit()
+        db.expire_all()
+
+        assert user.last_seen == datetime(2024, 4, 1, 0, 0, tzinfo=timezone.utc)
+        assert user.last_seen.tzinfo is timezone.utc
+        posts = crud.get_posts(db)
+        assert all(p.created_at.tzinfo is timezone.utc for p in posts)
+        assert not db.dirty
+    finally:
+        db.close()
@@ -0,0 +1,44 @@
+from fastapi.testclient import TestClient
+from ..main import app
+from .. import metrics
+
+
+def test_histogram_render():
+    hist = metrics.Histogram("test_latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    metrics.REGISTRY.remove(hist)
+    hist.observe(0.05, route="/a")
+    hist.observe(0.5, route="/a")
+    hist.observe(5, route="/a")
+    lines = hist.render()
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count{route="/a"} 3' in lines
+
+
+def test_metrics_endpoint_reports_routes_sql_and_bcrypt():
+    with TestClient(app) as client:
+        verify_before = metrics.PASSWORD_HASH_LATENCY.count(operation="verify")
+        sql_before = metrics.DB_LATENCY.count(route="/token", operation="SELECT")
+        token = client.post(
+            "/token", data={"username": "000001", "password": "000001"}
+        ).json()["access_token"]
+        client.post(
+            "/posts/1/like", headers={"Authorization": f"Bearer {token}"}
+        )
+        client.get("/no/such/path")
+
+        assert metrics.PASSWORD_HASH_LATENCY.count(operation="verify") == verify_before + 1
+        assert metrics.DB_LATENCY.count(route="/token", operation="SELECT") > sql_before
+
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        body = resp.text
+        assert 'http_request_duration_seconds_count{method="POST",route="/posts/{post_id}/like"}' in body
+        assert 'route="unmatched",status="404"' in body
+        assert 'http_requests_in_progress{method="GET"} 1' in body
+        assert "db_pool_checkout_duration_seconds_count" in body
+        assert "\ndb_pool_checked_out " in body
+        # 同期エンドポイント（スレッドプール実行）のSQLもルートで集計されること
+        assert 'db_statement_duration_seconds_count{route="/posts/{post_id}/like",operation="SELECT"}' in body
+        assert 'db_statement_duration_seconds_bucket{route="/token",operation="UPDATE"' in body
@@ -0,0 +1,68 @@
+import io
+import json
+import zipfile
+
+from fastapi.testclient import TestClient
+
+from ..main import app
+from .. import profiling
+
+
+def _get_token(client: TestClient, username: str, password: str) -> str:
+    resp = client.post("/token", data={"username": username, "password": password})
+    assert resp.status_code == 200
+    return resp.json()["access_token"]
+
+
+def test_admin_can_profile_a_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "SAMPLE_INTERVAL", 0.0005)
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '999999', 'admin')}"}
+        resp = client.get("/admin/posts/", headers={**headers, "X-Profile": "1"})
+        assert resp.status_code == 200
+        profile_id = resp.headers["X-Profile-Id"]
+
+        listed = client.get("/admin/diagnostics/profiles", headers=headers).json()
+        assert profile_id in [p["id"] for p in listed]
+
+        download = client.get(f"/admin/diagnostics/profiles/{profile_id}", headers=headers)
+        assert download.status_code == 200
+        assert download.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(download.content)) as zf:
+            assert set(zf.namelist()) == {"stacks.folded", "queries.json", "profile.json"}
+            meta = json.loads(zf.read("profile.json"))
+            queries = json.loads(zf.read("queries.json"))
+            folded = zf.read("stacks.folded").decode()
+        assert meta["name"] == "GET /admin/posts/"
+        assert folded
+        assert any("FROM posts" in q["statement"] for q in queries)
+        for line in folded.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0 and ";" in stack
+
+        assert client.get("/admin/diagnostics/profiles/../../etc", headers=headers).status_code == 404
+        assert client.get(f"/admin/diagnostics/profiles/{'0' * 32}", headers=headers).status_code == 404
+
+
+def test_profile_header_ignored_for_non_admins(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '000001', '000001')}"}
+        resp = client.get("/posts/", headers={**headers, "X-Profile": "1"})
+        assert resp.status_code == 200
+        assert "X-Profile-Id" not in resp.headers
+        assert client.get("/departments", headers={"X-Profile": "1"}).status_code == 200
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_random_sampling_writes_to_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "MAX_PROFILES", 2)
+    with TestClient(app) as client:
+        for _ in range(3):
+            resp = client.get("/departments")
+            assert resp.status_code == 200
+            assert "X-Profile-Id" not in resp.headers
+    assert len(list(tmp_path.glob("*.zip"))) == 2
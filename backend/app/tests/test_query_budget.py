@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from ..main import app
+from ..database import SessionLocal
+from .. import crud, models, querybudget, registry, schemas
+
+
+def _get_token(client: TestClient, username: str, password: str) -> str:
+    resp = client.post("/token", data={"username": username, "password": password})
+    assert resp.status_code == 200
+    return resp.json()["access_token"]
+
+
+def test_every_route_declares_a_budget():
+    missing = [
+        f"{sorted(route.methods)} {route.path}"
+        for route in app.routes
+        if isinstance(route, APIRoute) and querybudget.budget_of(route.endpoint) is None
+    ]
+    assert missing == []
+
+
+def test_capture_flags_repeated_statements(monkeypatch):
+    monkeypatch.setattr(querybudget, "STRICT", False)
+    with TestClient(app):
+        pass  # 起動時の初期データ登録
+    db = SessionLocal()
+    try:
+        author = crud.get_user_by_employee_id(db, "000001")
+        for i in range(5):
+            crud.create_post(db, schemas.PostCreate(content=f"n+1 {i}"), author.id)
+        db.expunge_all()
+        with querybudget.capture(querybudget.QueryBudget(max_queries=10)) as log:
+            posts = db.query(models.Post).limit(5).all()
+            # 投稿ごとに通報一覧を遅延ロードする（典型的なN+1）
+            for p in posts:
+                _ = p.reports
+        assert log.repeated()
+        assert any("N+1" in problem for problem in log.violations())
+    finally:
+        db.close()
+
+
+def test_strict_mode_raises_on_the_offending_statement(monkeypatch):
+    monkeypatch.setattr(querybudget, "STRICT", True)
+    db = SessionLocal()
+    try:
+        with querybudget.capture(querybudget.QueryBudget(max_queries=1)):
+            db.query(models.User).first()
+            with pytest.raises(querybudget.QueryBudgetExceeded):
+                db.query(models.Department).first()
+    finally:
+        db.close()
+
+
+def test_admin_endpoints_stay_within_budget_with_many_rows(monkeypatch):
+    monkeypatch.setattr(querybudget, "STRICT", True)
+    with TestClient(app):
+        pass  # 起動時の初期データ登録
+    db = SessionLocal()
+    authors = db.query(models.User).filter(models.User.is_admin.is_(False)).limit(3).all()
+    for i in range(6):
+        post = crud.create_post(
+            db,
+            schemas.PostCreate(content=f"budget {i}"),
+            authors[i % len(authors)].id,
+        )
+        crud.create_report(
+            db,
+            schemas.ReportCreate(reported_post_id=post.id, reason="test"),
+            authors[(i + 1) % len(authors)].id,
+        )
+    db.close()
+
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '999999', 'admin')}"}
+        for path in ("/admin/posts/", "/admin/reports/", "/admin/users/"):
+            assert client.get(path, headers=headers).status_code == 200
+        report_id = client.get("/admin/reports/", headers=headers).json()[0]["reports"][0]["id"]
+        resp = client.patch(
+            f"/admin/reports/{report_id}", json={"status": "ignored"}, headers=headers
+        )
+        assert resp.status_code == 200
+        assert resp.json()["post_author_name"]
+
+
+def test_middleware_logs_violations(monkeypatch, caplog):
+    monkeypatch.setattr(querybudget, "STRICT", False)
+    route = next(r for r in app.routes if isinstance(r, APIRoute) and r.path == "/departments")
+    monkeypatch.setattr(
+        route.endpoint, "__query_budget__", querybudget.QueryBudget(max_queries=0)
+    )
+    with TestClient(app) as client, caplog.at_level(logging.WARNING, "app.querybudget"):
+        # 部署レジストリ（と古い表）を空にして、リクエスト内で DB から読み込ませます
+        registry.departments.reset()
+        assert client.get("/departments").status_code == 200
+    assert any("GET /departments" in r.getMessage() for r in caplog.records)
@@ -0,0 +1,187 @@
+import json
+
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from ..main import app
+from ..database import SessionLocal
+from .. import crud, models, readmodels, registry, schemas
+
+
+def _orm_posts(posts, user_id):
+    """以前の ORM 経路（Post グラフ → schemas.Post）での結果"""
+    return [
+        schemas.Post(
+            id=p.id,
+            content=p.content,
+            created_at=p.created_at,
+            mention_user_ids=p.mention_user_ids,
+            mention_department_ids=p.mention_department_ids,
+            mention_user_names=p.mention_user_names,
+            mention_department_names=p.mention_department_names,
+            like_count=p.like_count,
+            liked_by_me=user_id in [u.id for u in p.likers],
+        )
+        for p in posts
+    ]
+
+
+def _normalized(body: bytes) -> list[dict]:
+    # メンションの並び順は ORM の読み込み順に依存するため、ID順に揃えて比較します
+    posts = json.loads(body)
+    for p in posts:
+        for ids, names in (
+            ("mention_user_ids", "mention_user_names"),
+            ("mention_department_ids", "mention_department_names"),
+        ):
+            pairs = sorted(zip(p[ids], p[names]))
+            p[ids], p[names] = [i for i, _ in pairs], [n for _, n in pairs]
+    return posts
+
+
+def _setup_posts():
+    db = SessionLocal()
+    try:
+        author = crud.get_user_by_employee_id(db, "000001")
+        reader = crud.get_user_by_employee_id(db, "000002")
+        gone = crud.get_user_by_employee_id(db, "readmodel-gone") or crud.create_user(
+            db,
+            schemas.UserCreate(
+                employee_id="readmodel-gone",
+                name="ｻｸｼﾞｮ",
+                display_name="削除",
+                password="pass",
+                department_id=2,
+            ),
+        )
+        crud.deactivate_user(db, gone.id)
+        post = crud.create_post(
+            db,
+            schemas.PostCreate(
+                content="read model",
+                mention_user_ids=[reader.id, gone.id],
+                mention_department_ids=[3],
+            ),
+            user_id=author.id,
+        )
+        crud.like_post(db, post.id, reader.id)
+        return post.id, reader.id, reader.department_id
+    finally:
+        db.close()
+
+
+def test_timeline_matches_orm_path():
+    with TestClient(app):
+        pass
+    post_id, reader_id, department_id = _setup_posts()
+    adapter = TypeAdapter(list[schemas.Post])
+
+    db = SessionLocal()
+    try:
+        for user_id in (None, reader_id):
+            expected = adapter.dump_json(_orm_posts(crud.get_posts(db), user_id))
+            actual = readmodels.dump_posts(readmodels.timeline(db, user_id=user_id))
+            assert _normalized(actual) == _normalized(expected)
+
+        expected = adapter.dump_json(
+            _orm_posts(
+                crud.get_posts_mentioned(db, user_id=reader_id, department_id=department_id),
+                reader_id,
+            )
+        )
+        actual = readmodels.dump_posts(
+            readmodels.mentioned(db, user_id=reader_id, department_id=department_id)
+        )
+        assert _normalized(actual) == _normalized(expected)
+    finally:
+        db.close()
+
+    # Core の結果はセッションの identity map に載りません
+    db = SessionLocal()
+    try:
+        readmodels.timeline(db, user_id=reader_id)
+        assert len(db.identity_map) == 0
+    finally:
+        db.close()
+
+    post = next(p for p in json.loads(actual) if p["id"] == post_id)
+    assert post["like_count"] == 1 and post["liked_by_me"] is True
+    assert readmodels.DELETED_USER_NAME in post["mention_user_names"]
+    assert post["created_at"].endswith("Z")
+
+
+def test_timeline_endpoint_returns_read_model():
+    with TestClient(app) as client:
+        resp = client.get("/posts/")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/json"
+        TypeAdapter(list[schemas.Post]).validate_json(resp.content)
+        # response_model は OpenAPI に残します
+        schema = client.get("/openapi.json").json()
+        ok = schema["paths"]["/posts/"]["get"]["responses"]["200"]
+        assert ok["content"]["application/json"]["schema"]["items"]["$ref"].endswith("/Post")
+
+
+def test_registry_follows_rename_and_deactivation():
+    with TestClient(app):
+        pass
+    db = SessionLocal()
+    try:
+        author = crud.get_user_by_employee_id(db, "000001")
+        dept = crud.create_department(db, schemas.DepartmentCreate(name="レジストリ部"))
+        member = crud.create_user(
+            db,
+            schemas.UserCreate(
+                employee_id="registry-member",
+                name="ﾒﾝﾊﾞｰ",
+                display_name="メンバー",
+                password="pass",
+                department_id=dept.id,
+            ),
+        )
+        post = crud.create_post(
+            db,
+            schemas.PostCreate(
+                content="registry",
+                mention_user_ids=[member.id],
+                mention_department_ids=[dept.id],
+            ),
+            user_id=author.id,
+        )
+
+        def rendered():
+            return next(p for p in readmodels.timeline(db) if p.id == post.id)
+
+        # 新しい部署・ユーザーは再読み込みで解決されます
+        assert rendered().mention_department_names == ["ﾚｼﾞｽﾄﾘ部"]
+        assert rendered().mention_user_names == ["ﾒﾝﾊﾞｰ"]
+
+        version = registry.departments.version
+        crud.update_department(db, dept.id, schemas.DepartmentCreate(name="リネーム部"))
+        assert registry.departments.version == version + 1
+        assert rendered().mention_department_names == ["ﾘﾈｰﾑ部"]
+
+        crud.deactivate_user(db, member.id)
+        assert rendered().mention_user_names == [registry.DELETED_USER_NAME]
+    finally:
+        db.close()
+
+
+def test_normalize_department_names():
+    with TestClient(app):
+        pass
+    db = SessionLocal()
+    try:
+        # 正規化前の全角カナの部署名（直接 INSERT された既存データ）
+        db.execute(models.Department.__table__.insert().values(name="ゼンカク部"))
+        db.execute(models.Department.__table__.insert().values(name="ハンカク部"))
+        db.execute(models.Department.__table__.insert().values(name="ﾊﾝｶｸ部"))
+        db.commit()
+        assert crud.normalize_department_names(db) == 1
+        names = {d.name for d in crud.get_departments(db)}
+        assert "ｾﾞﾝｶｸ部" in names and "ゼンカク部" not in names
+        # 正規化後の名前が既にある場合は変更しません
+        assert "ハンカク部" in names
+        assert crud.normalize_department_names(db) == 0
+    finally:
+        db.close()
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from ..main import app
+from ..database import SessionLocal
+from .. import crud, responses, schemas
+
+
+def test_dump_list_matches_fastapi_serialization():
+    """response_model と同じ JSON（エイリアス・日時の形式）になる"""
+    users = [
+        schemas.AdminUser(
+            id=1,
+            employee_id="000001",
+            display_name="テスト",
+            kana_name="ﾃｽﾄ",
+            department_name=None,
+            is_admin=False,
+            is_active=True,
+            is_logged_in=False,
+            appreciated_count=1,
+            expressed_count=2,
+            likes_received=3,
+        )
+    ]
+    body = responses.dump_list(schemas.AdminUser, users)
+    assert json.loads(body) == jsonable_encoder(users, by_alias=True)
+    assert "name" in json.loads(body)[0]
+
+    post = schemas.Post(
+        id=1, content="x", created_at=datetime(2024, 4, 1, tzinfo=timezone.utc)
+    )
+    assert json.loads(responses.dump_list(schemas.Post, [post]))[0]["created_at"] == (
+        "2024-04-01T00:00:00Z"
+    )
+    assert responses.list_adapter(schemas.Post) is responses.list_adapter(schemas.Post)
+
+
+def test_list_response_from_orm_rows():
+    with TestClient(app) as client:
+        db = SessionLocal()
+        try:
+            # response_model と同様に検証（部署名の半角化）を通した結果
+            expected = [
+                schemas.Department.model_validate(d).model_dump()
+                for d in crud.get_departments(db)
+            ]
+            body = responses.dump_list(
+                schemas.Department, crud.get_departments(db), from_attributes=True
+            )
+        finally:
+            db.close()
+        assert json.loads(body) == expected
+
+        resp = client.get("/departments")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/json"
+        assert resp.json() == expected
+        # OpenAPI のスキーマは response_model のまま
+        schema = client.get("/openapi.json").json()
+        ok = schema["paths"]["/admin/users/"]["get"]["responses"]["200"]
+        assert ok["content"]["application/json"]["schema"]["items"]["$ref"].endswith("/AdminUser")
+
+
+def test_etag_matches_if_none_match_lists():
+    etag = responses.etag_for(b"[]")
+    assert responses.etag_matches(etag, etag)
+    assert responses.etag_matches(f'"other", W/{etag}', etag)
+    assert responses.etag_matches("*", etag)
+    assert not responses.etag_matches('"other"', etag)
+    assert not responses.etag_matches(None, etag)
+    assert not responses.etag_matches("", etag)
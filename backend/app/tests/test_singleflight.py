@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .. import cache, metrics, singleflight
+
+
+def _slow(calls, value="result", delay=0.2):
+    def fn():
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return value
+
+    return fn
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = singleflight.Group("test-threads")
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def call():
+        barrier.wait()
+        return flights.do(("GET /posts/", 0, 100), _slow(calls))
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: call(), range(8)))
+
+    assert results == ["result"] * 8
+    assert len(calls) == 1
+    assert flights.stats() == {"executions": 1, "coalesced": 7, "in_flight": 0}
+
+    # 完了後の呼び出しは改めて実行されます
+    assert flights.do(("GET /posts/", 0, 100), _slow(calls, delay=0)) == "result"
+    assert len(calls) == 2
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flights = singleflight.Group("test-keys")
+    calls = []
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flights.do, "a", _slow(calls, "a"))
+        second = pool.submit(flights.do, "b", _slow(calls, "b"))
+        assert (first.result(), second.result()) == ("a", "b")
+    assert len(calls) == 2
+    assert flights.coalesced == 0
+
+
+def test_exception_is_shared_and_not_remembered():
+    flights = singleflight.Group("test-errors")
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("database is locked")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "key", failing)
+        started.wait()
+        waiter = pool.submit(flights.do, "key", lambda: "unused")
+        with pytest.raises(ValueError):
+            leader.result()
+        with pytest.raises(ValueError):
+            waiter.result()
+    assert flights.do("key", lambda: "recovered") == "recovered"
+
+
+def test_async_callers_are_coalesced_with_each_other_and_with_threads():
+    flights = singleflight.Group("test-async")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return "page"
+
+    async def main():
+        return await asyncio.gather(*(flights.do_async("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["page"] * 5
+    assert len(calls) == 1
+
+    # 同期ハンドラー（スレッド）の計算に、非同期ハンドラーがイベントループを止めずに合流します
+    started = threading.Event()
+
+    def compute():
+        started.set()
+        time.sleep(0.2)
+        return "shared"
+
+    async def join_sync_flight():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        tick_task = asyncio.create_task(ticker())
+        result = await flights.do_async("sync-key", fetch)
+        tick_task.cancel()
+        return result, ticks
+
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(flights.do, "sync-key", compute)
+        started.wait()
+        result, ticks = asyncio.run(join_sync_flight())
+    assert result == leader.result() == "shared"
+    assert ticks > 5
+    assert len(calls) == 1
+
+
+def test_cache_misses_are_coalesced_and_stale_results_not_stored():
+    previous = cache.configure(cache.MemoryCache())
+    try:
+        coalesced = metrics.SINGLEFLIGHT_COALESCED.value(group="cache:test-herd")
+        calls = []
+        barrier = threading.Barrier(6)
+
+        def call():
+            barrier.wait()
+            return cache.get_or_set("test-herd", "0:100", _slow(calls, "page"))
+
+        with ThreadPoolExecutor(6) as pool:
+            assert list(pool.map(lambda _: call(), range(6))) == ["page"] * 6
+        assert len(calls) == 1
+        assert metrics.SINGLEFLIGHT_COALESCED.value(group="cache:test-herd") == coalesced + 5
+
+        # 計算中に無効化された値は、その呼び出しには返しますが保存しません
+        cache.invalidate("test-herd")
+
+        def compute_then_invalidate():
+            cache.invalidate("test-herd")
+            return "stale"
+
+        assert cache.get_or_set("test-herd", "0:100", compute_then_invalidate) == "stale"
+        assert cache.get_or_set("test-herd", "0:100", lambda: "fresh") == "fresh"
+    finally:
+        cache.configure(previous)
@@ -0,0 +1,60 @@
+from fastapi.testclient import TestClient
+
+from ..main import app
+from ..database import engine
+from .. import slowquery
+
+
+def _get_token(client: TestClient, username: str, password: str) -> str:
+    resp = client.post("/token", data={"username": username, "password": password})
+    assert resp.status_code == 200
+    return resp.json()["access_token"]
+
+
+def test_redact_parameters():
+    assert slowquery.redact(("ﾃｽﾄ", 3, None, b"xx")) == [
+        "<str len=3>",
+        3,
+        None,
+        "<bytes len=2>",
+    ]
+    assert slowquery.redact({"q": "secret", "limit": 10}) == {
+        "q": "<str len=6>",
+        "limit": 10,
+    }
+
+
+def test_slow_queries_are_recorded_with_plan(monkeypatch):
+    # 閾値0msで全SQLを記録させます
+    monkeypatch.setattr(slowquery, "THRESHOLD_MS", 0.0)
+    slowquery.instrument_engine(engine)
+    slowquery.clear()
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '999999', 'admin')}"}
+        assert client.get("/users/search", params={"query": "ﾃｽﾄｲﾁ"}).status_code == 200
+
+        resp = client.get("/admin/diagnostics/slow-queries", headers=headers)
+        assert resp.status_code == 200
+        records = resp.json()
+        search = [
+            r
+            for r in records
+            if r["route"] == "/users/search" and "FROM users" in r["statement"]
+        ]
+        assert search
+        record = search[0]
+        assert record["statement"].lstrip().upper().startswith("SELECT")
+        assert record["plan"]
+        assert any("SCAN" in line or "SEARCH" in line for line in record["plan"])
+        assert "ﾃｽﾄｲﾁ" not in str(record["parameters"])
+        assert any(str(p).startswith("<str len=") for p in record["parameters"])
+
+        assert client.delete("/admin/diagnostics/slow-queries", headers=headers).status_code == 204
+        monkeypatch.setattr(slowquery, "THRESHOLD_MS", None)
+        assert client.get("/admin/diagnostics/slow-queries", headers=headers).json() == []
+
+
+def test_slow_queries_require_admin():
+    with TestClient(app) as client:
+        headers = {"Authorization": f"Bearer {_get_token(client, '000001', '000001')}"}
+        assert client.get("/admin/diagnostics/slow-queries", headers=headers).status_code == 403
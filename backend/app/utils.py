@@ -1,8 +1,36 @@
 from datetime import datetime, timezone
 
+from sqlalchemy.types import DateTime, TypeDecorator
 
-def normalize_to_utc(dt: datetime | None) -> datetime | None:
-    """Return datetime with UTC tzinfo if not already set."""
-    if dt is not None and dt.tzinfo is None:
-        return dt.replace(tzinfo=timezone.utc)
-    return dt
+
+class UTCDateTime(TypeDecorator):
+    """Timezone-aware UTC datetime column.
+
+    SQLite does not keep the offset of ``DateTime(timezone=True)``, so values
+    are stored as UTC and tagged with ``timezone.utc`` when rows are loaded.
+    Naive values are taken to be UTC already.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value: datetime | None, dialect) -> datetime | None:
+        if value is not None and value.tzinfo is not None:
+            # 他のタイムゾーンの値は UTC に揃えてから保存します
+            value = value.astimezone(timezone.utc)
+        return value
+
+    def process_result_value(self, value: datetime | None, dialect) -> datetime | None:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+
+def to_halfwidth_kana(text: str) -> str:
+    """Convert full-width katakana to half-width, leaving ASCII and digits as-is."""
+    # jaconv は読み込みが重いため、初回の変換時まで遅らせます
+    import jaconv
+
+    return jaconv.z2h(text, kana=True, ascii=False, digit=False)
@@ -0,0 +1,358 @@
+"""Seed a synthetic hospital-scale dataset for benchmarks.
+
+Usage (from ``backend``)::
+
+    python -m bench.datagen --preset hospital --database-url sqlite:///./bench.db
+
+Everything is written with bulk INSERTs into empty tables (``--reset`` drops
+and recreates them first). Distributions are skewed like the real data:
+
+* department sizes are log-normal (a few big wards, many small sections)
+* post authorship and mention popularity follow a Zipf law
+* most user mentions stay within the author's department
+* likes concentrate on a few popular posts (capped at one like per user)
+
+All generated users share ``PASSWORD`` (hashed once) so the benchmark runner
+can log in as anyone; ``ADMIN_EMPLOYEE_ID`` is an administrator. User
+counters and the daily activity rollups are filled in consistently, so
+``python -m app.cli reconcile-counters`` reports nothing to fix.
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault("SECRET_KEY", "bench")
+
+import jaconv
+from sqlalchemy import bindparam, create_engine, event, func, insert, select, update
+
+from app import auth, models
+from app.database import Base
+
+PASSWORD = "bench-password"
+ADMIN_EMPLOYEE_ID = "900000"
+FIRST_EMPLOYEE_ID = 100000
+
+PRESETS = {
+    "tiny": dict(users=200, departments=10, posts=2_000, likes=8_000),
+    "small": dict(users=2_000, departments=40, posts=50_000, likes=200_000),
+    "medium": dict(users=8_000, departments=100, posts=500_000, likes=2_000_000),
+    "hospital": dict(users=20_000, departments=200, posts=2_000_000, likes=10_000_000),
+}
+
+# 半角カナの音節（氏名生成用）
+_SYLLABLES = "ｱｲｳｴｵｶｷｸｹｺｻｼｽｾｿﾀﾁﾂﾃﾄﾅﾆﾇﾈﾉﾊﾋﾌﾍﾎﾏﾐﾑﾒﾓﾔﾕﾖﾗﾘﾙﾚﾛﾜ"
+# 部署名はアプリと同じく半角カナで保存します
+_DEPARTMENT_KINDS = ["病棟", "外来", "検査科", "薬剤部", "ﾘﾊﾋﾞﾘ科", "医事課", "総務課"]
+_MESSAGES = [
+    "いつもありがとうございます",
+    "夜勤のフォロー助かりました",
+    "急変対応ありがとうございました",
+    "申し送りが丁寧で助かります",
+    "物品補充ありがとうございます",
+    "新人指導おつかれさまです",
+]
+
+
+def _zipf_cum_weights(n: int, s: float) -> list[float]:
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank**s
+        cum.append(total)
+    return cum
+
+
+def _pick(rng: random.Random, cum_weights: list[float]) -> int:
+    return bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+
+
+def _kana_name(rng: random.Random) -> str:
+    family = "".join(rng.choices(_SYLLABLES, k=rng.randint(2, 3)))
+    given = "".join(rng.choices(_SYLLABLES, k=rng.randint(2, 3)))
+    return f"{family} {given}"
+
+
+def _like_counts(rng: random.Random, posts: int, likes: int, users: int, s: float) -> list[int]:
+    """Distribute ``likes`` over posts by Zipf popularity, capped per post."""
+    cum = _zipf_cum_weights(posts, s)
+    total = cum[-1]
+    ranks = list(range(posts))
+    rng.shuffle(ranks)
+    weights = [cum[0]] + [b - a for a, b in zip(cum, cum[1:])]
+    cap = users - 1
+    return [min(cap, int(likes * weights[r] / total + rng.random())) for r in ranks]
+
+
+def _connect(database_url: str):
+    if database_url.startswith("sqlite"):
+        engine = create_engine(database_url, connect_args={"check_same_thread": False})
+
+        @event.listens_for(engine, "connect")
+        def _fast_load(dbapi_conn, _):
+            # 生成専用の接続なので、耐障害性より書き込み速度を優先します
+            dbapi_conn.execute("PRAGMA journal_mode=WAL")
+            dbapi_conn.execute("PRAGMA synchronous=OFF")
+
+        return engine
+    return create_engine(database_url)
+
+
+def generate(
+    database_url: str,
+    users: int,
+    departments: int,
+    posts: int,
+    likes: int,
+    days: int = 180,
+    mentions_per_post: float = 1.4,
+    department_mention_rate: float = 0.15,
+    same_department_rate: float = 0.7,
+    skew: float = 1.1,
+    seed: int = 42,
+    reset: bool = False,
+    batch_size: int = 10_000,
+    log=print,
+) -> dict:
+    """Populate ``database_url`` and return a summary of what was written."""
+    rng = random.Random(seed)
+    engine = _connect(database_url)
+    if reset:
+        Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(models.User)).scalar():
+            raise SystemExit("Target database already has users; use --reset")
+
+    started = time.perf_counter()
+    timings: dict[str, float] = {}
+    # 全ユーザー共通のパスワードハッシュ（bcryptは1回だけ）
+    hashed_password = auth.get_password_hash(PASSWORD)
+
+    # --- departments ---
+    dept_rows = [
+        {"id": i + 1, "name": f"{i + 1:03d}{_DEPARTMENT_KINDS[i % len(_DEPARTMENT_KINDS)]}"}
+        for i in range(departments)
+    ]
+    dept_cum = list(itertools.accumulate(rng.lognormvariate(0, 1) for _ in range(departments)))
+
+    # --- users ---
+    user_dept = [0] * (users + 1)  # index = user id
+    members: dict[int, list[int]] = defaultdict(list)
+    user_rows = []
+    for uid in range(1, users + 1):
+        dept_id = _pick(rng, dept_cum) + 1
+        user_dept[uid] = dept_id
+        members[dept_id].append(uid)
+        name = _kana_name(rng)
+        user_rows.append(
+            {
+                "id": uid,
+                "employee_id": ADMIN_EMPLOYEE_ID if uid == 1 else str(FIRST_EMPLOYEE_ID + uid),
+                "name": name,
+                "display_name": jaconv.h2z(name),
+                "hashed_password": hashed_password,
+                "department_id": dept_id,
+                "is_admin": uid == 1,
+                "is_active": True,
+                "last_seen": datetime.now(timezone.utc) - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+                "appreciated_count": 0,
+                "expressed_count": 0,
+                "likes_received": 0,
+            }
+        )
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Department), dept_rows)
+        for start in range(0, len(user_rows), batch_size):
+            conn.execute(insert(models.User), user_rows[start : start + batch_size])
+    timings["users"] = time.perf_counter() - started
+    log(f"inserted {departments} departments and {users} users")
+
+    # ユーザーの活動度・人気度の順位（Zipf）をランダムに割り当てます
+    author_order = list(range(1, users + 1))
+    rng.shuffle(author_order)
+    popular_order = list(range(1, users + 1))
+    rng.shuffle(popular_order)
+    user_cum = _zipf_cum_weights(users, skew)
+    like_counts = _like_counts(rng, posts, likes, users, skew * 0.8)
+
+    appreciated = [0] * (users + 1)
+    expressed = [0] * (users + 1)
+    received = [0] * (users + 1)
+    counts = Counter()
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    begin = now - timedelta(days=days)
+    step = (now - begin) / max(posts, 1)
+    post_rows, mention_rows, dept_mention_rows, like_rows = [], [], [], []
+    activity: dict[tuple[int, object], list[int]] = defaultdict(lambda: [0, 0, 0])
+    current_day = None
+    phase_start = time.perf_counter()
+
+    buffers = (
+        (models.Post.__table__, post_rows),
+        (models.post_mentions, mention_rows),
+        (models.post_department_mentions, dept_mention_rows),
+        (models.post_likes, like_rows),
+    )
+
+    def flush(conn, final: bool = False):
+        if not final and all(len(rows) < batch_size for _, rows in buffers):
+            return
+        # 外部キーを満たすよう、投稿を先に書き出します
+        for table, rows in buffers:
+            if rows:
+                conn.execute(insert(table), rows)
+                counts[table.name] += len(rows)
+                rows.clear()
+
+    def flush_activity(conn):
+        if activity:
+            conn.execute(
+                insert(models.UserActivityDaily),
+                [
+                    {
+                        "user_id": uid,
+                        "day": day,
+                        "appreciated_count": a,
+                        "expressed_count": e,
+                        "likes_received": r,
+                    }
+                    for (uid, day), (a, e, r) in activity.items()
+                ],
+            )
+            counts["user_activity_daily"] += len(activity)
+            activity.clear()
+
+    with engine.begin() as conn:
+        for post_id in range(1, posts + 1):
+            created_at = begin + step * (post_id - 1) + timedelta(seconds=rng.random())
+            day = created_at.date()
+            if day != current_day:
+                # 投稿は時刻順に生成するので、日が変わったら前日の集計を書き出します
+                flush(conn, final=True)
+                flush_activity(conn)
+                current_day = day
+            author = author_order[_pick(rng, user_cum)]
+            post_rows.append(
+                {
+                    "id": post_id,
+                    "content": rng.choice(_MESSAGES),
+                    "created_at": created_at,
+                    "author_id": author,
+                    "is_deleted": False,
+                    "report_status": models.ReportStatus.pending,
+                }
+            )
+            expressed[author] += 1
+            activity[(author, day)][1] += 1
+
+            mentioned = set()
+            for _ in range(max(1, round(rng.expovariate(1 / mentions_per_post)))):
+                colleagues = members[user_dept[author]]
+                if rng.random() < same_department_rate and len(colleagues) > 1:
+                    target = rng.choice(colleagues)
+                else:
+                    target = popular_order[_pick(rng, user_cum)]
+                if target != author:
+                    mentioned.add(target)
+            for target in mentioned:
+                mention_rows.append({"post_id": post_id, "user_id": target})
+                appreciated[target] += 1
+                activity[(target, day)][0] += 1
+
+            if rng.random() < department_mention_rate:
+                dept_id = user_dept[author] if rng.random() < 0.5 else _pick(rng, dept_cum) + 1
+                dept_mention_rows.append({"post_id": post_id, "department_id": dept_id})
+
+            n_likes = like_counts[post_id - 1]
+            if n_likes:
+                for liker in rng.sample(range(1, users + 1), n_likes):
+                    like_rows.append({"post_id": post_id, "user_id": liker})
+                received[author] += n_likes
+                activity[(author, day)][2] += n_likes
+
+            flush(conn)
+            if post_id % 100_000 == 0:
+                log(f"  {post_id}/{posts} posts")
+        flush(conn, final=True)
+        flush_activity(conn)
+
+        conn.execute(
+            update(models.User.__table__)
+            .where(models.User.__table__.c.id == bindparam("uid"))
+            .values(
+                appreciated_count=bindparam("a"),
+                expressed_count=bindparam("e"),
+                likes_received=bindparam("r"),
+            ),
+            [
+                {"uid": uid, "a": appreciated[uid], "e": expressed[uid], "r": received[uid]}
+                for uid in range(1, users + 1)
+            ],
+        )
+    timings["posts"] = time.perf_counter() - phase_start
+    engine.dispose()
+
+    summary = {
+        "database_url": database_url,
+        "seed": seed,
+        "departments": departments,
+        "users": users,
+        "posts": counts["posts"],
+        "post_mentions": counts["post_mentions"],
+        "post_department_mentions": counts["post_department_mentions"],
+        "post_likes": counts["post_likes"],
+        "user_activity_daily": counts["user_activity_daily"],
+        "seconds": {k: round(v, 2) for k, v in timings.items()},
+        "admin_employee_id": ADMIN_EMPLOYEE_ID,
+        "password": PASSWORD,
+    }
+    summary["seconds"]["total"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db")
+    )
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--departments", type=int)
+    parser.add_argument("--posts", type=int)
+    parser.add_argument("--likes", type=int)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--mentions-per-post", type=float, default=1.4)
+    parser.add_argument("--department-mention-rate", type=float, default=0.15)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables")
+    args = parser.parse_args(argv)
+
+    volumes = dict(PRESETS[args.preset])
+    for key in volumes:
+        if getattr(args, key) is not None:
+            volumes[key] = getattr(args, key)
+    summary = generate(
+        args.database_url,
+        days=args.days,
+        mentions_per_post=args.mentions_per_post,
+        department_mention_rate=args.department_mention_rate,
+        skew=args.skew,
+        seed=args.seed,
+        reset=args.reset,
+        **volumes,
+    )
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
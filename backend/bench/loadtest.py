@@ -0,0 +1,384 @@
+"""Closed-loop load test against a real uvicorn server.
+
+Usage (from ``backend``, after ``python -m bench.datagen``)::
+
+    python -m bench.loadtest --database-url sqlite:///./bench.db \\
+        --scenario shift_change --concurrency 50 --duration 60 --workers 1,2,4
+
+For every worker count a ``uvicorn app.main:app`` subprocess is started on
+the given database. ``--concurrency`` virtual users then loop without think
+time (closed loop): each picks an action by the scenario's weights, waits
+for the response and immediately picks the next one. Use ``--url`` to drive
+an already running server instead.
+
+The JSON report has latency percentiles per action for every
+``--window`` seconds, overall percentiles, error counts by kind, and the
+number of "database is locked" errors and tracebacks in the server's stderr.
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from .datagen import PASSWORD
+
+# シナリオ = [(所要時間に占める割合, {アクション: 重み})]
+SCENARIOS = {
+    # 08:30の交代時間帯: 最初は一斉ログイン、その後タイムラインの確認と投稿・いいねが集中
+    "shift_change": [
+        (0.25, {"login": 6, "timeline": 3, "mentioned": 1}),
+        (
+            0.75,
+            {
+                "timeline": 40,
+                "mentioned": 10,
+                "post_burst": 12,
+                "like_storm": 30,
+                "unlike": 3,
+                "login": 5,
+            },
+        ),
+    ],
+    "steady": [
+        (1.0, {"timeline": 60, "mentioned": 15, "post_burst": 5, "like_storm": 15, "login": 5}),
+    ],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(q: float) -> float:
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    return {
+        "count": len(values),
+        "p50_ms": round(pick(50) * 1000, 2),
+        "p95_ms": round(pick(95) * 1000, 2),
+        "p99_ms": round(pick(99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+class Server:
+    """``uvicorn`` subprocess whose stderr is scanned for database errors."""
+
+    def __init__(
+        self,
+        database_url: str,
+        workers: int,
+        extra_env: dict | None = None,
+        command: list[str] | None = None,
+    ):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "SECRET_KEY": os.getenv("SECRET_KEY", "bench"),
+            # "{port}" は割り当てたポート番号に置き換えます
+            **{k: v.format(port=self.port) for k, v in (extra_env or {}).items()},
+        }
+        if command is None:
+            command = [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(workers),
+                "--log-level",
+                "warning",
+                "--no-access-log",
+            ]
+        else:
+            command = [arg.format(port=self.port) for arg in command]
+        self.process = subprocess.Popen(
+            command,
+            env=env,
+            stderr=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            text=True,
+        )
+        self.locked_errors = 0
+        self.tracebacks = 0
+        self.stderr_tail: list[str] = []
+        self._reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._reader.start()
+
+    def _read_stderr(self) -> None:
+        for line in self.process.stderr:
+            if "database is locked" in line:
+                self.locked_errors += 1
+            if line.startswith("Traceback"):
+                self.tracebacks += 1
+            self.stderr_tail = (self.stderr_tail + [line.rstrip()])[-20:]
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("server exited:\n" + "\n".join(self.stderr_tail))
+            try:
+                if httpx.get(f"{self.url}/departments", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("server did not become ready")
+
+    def stop(self) -> None:
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._reader.join(timeout=5)
+
+
+def _load_fixtures(database_url: str) -> dict:
+    """Employee ids, departments and popular posts to build requests from."""
+    from sqlalchemy import create_engine, func, select
+
+    from app import models
+
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        users = conn.execute(
+            select(models.User.id, models.User.employee_id, models.User.department_id).where(
+                models.User.is_active.is_(True), models.User.is_admin.is_(False)
+            )
+        ).all()
+        departments = conn.scalars(select(models.Department.id)).all()
+        popular = conn.scalars(
+            select(models.post_likes.c.post_id)
+            .group_by(models.post_likes.c.post_id)
+            .order_by(func.count().desc())
+            .limit(20)
+        ).all() or conn.scalars(select(models.Post.id).limit(20)).all()
+    engine.dispose()
+    if not users:
+        raise SystemExit("No users in the database; run python -m bench.datagen first")
+    return {"users": users, "departments": departments, "popular_posts": popular}
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, fixtures: dict, rng: random.Random):
+        self.client = client
+        self.fixtures = fixtures
+        self.rng = rng
+        self.user = rng.choice(fixtures["users"])
+        self.headers: dict = {}
+
+    async def login(self):
+        resp = await self.client.post(
+            "/token", data={"username": self.user.employee_id, "password": PASSWORD}
+        )
+        if resp.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        return resp
+
+    async def timeline(self):
+        return await self.client.get("/posts/", headers=self.headers)
+
+    async def mentioned(self):
+        return await self.client.get("/posts/mentioned", headers=self.headers)
+
+    async def post_burst(self):
+        users = self.fixtures["users"]
+        colleagues = [u.id for u in self.rng.sample(users, min(3, len(users))) if u.id != self.user.id]
+        departments = self.fixtures["departments"]
+        body = {
+            "content": "交代前の申し送りありがとうございました",
+            "mention_user_ids": colleagues[: self.rng.randint(1, max(1, len(colleagues)))],
+            "mention_department_ids": (
+                [self.rng.choice(departments)] if departments and self.rng.random() < 0.3 else []
+            ),
+        }
+        return await self.client.post("/posts/", json=body, headers=self.headers)
+
+    async def like_storm(self):
+        post_id = self.rng.choice(self.fixtures["popular_posts"])
+        return await self.client.post(f"/posts/{post_id}/like", headers=self.headers)
+
+    async def unlike(self):
+        post_id = self.rng.choice(self.fixtures["popular_posts"])
+        return await self.client.delete(f"/posts/{post_id}/like", headers=self.headers)
+
+
+async def _drive(
+    base_url: str, fixtures: dict, scenario: str, concurrency: int, duration: float, seed: int
+) -> tuple[list[tuple[float, str, float, str]], float]:
+    phases = SCENARIOS[scenario]
+    boundaries = [duration * end for end in itertools.accumulate(s for s, _ in phases)]
+    samples: list[tuple[float, str, float, str]] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+
+        async def run_user(index: int):
+            rng = random.Random(seed * 1_000_003 + index)
+            vu = VirtualUser(client, fixtures, rng)
+            first = True
+            while (now := time.perf_counter()) < deadline:
+                if first:
+                    action = "login"  # 各仮想ユーザーはまずログインします
+                    first = False
+                else:
+                    phase = phases[min(bisect.bisect(boundaries, now - start), len(phases) - 1)][1]
+                    action = rng.choices(list(phase), weights=list(phase.values()))[0]
+                t0 = time.perf_counter()
+                try:
+                    resp = await getattr(vu, action)()
+                    outcome = str(resp.status_code)
+                except httpx.TimeoutException:
+                    outcome = "timeout"
+                except httpx.HTTPError as exc:
+                    outcome = type(exc).__name__
+                t1 = time.perf_counter()
+                samples.append((t1 - start, action, t1 - t0, outcome))
+
+        await asyncio.gather(*(run_user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return samples, elapsed
+
+
+def _report(samples, elapsed: float, window: float) -> dict:
+    by_action: dict[str, list[float]] = defaultdict(list)
+    by_window: dict[int, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    errors: Counter[str] = Counter()
+    window_errors: Counter[int] = Counter()
+    for at, action, latency, outcome in samples:
+        by_action[action].append(latency)
+        bucket = int(at // window)
+        by_window[bucket][action].append(latency)
+        if not outcome.startswith(("2", "3")):
+            errors[f"{action}:{outcome}"] += 1
+            window_errors[bucket] += 1
+    total = len(samples)
+    return {
+        "requests": total,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "errors": dict(errors.most_common()),
+        "actions": {action: _percentiles(v) for action, v in sorted(by_action.items())},
+        "windows": [
+            {
+                "start_s": bucket * window,
+                "requests": sum(len(v) for v in actions.values()),
+                "errors": window_errors[bucket],
+                "all": _percentiles([x for v in actions.values() for x in v]),
+                "actions": {a: _percentiles(v) for a, v in sorted(actions.items())},
+            }
+            for bucket, actions in sorted(by_window.items())
+        ],
+    }
+
+
+def run(
+    database_url: str,
+    scenario: str = "shift_change",
+    concurrency: int = 50,
+    duration: float = 60,
+    workers: int = 1,
+    window: float = 5,
+    seed: int = 1,
+    url: str | None = None,
+    server_env: dict | None = None,
+    server_command: list[str] | None = None,
+) -> dict:
+    fixtures = _load_fixtures(database_url)
+    server = None
+    if url is None:
+        server = Server(database_url, workers, server_env, server_command)
+        server.wait_ready()
+        url = server.url
+    try:
+        samples, elapsed = asyncio.run(
+            _drive(url, fixtures, scenario, concurrency, duration, seed)
+        )
+    finally:
+        if server:
+            server.stop()
+    report = {
+        "scenario": scenario,
+        "workers": workers if server else None,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        **_report(samples, elapsed, window),
+    }
+    if server:
+        report["server"] = {
+            "database_locked_errors": server.locked_errors,
+            "tracebacks": server.tracebacks,
+            "exit_code": server.process.returncode,
+        }
+    return report
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Closed-loop load test.")
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db")
+    )
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="shift_change")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60, help="seconds per run")
+    parser.add_argument(
+        "--workers", default="1", help="comma separated uvicorn worker counts to compare"
+    )
+    parser.add_argument("--window", type=float, default=5, help="seconds per report window")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="drive an already running server instead")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    runs = [
+        run(
+            args.database_url,
+            scenario=args.scenario,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            workers=int(workers),
+            window=args.window,
+            seed=args.seed,
+            url=args.url,
+        )
+        for workers in args.workers.split(",")
+    ]
+    text = json.dumps({"runs": runs}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
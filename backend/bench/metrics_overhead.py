@@ -0,0 +1,87 @@
+"""Measure the hot-path overhead of app.metrics.
+
+Usage (from ``backend``): ``python -m bench.metrics_overhead``
+Prints a JSON report with per-call costs of the primitives and the added
+latency per HTTP request and per SQL statement.
+"""
+import json
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import metrics
+
+
+def _per_call_ns(fn, n: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - start) / n
+
+
+def _request_us(app: FastAPI, n: int) -> float:
+    with TestClient(app) as client:
+        for _ in range(200):
+            client.get("/ping")
+        start = time.perf_counter()
+        for _ in range(n):
+            client.get("/ping")
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def _make_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+def _statement_us(instrumented: bool, n: int) -> float:
+    engine = create_engine("sqlite://")
+    if instrumented:
+        metrics.instrument_engine(engine)
+    with engine.connect() as conn:
+        stmt = text("SELECT 1")
+        start = time.perf_counter()
+        for _ in range(n):
+            conn.execute(stmt).scalar()
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def main() -> None:
+    n = 100_000
+    hist = metrics.Histogram("bench_seconds", "bench", ("route",))
+    counter = metrics.Counter("bench_total", "bench", ("route",))
+    report = {
+        "histogram_observe_ns": round(_per_call_ns(lambda: hist.observe(0.01, route="/x"), n)),
+        "counter_inc_ns": round(_per_call_ns(lambda: counter.inc(route="/x"), n)),
+    }
+    plain = _request_us(_make_app(False), 3000)
+    instrumented = _request_us(_make_app(True), 3000)
+    report["request_us"] = {
+        "plain": round(plain, 1),
+        "instrumented": round(instrumented, 1),
+        "overhead": round(instrumented - plain, 1),
+    }
+    plain = _statement_us(False, 20_000)
+    instrumented = _statement_us(True, 20_000)
+    report["sql_statement_us"] = {
+        "plain": round(plain, 2),
+        "instrumented": round(instrumented, 2),
+        "overhead": round(instrumented - plain, 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
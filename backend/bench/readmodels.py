@@ -0,0 +1,172 @@
+"""Timeline serialization: ORM path vs Core read models.
+
+Usage (from ``backend``, after ``python -m bench.datagen``)::
+
+    python -m bench.readmodels --database-url sqlite:///./bench.db
+
+For the latest page of ``/posts/`` (anonymous and logged in) and of
+``/posts/mentioned`` it runs both paths directly, without HTTP:
+
+* ``orm`` - the previous implementation: ``crud.get_posts`` /
+  ``crud.get_posts_mentioned`` with joined mentions, departments and likers,
+  copied into ``schemas.Post`` and validated again as the response model
+* ``core`` - ``readmodels.timeline`` / ``readmodels.mentioned`` and
+  ``readmodels.dump_posts`` (with the timeline cache cleared before each call)
+* ``cached`` - ``/posts/`` only: the same with the page served from the
+  timeline cache (likes and names are still added per request)
+
+and reports latency percentiles (ms) plus the peak memory allocated per
+request (KiB, from ``tracemalloc`` on separate runs).
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+
+def _peak_kib(call, repeat: int) -> float:
+    peaks = []
+    for _ in range(repeat):
+        tracemalloc.start()
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak / 1024)
+    return round(statistics.median(peaks), 1)
+
+
+def _latency(call, iterations: int) -> dict:
+    values = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        call()
+        values.append((time.perf_counter() - t0) * 1000)
+    values.sort()
+    return {
+        "p50_ms": round(values[len(values) // 2], 3),
+        "p95_ms": round(values[max(0, int(len(values) * 0.95) - 1)], 3),
+        "mean_ms": round(statistics.fmean(values), 3),
+    }
+
+
+def run(database_url: str, iterations: int = 50, alloc_runs: int = 3) -> dict:
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", "bench")
+
+    from pydantic import TypeAdapter
+    from sqlalchemy import func, select
+
+    from app import cache, crud, models, readmodels, schemas
+    from app.database import SessionLocal
+
+    adapter = TypeAdapter(list[schemas.Post])
+
+    def orm_body(posts, user_id):
+        result = [
+            schemas.Post(
+                id=p.id,
+                content=p.content,
+                created_at=p.created_at,
+                mention_user_ids=p.mention_user_ids,
+                mention_department_ids=p.mention_department_ids,
+                mention_user_names=p.mention_user_names,
+                mention_department_names=p.mention_department_names,
+                like_count=p.like_count,
+                liked_by_me=user_id in [u.id for u in p.likers] if user_id else False,
+            )
+            for p in posts
+        ]
+        # FastAPI は response_model でもう一度検証してからシリアライズしていました
+        return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
+    db = SessionLocal()
+    try:
+        # メンションの多い利用者を選びます
+        user = db.get(
+            models.User,
+            db.scalar(
+                select(models.post_mentions.c.user_id)
+                .group_by(models.post_mentions.c.user_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            )
+            or 1,
+        )
+        user_id, department_id = user.id, user.department_id
+    finally:
+        db.close()
+
+    def with_session(fn):
+        def call():
+            db = SessionLocal()
+            try:
+                return fn(db)
+            finally:
+                db.close()
+
+        return call
+
+    def uncached(fn):
+        def call(db):
+            cache.backend().clear(readmodels.TIMELINE_NAMESPACE)
+            return fn(db)
+
+        return call
+
+    cases = {
+        "posts_anonymous": {
+            "orm": lambda db: orm_body(crud.get_posts(db), None),
+            "core": uncached(lambda db: readmodels.dump_posts(readmodels.timeline(db))),
+            "cached": lambda db: readmodels.dump_posts(readmodels.timeline(db)),
+        },
+        "posts_logged_in": {
+            "orm": lambda db: orm_body(crud.get_posts(db), user_id),
+            "core": uncached(
+                lambda db: readmodels.dump_posts(readmodels.timeline(db, user_id=user_id))
+            ),
+            "cached": lambda db: readmodels.dump_posts(readmodels.timeline(db, user_id=user_id)),
+        },
+        "posts_mentioned": {
+            "orm": lambda db: orm_body(
+                crud.get_posts_mentioned(db, user_id=user_id, department_id=department_id),
+                user_id,
+            ),
+            "core": lambda db: readmodels.dump_posts(
+                readmodels.mentioned(db, user_id=user_id, department_id=department_id)
+            ),
+        },
+    }
+
+    results: dict[str, dict] = {}
+    for name, paths in cases.items():
+        results[name] = {}
+        for path, fn in paths.items():
+            call = with_session(fn)
+            body = call()  # warm-up
+            results[name][path] = {
+                "posts": len(json.loads(body)),
+                "bytes": len(body),
+                **_latency(call, iterations),
+                "peak_kib": _peak_kib(call, alloc_runs),
+            }
+        orm, core = results[name]["orm"], results[name]["core"]
+        results[name]["speedup"] = round(orm["p50_ms"] / core["p50_ms"], 2) if core["p50_ms"] else None
+    return {"database_url": database_url, "iterations": iterations, "cases": results}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare ORM and Core timeline serialization.")
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db")
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--alloc-runs", type=int, default=3)
+    args = parser.parse_args(argv)
+    report = run(args.database_url, iterations=args.iterations, alloc_runs=args.alloc_runs)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""In-process benchmark runner.
+
+Usage (from ``backend``, after ``python -m bench.datagen``)::
+
+    python -m bench.runner --database-url sqlite:///./bench.db --output run.json
+    python -m bench.runner --baseline run.json   # also report p95 change
+
+Each scenario issues requests through FastAPI's ``TestClient`` against the
+real application and reports latency percentiles (ms), throughput and the
+number of SQL statements per request as JSON. The statement count comes
+from an engine listener keyed by route template, so it includes the
+statements of authentication dependencies.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _summarize(latencies: list[float], errors: int, elapsed: float, statements: float) -> dict:
+    values = sorted(seconds * 1000 for seconds in latencies)
+    n = len(values)
+    return {
+        "requests": n,
+        "errors": errors,
+        "p50_ms": round(_percentile(values, 50), 3),
+        "p95_ms": round(_percentile(values, 95), 3),
+        "p99_ms": round(_percentile(values, 99), 3),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "throughput_rps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+        "queries_per_request": round(statements / n, 2) if n else 0.0,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    database_url: str,
+    iterations: int = 200,
+    admin_iterations: int = 5,
+    warmup: int = 5,
+    scenarios: list[str] | None = None,
+    seed: int = 1,
+) -> dict:
+    # アプリのモジュールは DATABASE_URL を読み込み時に参照するため、先に設定します
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", "bench")
+
+    import logging
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event, func, select
+
+    from app import metrics, models
+    from app.database import SessionLocal, engine
+    from app.main import app
+
+    from .datagen import ADMIN_EMPLOYEE_ID, PASSWORD
+
+    logging.getLogger().setLevel(logging.WARNING)
+    rng = random.Random(seed)
+
+    statements: Counter[str] = Counter()
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements[metrics.current_route()] += 1
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+
+    db = SessionLocal()
+    try:
+        dataset = {
+            "users": db.scalar(select(func.count()).select_from(models.User)),
+            "departments": db.scalar(select(func.count()).select_from(models.Department)),
+            "posts": db.scalar(select(func.count()).select_from(models.Post)),
+            "post_likes": db.scalar(select(func.count()).select_from(models.post_likes)),
+        }
+        employee_ids = db.scalars(
+            select(models.User.employee_id)
+            .where(models.User.is_admin.is_(False))
+            .order_by(models.User.appreciated_count.desc())
+            .limit(50)
+        ).all()
+        names = db.scalars(select(models.User.name).limit(500)).all()
+        popular_posts = db.scalars(
+            select(models.post_likes.c.post_id)
+            .group_by(models.post_likes.c.post_id)
+            .order_by(func.count().desc())
+            .limit(50)
+        ).all() or db.scalars(select(models.Post.id).limit(50)).all()
+    finally:
+        db.close()
+
+    results: dict[str, dict] = {}
+    with TestClient(app) as client:
+
+        def login(employee_id: str, password: str) -> dict:
+            resp = client.post("/token", data={"username": employee_id, "password": password})
+            resp.raise_for_status()
+            return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        # bcrypt はログインシナリオ以外に含めないよう、トークンは先に取得しておきます
+        user_headers = [login(e, PASSWORD) for e in employee_ids[:10]]
+        admin_headers = login(ADMIN_EMPLOYEE_ID, PASSWORD)
+
+        def search_query() -> str:
+            name = rng.choice(names).replace(" ", "")
+            start = rng.randrange(max(1, len(name) - 1))
+            return name[start : start + 2]
+
+        def like_pair():
+            headers = rng.choice(user_headers)
+            post_id = rng.choice(popular_posts)
+            return [
+                ("like", lambda: client.post(f"/posts/{post_id}/like", headers=headers)),
+                ("unlike", lambda: client.delete(f"/posts/{post_id}/like", headers=headers)),
+            ]
+
+        def token():
+            employee_id = rng.choice(employee_ids)
+            return [
+                (
+                    "token",
+                    lambda: client.post(
+                        "/token", data={"username": employee_id, "password": PASSWORD}
+                    ),
+                )
+            ]
+
+        def posts():
+            headers = rng.choice(user_headers)
+            return [("posts", lambda: client.get("/posts/", headers=headers))]
+
+        def posts_mentioned():
+            headers = rng.choice(user_headers)
+            return [("posts_mentioned", lambda: client.get("/posts/mentioned", headers=headers))]
+
+        def users_search():
+            query = search_query()
+            return [
+                ("users_search", lambda: client.get("/users/search", params={"query": query}))
+            ]
+
+        def admin_listing(name, path):
+            def steps():
+                return [(name, lambda: client.get(path, headers=admin_headers))]
+
+            return steps
+
+        catalogue = {
+            "token": (max(1, iterations // 10), token),
+            "posts": (iterations, posts),
+            "posts_mentioned": (iterations, posts_mentioned),
+            "users_search": (iterations, users_search),
+            "like_unlike": (iterations, like_pair),
+        }
+        # 管理画面の一覧は全件を返すため、回数を絞って実行します
+        admin_listings = {
+            "admin_users": "/admin/users/",
+            "admin_users_top": "/admin/users/top/appreciated",
+            "admin_users_top_window": "/admin/users/top/likes?window=7d",
+            "admin_departments": "/admin/departments/",
+            "admin_posts": "/admin/posts/",
+            "admin_posts_deleted": "/admin/posts/deleted",
+            "admin_reports": "/admin/reports/",
+        }
+        for name, path in admin_listings.items():
+            catalogue[name] = (admin_iterations, admin_listing(name, path))
+
+        selected = scenarios or list(catalogue)
+        unknown = set(selected) - catalogue.keys()
+        if unknown:
+            raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        for scenario in selected:
+            count, make_steps = catalogue[scenario]
+            for _ in range(min(warmup, count)):
+                for _, call in make_steps():
+                    call()
+            latencies: dict[str, list[float]] = {}
+            errors: Counter[str] = Counter()
+            statements.clear()
+            started = time.perf_counter()
+            for _ in range(count):
+                for name, call in make_steps():
+                    t0 = time.perf_counter()
+                    resp = call()
+                    latencies.setdefault(name, []).append(time.perf_counter() - t0)
+                    if resp.status_code >= 400:
+                        errors[name] += 1
+            # スループットはステップ間の処理も含めたシナリオ全体の経過時間で算出します
+            elapsed = time.perf_counter() - started
+            total_statements = sum(statements.values())
+            total_requests = sum(len(v) for v in latencies.values())
+            for name, values in latencies.items():
+                # 1シナリオ内に複数ステップがある場合はSQL数を按分します
+                share = total_statements * len(values) / total_requests if total_requests else 0
+                results[name] = _summarize(values, errors[name], elapsed, share)
+
+    event.remove(engine, "before_cursor_execute", count_statement)
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "database_url": database_url,
+        "dataset": dataset,
+        "iterations": iterations,
+        "admin_iterations": admin_iterations,
+        "scenarios": results,
+    }
+
+
+def compare(report: dict, baseline: dict) -> dict:
+    """Percentage change of p50/p95/p99 against a previous report."""
+    changes = {}
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        changes[name] = {
+            key: round((current[key] - previous[key]) / previous[key] * 100, 1)
+            for key in ("p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+            if previous.get(key)
+        }
+    return changes
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the in-process API benchmarks.")
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db")
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--admin-iterations",
+        type=int,
+        default=5,
+        help="admin listings return every row, so they run fewer times",
+    )
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--scenario", action="append", dest="scenarios")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.database_url,
+        iterations=args.iterations,
+        admin_iterations=args.admin_iterations,
+        warmup=args.warmup,
+        scenarios=args.scenarios,
+        seed=args.seed,
+    )
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["change_pct"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Serialization CPU: FastAPI ``response_model`` vs ``app.responses``.
+
+Usage (from ``backend``)::
+
+    python -m bench.serialization
+    python -m bench.serialization --iterations 50
+
+Payloads are built in memory (no database), so only serialization is
+measured: 100 timeline posts (``schemas.Post``) and 10k admin user rows
+(``schemas.AdminUser``, which also exercises the ``name`` alias).
+
+* ``response_model`` - what FastAPI does with a returned list: validate it
+  against the response field, convert it to primitives and ``json.dumps``
+  it in ``JSONResponse``
+* ``list_response`` - ``responses.dump_list`` (one ``TypeAdapter.dump_json``)
+
+Both start from already constructed models, as the endpoints do. Reported
+numbers are CPU milliseconds (``time.process_time``) per response.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def _posts(schemas, n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        schemas.Post(
+            id=i,
+            content="いつもありがとうございます。" * 4,
+            created_at=now - timedelta(minutes=i),
+            mention_user_ids=[i % 97, i % 89],
+            mention_department_ids=[i % 7],
+            mention_user_names=["ﾔﾏﾀﾞ ﾀﾛｳ", "ｽｽﾞｷ ﾊﾅｺ"],
+            mention_department_names=["3B病棟"],
+            like_count=i % 13,
+            liked_by_me=i % 5 == 0,
+        )
+        for i in range(n)
+    ]
+
+
+def _admin_users(schemas, n: int) -> list:
+    return [
+        schemas.AdminUser(
+            id=i,
+            employee_id=f"{100000 + i}",
+            display_name=f"職員 {i}",
+            kana_name=f"ｼｮｸｲﾝ {i}",
+            department_name="情報ｼｽﾃﾑ",
+            is_admin=False,
+            is_active=True,
+            is_logged_in=i % 3 == 0,
+            appreciated_count=i % 50,
+            expressed_count=i % 40,
+            likes_received=i % 30,
+        )
+        for i in range(n)
+    ]
+
+
+def _cpu_ms(call, iterations: int) -> dict:
+    call()  # warm-up
+    values = []
+    for _ in range(iterations):
+        t0 = time.process_time()
+        call()
+        values.append((time.process_time() - t0) * 1000)
+    return {
+        "median_cpu_ms": round(statistics.median(values), 3),
+        "mean_cpu_ms": round(statistics.fmean(values), 3),
+    }
+
+
+def run(iterations: int = 20) -> dict:
+    os.environ.setdefault("SECRET_KEY", "bench")
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    from app import responses, schemas
+
+    loop = asyncio.new_event_loop()
+
+    def fastapi_body(model, items):
+        field = create_model_field(name="Response", type_=list[model], mode="serialization")
+
+        def call():
+            content = loop.run_until_complete(
+                serialize_response(field=field, response_content=items)
+            )
+            return JSONResponse(content).body
+
+        return call
+
+    payloads = {
+        "posts_100": (schemas.Post, _posts(schemas, 100)),
+        "admin_users_10k": (schemas.AdminUser, _admin_users(schemas, 10_000)),
+    }
+    results = {}
+    try:
+        for name, (model, items) in payloads.items():
+            fast = fastapi_body(model, items)
+            one_pass = lambda model=model, items=items: responses.dump_list(model, items)
+            # 両経路で同じ JSON になることを確認してから計測します
+            assert json.loads(fast()) == json.loads(one_pass()), name
+            before = _cpu_ms(fast, iterations)
+            after = _cpu_ms(one_pass, iterations)
+            results[name] = {
+                "rows": len(items),
+                "bytes": len(one_pass()),
+                "response_model": before,
+                "list_response": after,
+                "speedup": round(before["median_cpu_ms"] / after["median_cpu_ms"], 2)
+                if after["median_cpu_ms"]
+                else None,
+            }
+    finally:
+        loop.close()
+    return {"iterations": iterations, "payloads": results}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Measure response serialization CPU.")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args(argv)
+    print(json.dumps(run(iterations=args.iterations), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare the development server with the production launcher.
+
+Usage (from ``backend``, after ``python -m bench.datagen``)::
+
+    python -m bench.server_compare --database-url sqlite:///./bench.db --workers 4
+
+Runs the same closed-loop scenario (see ``bench.loadtest``) against
+
+* ``reload`` - ``uvicorn app.main:app --reload`` (one process plus a file
+  watcher, as the Dockerfile used to start), and
+* ``tuned`` - ``python -m app.server`` with ``WEB_CONCURRENCY`` workers on
+  uvloop/httptools,
+
+and prints throughput, error rate and per-action p50/p95/p99 side by side.
+"""
+import argparse
+import json
+import os
+import sys
+
+from . import loadtest
+
+CONFIGS = {
+    "reload": {
+        "command": [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            "{port}",
+            "--reload",
+            "--log-level",
+            "warning",
+        ],
+        "env": {},
+    },
+    "tuned": {
+        "command": [sys.executable, "-m", "app.server"],
+        "env": {"HOST": "127.0.0.1", "PORT": "{port}"},
+    },
+}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--database-url", default=os.getenv("BENCH_DATABASE_URL", "sqlite:///./bench.db")
+    )
+    parser.add_argument("--scenario", choices=sorted(loadtest.SCENARIOS), default="steady")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=4, help="WEB_CONCURRENCY for 'tuned'")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, config in CONFIGS.items():
+        env = dict(config["env"])
+        workers = 1
+        if name == "tuned":
+            env["WEB_CONCURRENCY"] = str(args.workers)
+            workers = args.workers
+        run = loadtest.run(
+            args.database_url,
+            scenario=args.scenario,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            window=args.duration,
+            server_env=env,
+            server_command=config["command"],
+        )
+        run["workers"] = workers
+        results[name] = {
+            "workers": workers,
+            "throughput_rps": run["throughput_rps"],
+            "error_rate": run["error_rate"],
+            "actions": run["actions"],
+            "server": run.get("server"),
+        }
+    reload_rps = results["reload"]["throughput_rps"]
+    if reload_rps:
+        results["speedup"] = round(results["tuned"]["throughput_rps"] / reload_rps, 2)
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
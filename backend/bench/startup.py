@@ -0,0 +1,139 @@
+"""Cold-start benchmark: import time of ``app.main`` and first-request latency.
+
+Usage (from ``backend``)::
+
+    python -m bench.startup                 # 5 fresh interpreters, JSON report
+    python -m bench.startup --runs 10 --top 15
+
+Every run starts a new interpreter, so nothing is cached in ``sys.modules``.
+Reported per run:
+
+* ``import_ms`` - ``import app.main`` (no database access happens here)
+* ``startup_ms`` - the lifespan: table creation and initial data on an empty
+  SQLite file
+* ``first_request_ms`` - the first ``GET /departments``
+* ``first_login_ms`` - the first ``POST /token`` (loads passlib/bcrypt and jose)
+
+The medians are checked against ``BUDGETS_MS``; the command exits with status
+1 when one is exceeded. ``--top`` adds the slowest modules from
+``python -X importtime``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# 目標値（ミリ秒、中央値）。開発機で約2倍の余裕を持たせています
+BUDGETS_MS = {
+    "import_ms": 800.0,
+    "first_request_ms": 100.0,
+    "first_login_ms": 1000.0,
+}
+
+_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(app.main.app)
+t2 = time.perf_counter()
+client.__enter__()
+t3 = time.perf_counter()
+resp = client.get("/departments")
+t4 = time.perf_counter()
+login = client.post("/token", data={"username": "000001", "password": "000001"})
+t5 = time.perf_counter()
+client.__exit__(None, None, None)
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "startup_ms": (t3 - t2) * 1000,
+    "first_request_ms": (t4 - t3) * 1000,
+    "first_login_ms": (t5 - t4) * 1000,
+    "status": [resp.status_code, login.status_code],
+}))
+"""
+
+
+def _env(directory: str) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'startup.db')}"
+    env.setdefault("SECRET_KEY", "bench")
+    return env
+
+
+def _probe() -> dict:
+    with tempfile.TemporaryDirectory(prefix="musatoku-startup-") as directory:
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=_env(directory),
+        ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def import_profile(top: int) -> list[dict]:
+    """Slowest modules (cumulative microseconds) from ``-X importtime``."""
+    with tempfile.TemporaryDirectory(prefix="musatoku-startup-") as directory:
+        err = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import app.main"],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=_env(directory),
+        ).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append(
+            {"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)}
+        )
+    rows.sort(key=lambda row: row["cumulative_us"], reverse=True)
+    return rows[:top]
+
+
+def run(runs: int = 5, top: int = 0) -> dict:
+    # 初回はバイトコードの生成が含まれるため捨てます
+    _probe()
+    samples = [_probe() for _ in range(runs)]
+    medians = {
+        key: round(statistics.median(sample[key] for sample in samples), 1)
+        for key in ("import_ms", "startup_ms", "first_request_ms", "first_login_ms")
+    }
+    over = {
+        key: {"median_ms": medians[key], "budget_ms": budget}
+        for key, budget in BUDGETS_MS.items()
+        if medians[key] > budget
+    }
+    report = {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "median": medians,
+        "budgets": BUDGETS_MS,
+        "over_budget": over,
+        "statuses": sorted({tuple(sample["status"]) for sample in samples}),
+    }
+    if top:
+        report["slowest_imports"] = import_profile(top)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure app import time and first-request latency.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports")
+    args = parser.parse_args(argv)
+    report = run(runs=args.runs, top=args.top)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 1 if report["over_budget"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
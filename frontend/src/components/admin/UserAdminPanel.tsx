@@ -15,6 +15,31 @@ interface AdminUser {
   likes_received: number;
 }
 
+interface ImportJob {
+  id: string;
+  status: "queued" | "running" | "succeeded" | "failed" | "cancelled";
+  rows_processed: number;
+  errors: string[];
+  result?: {
+    added: number;
+    skipped: number;
+    errors?: string[];
+  } | null;
+}
+
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// インポートはバックグラウンドジョブとして実行されるため、完了までポーリングします
+const waitForJob = async (jobId: string): Promise<ImportJob> => {
+  for (;;) {
+    const resp = await apiClient.get<ImportJob>(`/admin/jobs/${jobId}`);
+    if (resp.data.status !== "queued" && resp.data.status !== "running") {
+      return resp.data;
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+};
+
 const UserAdminPanel: React.FC = () => {
   const [users, setUsers] = useState<AdminUser[]>([]);
   const [loading, setLoading] = useState(true);
@@ -99,17 +124,23 @@ const UserAdminPanel: React.FC = () => {
     const formData = new FormData();
     formData.append("file", file);
     try {
-      const resp = await apiClient.post<{
-        added: number;
-        skipped: number;
-        errors?: string[];
-      }>("/admin/users/import", formData, {
-        headers: { "Content-Type": "multipart/form-data" },
-      });
-      let message = `Import finished\nAdded: ${resp.data.added}\nSkipped: ${resp.data.skipped}`;
-      if (resp.data.errors && resp.data.errors.length > 0) {
-        message += `\nErrors:\n- ${resp.data.errors.join("\n- ")}`;
-        setError(resp.data.errors.join(" / "));
+      const resp = await apiClient.post<ImportJob>(
+        "/admin/users/import",
+        formData,
+        {
+          headers: { "Content-Type": "multipart/form-data" },
+        },
+      );
+      const job = await waitForJob(resp.data.id);
+      if (job.status !== "succeeded" || !job.result) {
+        setError(`CSVのインポートに失敗しました。(${job.status})`);
+        return;
+      }
+      const result = job.result;
+      let message = `Import finished\nAdded: ${result.added}\nSkipped: ${result.skipped}`;
+      if (result.errors && result.errors.length > 0) {
+        message += `\nErrors:\n- ${result.errors.join("\n- ")}`;
+        setError(result.errors.join(" / "));
       } else {
         setError(null);
       }